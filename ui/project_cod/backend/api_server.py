@@ -0,0 +1,530 @@
+# backend/api_server.py
+# Headless JSON API over the diagnosis engine and the session database.
+#
+# Usage (from ui/project_cod):
+#   python -m backend.api_server [--host 127.0.0.1] [--port 8765] [--workers 4]
+#
+# Endpoints
+#   POST /consultations                 {name, age, gender, symptoms, language}
+#   GET  /consultations/<id>            current state (question, lead, ...)
+#   POST /consultations/<id>/answer     {answer}
+#   GET  /consultations/<id>/report     final report once finished
+#   GET  /history?limit=&cursor=        saved sessions, newest first
+#   GET  /history/search?q=&limit=&offset=
+#   GET  /consultations/<id>/trace      engine trace so far (backend/tracing.py)
+#   GET  /sessions/<id>                 one saved session
+#   GET  /sessions/<id>/trace           stored engine trace of a saved session
+#   GET  /health
+#   GET  /metrics                       Prometheus text; /metrics.json for JSON
+#
+# HTTP handling is thread-per-connection (stdlib ThreadingHTTPServer); the
+# retrieval/scoring work runs on a bounded engine pool. When every worker is
+# busy and the queue is full the request is answered 429 straight away; a
+# request whose job outlives API_REQUEST_TIMEOUT gets 504.
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from backend import database, metrics, tracing
+from backend.diagnosis_engine import (
+    followup_step,
+    classify_answer,
+    score_candidates,
+    build_final_report,
+    is_incompatible,
+)
+from backend.model_loader import hybrid_retrieve
+from backend.symptom_extractor import get_extractor
+from backend.translation import translate_text
+from backend.triage import detect_red_flags, urgent_report
+
+MAX_BODY = 64 * 1024
+
+
+class Saturated(Exception):
+    """Engine pool and queue are full."""
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# ---------------------------------------
+# ENGINE POOL
+# ---------------------------------------
+class EnginePool:
+    """
+    ThreadPoolExecutor with a hard cap on running + queued jobs.
+    run() raises Saturated instead of queueing without bound.
+    """
+
+    def __init__(self, workers=None, max_pending=None, timeout=None):
+        self.workers = workers or config.API_WORKERS
+        self.timeout = config.API_REQUEST_TIMEOUT if timeout is None else timeout
+        pending = config.API_MAX_PENDING if max_pending is None else max_pending
+        self._slots = threading.BoundedSemaphore(self.workers + pending)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="api-engine")
+
+    def submit(self, fn, *args, **kwargs):
+        """Future for fn(*args, **kwargs); raises Saturated when pool and queue are full."""
+        if not self._slots.acquire(blocking=False):
+            raise Saturated()
+        try:
+            fut = self._pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the job really finishes, even if the caller timed out
+        fut.add_done_callback(lambda _: self._slots.release())
+        return fut
+
+    def run(self, fn, *args, **kwargs):
+        return self.submit(fn, *args, **kwargs).result(timeout=self.timeout)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ---------------------------------------
+# SERVER-SIDE CONSULTATIONS
+# ---------------------------------------
+class Consultation:
+    """Mirror of the Streamlit session_state for one patient."""
+
+    def __init__(self, name, age, gender, text, text_en, language, trace=None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.age = age
+        self.gender = gender
+        self.text = text
+        self.text_en = text_en
+        self.language = language
+        self.symptoms = []
+        self.negatives = set()
+        self.asked = set()
+        self.rounds = 1
+        self.question = None
+        self.candidates = []
+        self.probs = {}
+        self.red_flags = []
+        self.finished = False
+        self.report = None
+        self.session_id = None
+        self.trace = trace
+        self.touched = time.monotonic()
+        self.lock = threading.Lock()
+
+    def to_json(self):
+        lead = None
+        if self.probs:
+            top = max(self.probs, key=self.probs.get)
+            lead = {"disease": top, "probability": self.probs[top]}
+        question = self.question
+        if question and self.language != "en":
+            question = translate_text(question, self.language)
+        return {
+            "id": self.id,
+            "status": "urgent" if self.red_flags else ("finished" if self.finished else "question"),
+            "round": self.rounds,
+            "question": None if self.finished else question,
+            "question_en": None if self.finished else self.question,
+            "lead": lead,
+            "symptoms": self.symptoms,
+            "negatives": sorted(self.negatives),
+            "red_flags": [f._asdict() for f in self.red_flags],
+            "session_id": self.session_id,
+        }
+
+
+class ConsultationStore:
+    """In-memory consultations with idle expiry (LRU order = last touched)."""
+
+    def __init__(self, ttl=None, max_size=None):
+        self.ttl = config.API_SESSION_TTL if ttl is None else ttl
+        self.max_size = max_size or config.API_MAX_SESSIONS
+        self._d = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, c):
+        with self._lock:
+            self._evict()
+            self._d[c.id] = c
+
+    def get(self, cid):
+        with self._lock:
+            c = self._d.get(cid)
+            if c is None:
+                raise ApiError(404, "unknown consultation")
+            c.touched = time.monotonic()
+            self._d.move_to_end(cid)
+            return c
+
+    def __len__(self):
+        return len(self._d)
+
+    def _evict(self):
+        cutoff = time.monotonic() - self.ttl
+        while self._d:
+            oldest = next(iter(self._d.values()))
+            if oldest.touched >= cutoff and len(self._d) < self.max_size:
+                break
+            self._d.popitem(last=False)
+
+
+# ---------------------------------------
+# CONSULTATION STEPS (run on the engine pool)
+# ---------------------------------------
+def _finish(c):
+    if c.red_flags:
+        c.report = urgent_report(c.red_flags, c.name, c.age, c.gender, c.symptoms)
+        c.probs = {}
+    else:
+        full_query = ", ".join(c.symptoms) + " " + (c.text_en or c.text)
+        candidates = hybrid_retrieve(full_query, k=8)
+        candidates = [d for d in candidates if not is_incompatible(d, c.age, c.gender)] or candidates
+        c.probs = score_candidates(candidates, c.symptoms, c.age, c.gender, negatives=list(c.negatives))
+        c.candidates = candidates
+        c.report = build_final_report(c.name, c.age, c.gender, c.symptoms, candidates, c.probs)
+
+    c.finished = True
+    c.question = None
+    c.session_id = database.save_session_async(
+        c.name, c.age, c.gender, c.symptoms, c.probs, c.report,
+        questions_asked=len(c.asked),
+        trace=c.trace.to_dict() if c.trace is not None else None,
+    )
+
+
+def _advance(c):
+    """Scores the current evidence, then asks the next question or finishes."""
+    if c.red_flags:
+        _finish(c)
+        return
+
+    c.candidates, c.probs, next_q = followup_step(
+        c.symptoms, c.text, c.asked, c.age, c.gender, c.negatives,
+        k=8, lang=c.language, fallback_text=c.text_en,
+    )
+    top_p = max(c.probs.values()) if c.probs else 0.0
+    done = (
+        not c.probs
+        or not next_q
+        or (top_p >= config.CONFIDENCE_THRESHOLD_STOP and c.rounds >= config.MIN_FOLLOWUP_QUESTIONS)
+        or c.rounds >= config.MAX_FOLLOWUP_QUESTIONS
+    )
+    if done:
+        _finish(c)
+    else:
+        c.question = next_q
+
+
+def start_consultation(body):
+    text = (body.get("symptoms") or "").strip()
+    if not text:
+        raise ApiError(400, "'symptoms' is required")
+    trace = tracing.new_trace()
+    with tracing.activate(trace):
+        return _start(body, text, trace)
+
+
+def _start(body, text, trace):
+    language = body.get("language") or "en"
+
+    red_flags = detect_red_flags(text)
+    text_en = text if red_flags else translate_text(text, "en")
+    if not red_flags:
+        red_flags = detect_red_flags(text_en)
+
+    c = Consultation(body.get("name") or "", body.get("age") or "", body.get("gender") or "",
+                     text, text_en, language, trace)
+    c.symptoms, ruled_out = get_extractor().extract_with_negation(text_en)
+    c.negatives = set(ruled_out)
+    c.red_flags = red_flags
+    tracing.record("start", language=language, text=text, text_en=text_en,
+                   symptoms=list(c.symptoms), negatives=sorted(c.negatives))
+    _advance(c)
+    return c
+
+
+def answer_question(c, body):
+    answer = (body.get("answer") or "").strip()
+    if not answer:
+        raise ApiError(400, "'answer' is required")
+    if c.finished:
+        raise ApiError(409, "consultation already finished")
+    if c.question is None:
+        raise ApiError(409, "no question is waiting for an answer")
+    with tracing.activate(c.trace):
+        return _answer(c, answer)
+
+
+def _answer(c, answer):
+    q = c.question
+    ans_en = translate_text(answer, "en").lower()
+    verdict = classify_answer(ans_en)
+    c.red_flags = detect_red_flags(answer, ans_en, q if verdict == "yes" else "")
+
+    current = {s.lower() for s in c.symptoms}
+    if verdict == "yes" and q.lower() not in current:
+        c.symptoms.append(q)
+        current.add(q.lower())
+    elif verdict == "no":
+        c.negatives.add(q)
+
+    also, denied = get_extractor().extract_with_negation(ans_en)
+    c.symptoms.extend(s for s in also if s != q.lower() and s not in current)
+    c.negatives.update(s for s in denied if s != q.lower() and s not in current)
+    tracing.record("answer", question=q, verdict=verdict, also=list(also), denied=list(denied))
+
+    c.asked.add(q.lower())
+    c.rounds += 1
+    _advance(c)
+    return c
+
+
+# ---------------------------------------
+# HTTP
+# ---------------------------------------
+def _cursor_out(cursor):
+    return None if cursor is None else f"{cursor[0]}|{cursor[1]}"
+
+
+def _cursor_in(raw):
+    if not raw:
+        return None
+    ts, _, sid = raw.rpartition("|")
+    if not ts:
+        raise ApiError(400, "bad cursor")
+    return ts, sid
+
+
+def _int(qs, name, default, lo=0, hi=100):
+    try:
+        v = int(qs.get(name, [default])[0])
+    except ValueError:
+        raise ApiError(400, f"'{name}' must be an integer")
+    return max(lo, min(hi, v))
+
+
+class DiagnosisAPI:
+    """Routing and handlers; one instance shared by all HTTP threads."""
+
+    def __init__(self, pool=None, store=None):
+        self.pool = pool or EnginePool()
+        self.store = store or ConsultationStore()
+        self.routes = [
+            ("POST", re.compile(r"^/consultations$"), self.create),
+            ("GET", re.compile(r"^/consultations/(\w+)$"), self.show),
+            ("POST", re.compile(r"^/consultations/(\w+)/answer$"), self.answer),
+            ("GET", re.compile(r"^/consultations/(\w+)/report$"), self.report),
+            ("GET", re.compile(r"^/consultations/(\w+)/trace$"), self.consultation_trace),
+            ("GET", re.compile(r"^/history$"), self.history),
+            ("GET", re.compile(r"^/history/search$"), self.search),
+            ("GET", re.compile(r"^/sessions/([\w-]+)$"), self.session),
+            ("GET", re.compile(r"^/sessions/([\w-]+)/trace$"), self.session_trace),
+            ("GET", re.compile(r"^/health$"), self.health),
+            ("GET", re.compile(r"^/metrics$"), self.metrics_text),
+            ("GET", re.compile(r"^/metrics\.json$"), self.metrics_json),
+        ]
+
+    def dispatch(self, method, path, qs, body):
+        allowed = False
+        for m, rx, fn in self.routes:
+            match = rx.match(path)
+            if match:
+                if m == method:
+                    return fn(qs, body, *match.groups())
+                allowed = True
+        raise ApiError(405 if allowed else 404, "method not allowed" if allowed else "not found")
+
+    # --- consultations ---
+    def create(self, qs, body):
+        c = self.pool.run(start_consultation, body)
+        self.store.add(c)
+        return 201, c.to_json()
+
+    def show(self, qs, body, cid):
+        return 200, self.store.get(cid).to_json()
+
+    def answer(self, qs, body, cid):
+        c = self.store.get(cid)
+        # One answer at a time per consultation
+        if not c.lock.acquire(timeout=self.pool.timeout):
+            raise ApiError(409, "another answer is being processed")
+        try:
+            fut = self.pool.submit(answer_question, c, body)
+        except BaseException:
+            c.lock.release()
+            raise
+        # Released when the job really finishes: after a 504 the job may still
+        # be changing the consultation, and a retry must not run alongside it
+        fut.add_done_callback(lambda _: c.lock.release())
+        fut.result(timeout=self.pool.timeout)
+        return 200, c.to_json()
+
+    def report(self, qs, body, cid):
+        c = self.store.get(cid)
+        if not c.finished:
+            raise ApiError(409, "consultation still in progress")
+        report = c.report
+        if c.language != "en":
+            report = translate_text(report, c.language)
+        return 200, {**c.to_json(), "report": report, "report_en": c.report, "probabilities": c.probs}
+
+    def consultation_trace(self, qs, body, cid):
+        c = self.store.get(cid)
+        if c.trace is None:
+            raise ApiError(404, "tracing is disabled")
+        return 200, c.trace.to_dict()
+
+    # --- history ---
+    def history(self, qs, body):
+        rows, nxt = database.get_sessions_page(_int(qs, "limit", config.HISTORY_PAGE_SIZE, 1),
+                                               _cursor_in(qs.get("cursor", [None])[0]))
+        items = [{"id": r[0], "timestamp": r[1], "name": r[2], "symptoms": r[3]} for r in rows]
+        return 200, {"items": items, "next_cursor": _cursor_out(nxt)}
+
+    def search(self, qs, body):
+        q = qs.get("q", [""])[0]
+        rows = database.search_sessions(q, _int(qs, "limit", config.HISTORY_PAGE_SIZE, 1),
+                                        _int(qs, "offset", 0, 0, 10 ** 6))
+        # snippet: HTML-escaped, matches in <mark>
+        items = [{"id": r[0], "timestamp": r[1], "name": r[2], "symptoms": r[3],
+                  "snippet": database.snippet_html(r[4])} for r in rows]
+        return 200, {"items": items}
+
+    def session(self, qs, body, sid):
+        s = database.get_session(sid)
+        if s is None:
+            raise ApiError(404, "unknown session")
+        return 200, s
+
+    def session_trace(self, qs, body, sid):
+        trace = database.get_session_trace(sid)
+        if trace is None:
+            raise ApiError(404, "no trace stored for this session")
+        return 200, trace
+
+    def health(self, qs, body):
+        return 200, {"status": "ok", "consultations": len(self.store), "workers": self.pool.workers}
+
+    # --- metrics ---
+    def metrics_text(self, qs, body):
+        metrics.set_gauge("cod_api_consultations", len(self.store))
+        return 200, metrics.prometheus_text()
+
+    def metrics_json(self, qs, body):
+        metrics.set_gauge("cod_api_consultations", len(self.store))
+        return 200, {"enabled": metrics.enabled(), "metrics": metrics.to_json()}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    api = None  # set by make_server()
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status, payload, headers=()):
+        metrics.inc("cod_api_responses_total", status=status)
+        if isinstance(payload, str):
+            # Prometheus exposition format
+            data, ctype = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            data, ctype = json.dumps(payload, default=str).encode("utf-8"), "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in headers:
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        if n > MAX_BODY:
+            raise ApiError(413, "request body too large")
+        if not n:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(n))
+        except ValueError:
+            raise ApiError(400, "body must be JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "body must be a JSON object")
+        return body
+
+    def _handle(self, method):
+        url = urlsplit(self.path)
+        try:
+            body = self._body() if method == "POST" else {}
+            status, payload = self.api.dispatch(method, url.path, parse_qs(url.query), body)
+            self._send(status, payload)
+        except ApiError as e:
+            self._send(e.status, {"error": str(e)})
+        except Saturated:
+            self._send(429, {"error": "server busy, retry later"}, [("Retry-After", "1")])
+        except FutureTimeout:
+            self._send(504, {"error": "engine timed out"})
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def log_message(self, fmt, *args):
+        if config.API_ACCESS_LOG:
+            super().log_message(fmt, *args)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # socketserver's default listen backlog of 5 makes a burst of clients
+    # wait out a SYN retransmit (~1 s) before the engine pool even sees them
+    request_queue_size = 128
+
+
+def make_server(host=None, port=None, api=None):
+    """ThreadingHTTPServer bound to host:port (port 0 picks a free one)."""
+    handler = type("Handler", (_Handler,), {"api": api or DiagnosisAPI()})
+    return _Server((host or config.API_HOST, config.API_PORT if port is None else port), handler)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Headless JSON API for the diagnosis engine")
+    ap.add_argument("--host", default=config.API_HOST)
+    ap.add_argument("--port", type=int, default=config.API_PORT)
+    ap.add_argument("--workers", type=int, default=config.API_WORKERS)
+    ap.add_argument("--max-pending", type=int, default=config.API_MAX_PENDING)
+    args = ap.parse_args(argv)
+
+    api = DiagnosisAPI(pool=EnginePool(args.workers, args.max_pending))
+    server = make_server(args.host, args.port, api)
+    print(f"Diagnosis API on http://{args.host}:{server.server_address[1]} ({args.workers} engine workers)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        api.pool.shutdown()
+        database.flush_sessions()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# backend/bench_multilingual.py
+# Recall@k and latency per language: translate-to-English retrieval vs the
+# multilingual dense path, on DxBench queries machine-translated into each
+# supported language.
+#
+# Usage (from ui/project_cod):
+#   python -m backend.bench_multilingual --n 200 --k 10 --langs hi,te,es
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from backend import model_loader
+from backend.dxbench import load_cases
+from backend.translation import Translator, BACKENDS, get_translator
+
+
+def _queries(n, disease_map):
+    """DxBench cases whose gold disease exists in the KB -> [(english query, kb disease name)]"""
+    by_lower = {d.lower(): d for d in disease_map}
+    out = []
+    for case in load_cases():
+        gold = by_lower.get(case["disease"].lower())
+        syms = [s for s, present in case["explicit"] if present]
+        if gold and syms:
+            out.append((", ".join(syms), gold))
+        if len(out) >= n:
+            break
+    return out
+
+
+def _pct(xs, p):
+    return float(np.percentile(xs, p)) * 1000 if xs else 0.0
+
+
+def run(n=200, k=10, langs=None, backend="google"):
+    state = model_loader.load_retriever()
+    queries = _queries(n, state.disease_symptom_map)
+    langs = langs or [l for l in config.SUPPORTED_LANGUAGES if l != "en"]
+
+    # Forward translation goes through the cached translator (setup, not measured);
+    # the English round-trip uses an uncached one so its network cost is counted
+    cached = get_translator()
+    live = Translator(BACKENDS[backend](), cache_path=None)
+
+    config.MULTILINGUAL_RETRIEVAL = True
+    model_loader.multilingual_state(state)  # build/load outside the timings
+
+    results = {}
+    for lang in langs:
+        localized = cached.translate_many([q for q, _ in queries], lang)
+        hits_en = hits_ml = 0
+        lat_en, lat_ml = [], []
+
+        for (q_en, gold), q_loc in zip(queries, localized):
+            t0 = time.perf_counter()
+            back = live.translate(q_loc, "en")
+            top = model_loader.hybrid_retrieve(back, k=k, state=state)
+            lat_en.append(time.perf_counter() - t0)
+            hits_en += gold in top
+
+            t0 = time.perf_counter()
+            top = model_loader.hybrid_retrieve(q_loc, k=k, state=state, lang=lang)
+            lat_ml.append(time.perf_counter() - t0)
+            hits_ml += gold in top
+
+        total = max(1, len(queries))
+        results[lang] = {
+            "queries": len(queries),
+            "translate_recall": hits_en / total,
+            "multilingual_recall": hits_ml / total,
+            "translate_p50_ms": _pct(lat_en, 50),
+            "translate_p95_ms": _pct(lat_en, 95),
+            "multilingual_p50_ms": _pct(lat_ml, 50),
+            "multilingual_p95_ms": _pct(lat_ml, 95),
+        }
+    return results
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Multilingual vs translate-to-English retrieval benchmark")
+    ap.add_argument("--n", type=int, default=200, help="number of DxBench queries")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--langs", default=None, help="comma-separated codes (default: all non-English)")
+    ap.add_argument("--backend", default="google", choices=list(BACKENDS))
+    ap.add_argument("--json", default=None, help="write results to this file")
+    args = ap.parse_args(argv)
+
+    langs = args.langs.split(",") if args.langs else None
+    res = run(args.n, args.k, langs, args.backend)
+
+    print(f"{'lang':<6}{'R@k tr->en':>12}{'R@k multi':>12}{'p50 tr ms':>12}{'p50 multi ms':>14}{'p95 tr ms':>12}{'p95 multi ms':>14}")
+    for lang, r in res.items():
+        print(f"{lang:<6}{r['translate_recall']:>12.3f}{r['multilingual_recall']:>12.3f}"
+              f"{r['translate_p50_ms']:>12.1f}{r['multilingual_p50_ms']:>14.1f}"
+              f"{r['translate_p95_ms']:>12.1f}{r['multilingual_p95_ms']:>14.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(res, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+# backend/bench_retrieval.py
+# Retrieval recall benchmark with a vectorised fusion sweep.
+#
+# The BM25 and dense score matrices (queries x KB rows) are computed once
+# for the whole query set - BM25 from a postings index, dense with one
+# batched encode() and index search - and normalised exactly as in
+# hybrid_retrieve. Every fusion config is then pure numpy on those
+# matrices:
+#   weighted  alpha * dense + (1 - alpha) * bm25   (hybrid_retrieve)
+#   rrf       1 / (c + rank_dense) + 1 / (c + rank_bm25)
+# reporting recall@k for each k, MRR and fused queries/sec.
+#
+# Usage (from ui/project_cod):
+#   python -m backend.bench_retrieval [--queries dxbench|synthetic] [--n 1000]
+#       [--alphas 0:1:0.05] [--ks 1,3,5,10] [--rrf-c 10,60] [--json out.json]
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import model_loader
+from backend.dxbench import load_cases_cached
+
+_SPLIT = re.compile(r"[;,.\n]+")
+
+
+# ---------------------------------------
+# QUERY SETS -> [(query text, gold disease)]
+# ---------------------------------------
+def dxbench_queries(n=None):
+    out = []
+    for case in load_cases_cached():
+        syms = [s for s, present in case["explicit"] if present]
+        if syms:
+            out.append((", ".join(syms), case["disease"]))
+    return out[:n] if n else out
+
+
+def synthetic_queries(disease_map, n=1000, keep=0.6, seed=0):
+    """
+    Notebook-style queries: a random subset (keep fraction) of each
+    disease's own symptom phrases, shuffled, behind a lay prefix.
+    """
+    rng = random.Random(seed)
+    diseases = list(disease_map)
+    out = []
+    for d in rng.sample(diseases, min(n, len(diseases))):
+        parts = [p.strip() for p in _SPLIT.split(disease_map[d] or "") if p.strip()]
+        if not parts:
+            continue
+        rng.shuffle(parts)
+        parts = parts[:max(1, int(len(parts) * keep))]
+        out.append(("I am experiencing " + ", ".join(parts), d))
+    return out
+
+
+# ---------------------------------------
+# SCORE MATRICES
+# ---------------------------------------
+def _normalise_rows(m):
+    mx = m.max(axis=1, keepdims=True)
+    return np.where(mx > 0, m / (mx + 1e-12), m)
+
+
+def bm25_matrix(bm25, texts):
+    """
+    Same scores as bm25.get_scores() per row, from a postings index built
+    once: each query term touches only the documents that contain it.
+    """
+    doc_len = np.asarray(bm25.doc_len, dtype=np.float64)
+    norm = bm25.k1 * (1 - bm25.b + bm25.b * doc_len / bm25.avgdl)
+
+    postings = {}
+    for doc_id, freqs in enumerate(bm25.doc_freqs):
+        for term, tf in freqs.items():
+            postings.setdefault(term, ([], []))
+            postings[term][0].append(doc_id)
+            postings[term][1].append(tf)
+
+    weights = {}
+    for term, (ids, tfs) in postings.items():
+        ids = np.asarray(ids)
+        tfs = np.asarray(tfs, dtype=np.float64)
+        weights[term] = (ids, bm25.idf.get(term, 0.0) * tfs * (bm25.k1 + 1) / (tfs + norm[ids]))
+
+    out = np.zeros((len(texts), len(doc_len)), dtype=np.float32)
+    for i, text in enumerate(texts):
+        for term in re.findall(r"\w+", text):
+            hit = weights.get(term)
+            if hit is not None:
+                out[i, hit[0]] += hit[1]
+    return _normalise_rows(out)
+
+
+def dense_matrix(index, embedder, texts, chunk=256):
+    n = index.ntotal
+    out = np.zeros((len(texts), n), dtype=np.float32)
+    for start in range(0, len(texts), chunk):
+        rows = model_loader._dense_scores_many(index, embedder, texts[start:start + chunk], n)
+        out[start:start + len(rows)] = rows
+    return out
+
+
+def _ranks(m):
+    """1-based rank of every column per row (1 = best score)."""
+    order = np.argsort(-m, axis=1, kind="stable")
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(1, m.shape[1] + 1)[None, :], axis=1)
+    return ranks
+
+
+# ---------------------------------------
+# METRICS
+# ---------------------------------------
+def gold_rank(scores, gold_cols):
+    """
+    Rank of the best-scoring gold row per query. gold_cols: (Q, G) column
+    ids, -1 padded. Non-gold rows tied with it count as ranked ahead:
+    hybrid_retrieve's argsort gives ties no order in gold's favour, so this
+    is what the engine returns at worst, never better than it.
+    """
+    rows = np.arange(scores.shape[0])[:, None]
+    valid = gold_cols >= 0
+    gs = np.where(valid, scores[rows, np.maximum(gold_cols, 0)], -np.inf)
+    g = gs.max(axis=1)
+    tied_gold = (valid & (gs == g[:, None])).sum(axis=1)
+    return (scores >= g[:, None]).sum(axis=1) - tied_gold + 1
+
+
+def metrics(ranks, ks):
+    out = {f"recall@{k}": float((ranks <= k).mean()) for k in ks}
+    out["mrr"] = float((1.0 / ranks).mean())
+    return out
+
+
+def sweep(bm, fs, gold_cols, alphas, ks, rrf_cs):
+    results = []
+    q = bm.shape[0]
+
+    for alpha in alphas:
+        t0 = time.perf_counter()
+        ranks = gold_rank(alpha * fs + (1 - alpha) * bm, gold_cols)
+        dt = time.perf_counter() - t0
+        results.append({"fusion": "weighted", "alpha": round(float(alpha), 4), **metrics(ranks, ks),
+                        "qps": q / dt if dt else float("inf")})
+
+    if rrf_cs:
+        rank_bm, rank_fs = _ranks(bm), _ranks(fs)
+        for c in rrf_cs:
+            t0 = time.perf_counter()
+            ranks = gold_rank(1.0 / (c + rank_fs) + 1.0 / (c + rank_bm), gold_cols)
+            dt = time.perf_counter() - t0
+            results.append({"fusion": "rrf", "c": c, **metrics(ranks, ks), "qps": q / dt if dt else float("inf")})
+
+    return results
+
+
+def run(queries="dxbench", n=None, alphas=None, ks=(1, 3, 5, 10), rrf_cs=(60,), state=None, seed=0):
+    state = state or model_loader.load_retriever()
+    kb_df, disease_map, bm25, _, faiss_index, embedder = state
+
+    pairs = dxbench_queries(n) if queries == "dxbench" else synthetic_queries(disease_map, n or 1000, seed=seed)
+
+    # Gold rows per query (a disease name can appear on several KB rows)
+    rows_by_name = {}
+    for i, d in enumerate(kb_df["disease"]):
+        rows_by_name.setdefault(str(d).lower(), []).append(i)
+    pairs = [(t, g) for t, g in pairs if g.lower() in rows_by_name]
+    if not pairs:
+        raise ValueError("no queries whose gold disease is in the KB")
+    width = max(len(rows_by_name[g.lower()]) for _, g in pairs)
+    gold_cols = np.full((len(pairs), width), -1)
+    for i, (_, g) in enumerate(pairs):
+        ids = rows_by_name[g.lower()]
+        gold_cols[i, :len(ids)] = ids
+
+    texts = [model_loader._query_text(t) for t, _ in pairs]
+
+    t0 = time.perf_counter()
+    bm = bm25_matrix(bm25, texts)
+    t_bm = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    fs = dense_matrix(faiss_index, embedder, texts)
+    t_fs = time.perf_counter() - t0
+
+    alphas = np.round(np.arange(0, 1.0001, 0.05), 4) if alphas is None else alphas
+    return {
+        "queries": len(pairs),
+        "query_set": queries,
+        "kb_rows": len(kb_df),
+        "bm25_qps": len(pairs) / t_bm,
+        "dense_qps": len(pairs) / t_fs,
+        "results": sweep(bm, fs, gold_cols, alphas, ks, rrf_cs),
+    }
+
+
+def _alpha_grid(spec):
+    # "0:1:0.05" -> range, "0.4,0.6" -> list
+    if ":" in spec:
+        lo, hi, step = (float(x) for x in spec.split(":"))
+        return np.round(np.arange(lo, hi + step / 2, step), 4)
+    return [float(x) for x in spec.split(",")]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Recall@k / MRR sweep over hybrid retrieval fusion settings")
+    ap.add_argument("--queries", choices=["dxbench", "synthetic"], default="dxbench")
+    ap.add_argument("--n", type=int, default=None, help="number of queries (default: all / 1000 synthetic)")
+    ap.add_argument("--alphas", default="0:1:0.05")
+    ap.add_argument("--ks", default="1,3,5,10")
+    ap.add_argument("--rrf-c", default="60", help="RRF constants, comma-separated ('' to skip)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args(argv)
+
+    ks = [int(k) for k in args.ks.split(",")]
+    rrf_cs = [int(c) for c in args.rrf_c.split(",") if c]
+    res = run(args.queries, args.n, _alpha_grid(args.alphas), ks, rrf_cs, seed=args.seed)
+
+    print(f"{res['queries']} {res['query_set']} queries over {res['kb_rows']} KB rows "
+          f"(score matrices: BM25 {res['bm25_qps']:.0f} q/s, dense {res['dense_qps']:.0f} q/s)")
+    header = f"{'fusion':<10}{'param':>8}" + "".join(f"{'R@' + str(k):>8}" for k in ks) + f"{'MRR':>8}{'q/s':>12}"
+    print(header)
+    for r in res["results"]:
+        param = r["alpha"] if r["fusion"] == "weighted" else r["c"]
+        print(f"{r['fusion']:<10}{param:>8}" + "".join(f"{r[f'recall@{k}']:>8.3f}" for k in ks)
+              + f"{r['mrr']:>8.3f}{r['qps']:>12.0f}")
+
+    best = max(res["results"], key=lambda r: (r[f"recall@{ks[-1]}"], r["mrr"]))
+    print(f"Best by recall@{ks[-1]}: {best}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(res, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+# backend/bench_scaling.py
+# Scaling benchmarks for the engine hot paths on synthetic KBs.
+#
+# Generates disease KBs of any size (1k-200k rows) with controllable text
+# length, installs them through the retriever loader with a tiny hashing
+# embedder (no model download, runs offline), and times:
+#   hybrid_retrieve, score_candidates, candidate_symptom_pool, choose_best_followup
+# with warm-up and repetitions. Latency percentiles, throughput and peak
+# Python memory (tracemalloc) go to JSON; --baseline flags regressions.
+#
+# Usage (from ui/project_cod):
+#   python -m backend.bench_scaling --sizes 1000,10000,50000 --json out.json
+#   python -m backend.bench_scaling --baseline baseline.json [--tolerance 0.25]
+
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import random
+import re
+import sys
+import time
+import tracemalloc
+import zlib
+from datetime import datetime
+from types import MappingProxyType
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_BODY = ["head", "chest", "abdominal", "back", "joint", "muscle", "throat", "ear", "eye", "skin",
+         "neck", "knee", "pelvic", "flank", "jaw", "shoulder", "wrist", "ankle", "scalp", "tongue"]
+_SIGN = ["pain", "swelling", "itching", "numbness", "stiffness", "redness", "bleeding", "weakness",
+         "tenderness", "burning", "cramps", "rash", "discharge", "spasm", "lump", "ulcer"]
+_MOD = ["", "", "", "intermittent", "sharp", "dull", "chronic", "sudden", "mild", "recurrent"]
+_GENERAL = ["fever", "fatigue", "nausea", "vomiting", "dizziness", "cough", "headache", "insomnia",
+            "weight loss", "night sweats", "chills", "palpitations", "shortness of breath",
+            "loss of appetite", "diarrhea", "constipation", "anxiety", "confusion"]
+
+
+# ---------------------------------------
+# TINY EMBEDDER
+# ---------------------------------------
+class HashingEmbedder:
+    """Hashing-trick bag of words; same encode() surface as SentenceTransformer."""
+
+    def __init__(self, dim=64):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        out = np.full((len(texts), self.dim), 1e-3, dtype=np.float32)
+        for i, t in enumerate(texts):
+            for w in re.findall(r"\w+", t.lower()):
+                out[i, zlib.crc32(w.encode()) % self.dim] += 1.0
+        return out
+
+
+# ---------------------------------------
+# SYNTHETIC KB
+# ---------------------------------------
+def symptom_vocabulary():
+    phrases = [f"{m} {b} {s}".strip() for b in _BODY for s in _SIGN for m in _MOD]
+    return sorted(set(phrases)) + _GENERAL
+
+
+def synthetic_disease_map(n, phrases_per_disease=8, seed=0):
+    """
+    n diseases, each a comma-separated list of phrases_per_disease symptoms.
+    Phrases are drawn with a Zipf-like skew so common symptoms recur across
+    many diseases, as in the real KB.
+    """
+    rng = random.Random(seed)
+    vocab = symptom_vocabulary()
+    cum = list(itertools.accumulate(1.0 / (i + 1) ** 0.8 for i in range(len(vocab))))
+    rng.shuffle(vocab)
+    out = {}
+    for i in range(n):
+        picks = []
+        while len(picks) < phrases_per_disease:
+            p = rng.choices(vocab, cum_weights=cum)[0]
+            if p not in picks:
+                picks.append(p)
+        out[f"Synthetic disease {i:06d}"] = ", ".join(picks) + "."
+    return out
+
+
+def synthetic_state(n, phrases_per_disease=8, seed=0, dim=64):
+    import faiss
+    import pandas as pd
+    from rank_bm25 import BM25Okapi
+    from backend.model_loader import RetrieverState
+
+    disease_map = synthetic_disease_map(n, phrases_per_disease, seed)
+    df = pd.DataFrame({"disease": list(disease_map), "symptom_text": list(disease_map.values())})
+    tokenized = [re.findall(r"\w+", s.lower()) for s in df["symptom_text"]]
+    embedder = HashingEmbedder(dim)
+    embs = embedder.encode(df["symptom_text"].tolist())
+    faiss.normalize_L2(embs)
+    index = faiss.IndexFlatIP(dim)
+    index.add(embs)
+    return RetrieverState(df, MappingProxyType(disease_map), BM25Okapi(tokenized), tokenized, index, embedder)
+
+
+# ---------------------------------------
+# TIMING
+# ---------------------------------------
+def measure(fn, warmup=3, repeat=20):
+    """Runs fn() warmup+repeat times; returns latency stats plus peak traced memory of one call."""
+    for _ in range(warmup):
+        fn()
+
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    xs = np.array(times) * 1000
+    return {
+        "p50_ms": float(np.percentile(xs, 50)),
+        "p95_ms": float(np.percentile(xs, 95)),
+        "mean_ms": float(xs.mean()),
+        "ops_per_sec": float(1000 / xs.mean()) if xs.mean() else float("inf"),
+        "peak_kib": peak / 1024,
+    }
+
+
+def run(sizes=(1000, 10000), phrases_per_disease=8, candidates=(6, 20), symptom_counts=(3, 10),
+        warmup=3, repeat=20, seed=0):
+    from backend.model_loader import get_loader, hybrid_retrieve
+
+    results = []
+    for n in sizes:
+        t0 = time.perf_counter()
+        state = synthetic_state(n, phrases_per_disease, seed)
+        build_s = time.perf_counter() - t0
+        get_loader().set_state(state)
+
+        # Imported after the synthetic KB is installed, so the engine never loads the real one
+        from backend.diagnosis_engine import (
+            score_candidates, candidate_symptom_pool, choose_best_followup,
+        )
+
+        rng = random.Random(seed)
+        diseases = list(state.disease_symptom_map)
+        vocab = symptom_vocabulary()
+
+        def row(name, params, fn):
+            r = {"name": name, "kb_size": n, "params": params, **measure(fn, warmup, repeat)}
+            results.append(r)
+            print(f"  {name:<22}{json.dumps(params):<34}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+                  f"{r['ops_per_sec']:>11.0f}{r['peak_kib']:>11.0f}")
+
+        print(f"KB {n} rows (built in {build_s:.1f}s)")
+        print(f"  {'path':<22}{'params':<34}{'p50 ms':>9}{'p95 ms':>9}{'ops/s':>11}{'peak KiB':>11}")
+
+        for n_sym in symptom_counts:
+            symptoms = rng.sample(vocab, n_sym)
+            query = ", ".join(symptoms)
+            for k in candidates:
+                cands = rng.sample(diseases, min(k, len(diseases)))
+                row("hybrid_retrieve", {"k": k, "symptoms": n_sym},
+                    lambda: hybrid_retrieve(query, k=k))
+                row("score_candidates", {"k": k, "symptoms": n_sym},
+                    lambda: score_candidates(cands, symptoms))
+                row("candidate_symptom_pool", {"k": k, "symptoms": n_sym},
+                    lambda: candidate_symptom_pool(cands))
+                row("choose_best_followup", {"k": k, "symptoms": n_sym},
+                    lambda: choose_best_followup(cands, symptoms, set()))
+    return results
+
+
+# ---------------------------------------
+# BASELINE
+# ---------------------------------------
+def _key(r):
+    return r["name"], r["kb_size"], json.dumps(r["params"], sort_keys=True)
+
+
+def compare(results, baseline, tolerance=0.25, min_delta_ms=0.1):
+    """
+    Rows whose p50 is more than `tolerance` slower than the baseline's.
+    Differences under min_delta_ms are timer noise on sub-millisecond paths.
+    """
+    base = {_key(r): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = base.get(_key(r))
+        if b and b["p50_ms"] > 0 and r["p50_ms"] > b["p50_ms"] * (1 + tolerance) \
+                and r["p50_ms"] - b["p50_ms"] >= min_delta_ms:
+            regressions.append({**r, "baseline_p50_ms": b["p50_ms"], "ratio": r["p50_ms"] / b["p50_ms"]})
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Engine hot-path scaling benchmarks on synthetic KBs")
+    ap.add_argument("--sizes", default="1000,10000,50000", help="KB rows, comma-separated (up to 200000)")
+    ap.add_argument("--phrases", type=int, default=8, help="symptom phrases per disease (text length)")
+    ap.add_argument("--candidates", default="6,20")
+    ap.add_argument("--symptoms", default="3,10")
+    ap.add_argument("--warmup", type=int, default=3)
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", default=None, help="write results here")
+    ap.add_argument("--baseline", default=None, help="compare p50 against this results file")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    ap.add_argument("--min-delta-ms", type=float, default=0.1, help="ignore slowdowns smaller than this")
+    args = ap.parse_args(argv)
+
+    ints = lambda s: [int(x) for x in s.split(",") if x]
+    results = run(ints(args.sizes), args.phrases, ints(args.candidates), ints(args.symptoms),
+                  args.warmup, args.repeat, args.seed)
+
+    doc = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "phrases_per_disease": args.phrases,
+            "warmup": args.warmup,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(doc, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"⚠ {len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for r in regressions:
+                print(f"  {r['name']} kb={r['kb_size']} {json.dumps(r['params'])}: "
+                      f"{r['baseline_p50_ms']:.2f} -> {r['p50_ms']:.2f} ms ({r['ratio']:.2f}x)")
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+# backend/data_export.py
+# Streaming export/import of consultation data to columnar files.
+#
+# Usage (from ui/project_cod):
+#   python -m backend.data_export export OUT_DIR [--format parquet|arrow] [--since 2025-01-01]
+#   python -m backend.data_export import IN_DIR  [--format parquet|arrow]
+#
+# Each table is written as OUT_DIR/<table>.<ext> in CHUNK_ROWS-row batches,
+# so memory use does not depend on table size.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+    _HAS_ARROW = True
+except ImportError:
+    _HAS_ARROW = False
+
+from backend import database
+
+CHUNK_ROWS = 50_000
+FORMATS = {"parquet": "parquet", "arrow": "arrow"}
+
+
+def _require_arrow():
+    if not _HAS_ARROW:
+        raise ImportError("Columnar export needs 'pyarrow' (pip install pyarrow)")
+
+
+# ---------------------------------------
+# TABLE SPECS
+# ---------------------------------------
+# name -> (select sql, [(column, arrow type)], columns that hold encoded text)
+_SESSION_ENCODED = ("diagnosis_result", "final_report", "transcript", "trace")
+
+
+def _specs():
+    ts = pa.timestamp("us")
+    return {
+        "patients": (
+            "SELECT id, name, age, gender, created_at, identity_key, external_id FROM patients",
+            [("id", pa.string()), ("name", pa.string()), ("age", pa.string()),
+             ("gender", pa.string()), ("created_at", ts), ("identity_key", pa.string()),
+             ("external_id", pa.string())],
+            (),
+        ),
+        "sessions": (
+            "SELECT id, patient_id, symptoms, diagnosis_result, final_report, transcript, "
+            "timestamp, questions_asked, trace FROM sessions",
+            [("id", pa.string()), ("patient_id", pa.string()), ("symptoms", pa.string()),
+             ("diagnosis_result", pa.string()), ("final_report", pa.string()),
+             ("transcript", pa.string()), ("timestamp", ts), ("questions_asked", pa.int32()),
+             ("trace", pa.string())],
+            _SESSION_ENCODED,
+        ),
+        "session_diagnoses": (
+            "SELECT session_id, rank, disease, probability, day FROM session_diagnoses",
+            [("session_id", pa.string()), ("rank", pa.int32()), ("disease", pa.string()),
+             ("probability", pa.float64()), ("day", pa.string())],
+            (),
+        ),
+    }
+
+
+_SINCE_FILTER = {
+    "sessions": " WHERE timestamp >= ?",
+    "session_diagnoses": " WHERE day >= ?",
+}
+
+
+def _to_batch(rows, fields, encoded):
+    cols = list(zip(*rows))
+    arrays = []
+    for i, (name, typ) in enumerate(fields):
+        vals = cols[i]
+        if name in encoded:
+            vals = [database.decode_text(v) for v in vals]
+        if pa.types.is_timestamp(typ):
+            # stored as ISO strings by sqlite3's datetime adapter
+            arrays.append(pc.cast(pa.array([None if v is None else str(v) for v in vals], pa.string()), typ))
+        else:
+            arrays.append(pa.array(vals, typ))
+    return pa.RecordBatch.from_arrays(arrays, schema=pa.schema(fields))
+
+
+class _Writer:
+    def __init__(self, path, schema, fmt):
+        self.fmt = fmt
+        if fmt == "parquet":
+            self._w = pq.ParquetWriter(path, schema, compression="zstd")
+        else:
+            self._sink = pa.OSFile(path, "wb")
+            self._w = ipc.new_file(self._sink, schema,
+                                         options=ipc.IpcWriteOptions(compression="zstd"))
+
+    def write(self, batch):
+        self._w.write_batch(batch)
+
+    def close(self):
+        self._w.close()
+        if self.fmt != "parquet":
+            self._sink.close()
+
+
+def _iter_batches(path, fmt, chunk_rows):
+    if fmt == "parquet":
+        yield from pq.ParquetFile(path).iter_batches(batch_size=chunk_rows)
+    else:
+        with pa.memory_map(path, "r") as src:
+            reader = ipc.open_file(src)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+
+
+# ---------------------------------------
+# EXPORT
+# ---------------------------------------
+def export_tables(out_dir, fmt="parquet", since=None, chunk_rows=CHUNK_ROWS):
+    """
+    Streams patients, sessions and session_diagnoses to out_dir.
+    since ('YYYY-MM-DD') limits sessions/diagnoses to that day onwards.
+    Returns {table: rows_written}.
+    """
+    _require_arrow()
+    os.makedirs(out_dir, exist_ok=True)
+    conn = database.get_connection()
+    counts = {}
+
+    for table, (sql, fields, encoded) in _specs().items():
+        params = ()
+        if since and table in _SINCE_FILTER:
+            sql += _SINCE_FILTER[table]
+            params = (since,)
+
+        path = os.path.join(out_dir, f"{table}.{FORMATS[fmt]}")
+        writer = _Writer(path, pa.schema(fields), fmt)
+        n = 0
+        try:
+            cur = conn.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                writer.write(_to_batch(rows, fields, encoded))
+                n += len(rows)
+        finally:
+            writer.close()
+        counts[table] = n
+
+    return counts
+
+
+# ---------------------------------------
+# IMPORT
+# ---------------------------------------
+def _py_rows(batch, encoded=()):
+    cols = []
+    for name in batch.schema.names:
+        arr = batch.column(name)
+        if pa.types.is_timestamp(arr.type):
+            # %S carries the microseconds for timestamp('us')
+            vals = pc.strftime(arr, format="%Y-%m-%d %H:%M:%S").to_pylist()
+        else:
+            vals = arr.to_pylist()
+        if name in encoded:
+            vals = [database.encode_text(v) for v in vals]
+        cols.append(vals)
+    return list(zip(*cols))
+
+
+def import_tables(in_dir, fmt="parquet", chunk_rows=CHUNK_ROWS):
+    """
+    Bulk-loads files written by export_tables() with executemany, one
+    transaction per chunk. Rows whose primary key already exists are skipped.
+    Imported patients that match an existing identity are folded into it.
+    Returns {table: rows_inserted}.
+    """
+    _require_arrow()
+    conn = database.get_connection()
+    ext = FORMATS[fmt]
+    counts = {}
+
+    # Patients first, remembering ids that collapse into an existing identity
+    remap = {}
+    path = os.path.join(in_dir, f"patients.{ext}")
+    inserted = 0
+    for batch in _iter_batches(path, fmt, chunk_rows):
+        rows = _py_rows(batch)
+        with database.transaction(conn) as c:
+            cur = c.executemany("""INSERT OR IGNORE INTO patients
+                                   (id, name, age, gender, created_at, identity_key, external_id)
+                                   VALUES (?, ?, ?, ?, ?, ?, ?)""", rows)
+            inserted += cur.rowcount
+            keyed = [(r[0], r[5]) for r in rows if r[5] is not None]
+            for pid, key in keyed:
+                row = c.execute("SELECT id FROM patients WHERE identity_key = ?", (key,)).fetchone()
+                if row and row[0] != pid:
+                    remap[pid] = row[0]
+    counts["patients"] = inserted
+
+    # Sessions (re-encoded on the way in, indexed from the plain text). Columns
+    # come from the file, so exports made before the trace column still load.
+    path = os.path.join(in_dir, f"sessions.{ext}")
+    known = {name for name, _ in _specs()["sessions"][1]}
+    inserted = 0
+    for batch in _iter_batches(path, fmt, chunk_rows):
+        unknown = set(batch.schema.names) - known
+        if unknown:
+            raise ValueError(f"{path}: unexpected session columns {sorted(unknown)}")
+        rows = _py_rows(batch, _SESSION_ENCODED)
+        if remap:
+            rows = [(r[0], remap.get(r[1], r[1])) + r[2:] for r in rows]
+        names = batch.schema.names
+        with database.transaction(conn) as c:
+            cur = c.executemany(f"""INSERT OR IGNORE INTO sessions ({", ".join(names)})
+                                    VALUES ({", ".join("?" * len(names))})""", rows)
+            # rowcount, unlike total_changes, ignores rows written by FTS/rollup triggers
+            inserted += cur.rowcount
+            plain = {n: batch.column(n).to_pylist() if n in names else [None] * batch.num_rows
+                     for n in ("final_report", "transcript")}
+            database.index_sessions(c, [(r[0], rpt, tr) for r, rpt, tr
+                                        in zip(rows, plain["final_report"], plain["transcript"])])
+    counts["sessions"] = inserted
+
+    # Diagnoses (rollup triggers fire per row)
+    path = os.path.join(in_dir, f"session_diagnoses.{ext}")
+    inserted = 0
+    for batch in _iter_batches(path, fmt, chunk_rows):
+        rows = _py_rows(batch)
+        with database.transaction(conn) as c:
+            # Skip diagnoses whose session is not in the DB (FK would reject them)
+            cur = c.executemany("""INSERT OR IGNORE INTO session_diagnoses
+                                   (session_id, rank, disease, probability, day)
+                                   SELECT ?, ?, ?, ?, ?
+                                   WHERE EXISTS (SELECT 1 FROM sessions WHERE id = ?1)""", rows)
+            inserted += cur.rowcount
+    counts["session_diagnoses"] = inserted
+
+    return counts
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Columnar export/import of consultation data")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    e = sub.add_parser("export")
+    e.add_argument("out_dir")
+    e.add_argument("--format", choices=list(FORMATS), default="parquet")
+    e.add_argument("--since", default=None, help="YYYY-MM-DD")
+
+    i = sub.add_parser("import")
+    i.add_argument("in_dir")
+    i.add_argument("--format", choices=list(FORMATS), default="parquet")
+
+    args = ap.parse_args(argv)
+    t0 = time.perf_counter()
+    if args.cmd == "export":
+        counts = export_tables(args.out_dir, args.format, args.since)
+    else:
+        counts = import_tables(args.in_dir, args.format)
+    dt = time.perf_counter() - t0
+
+    for table, n in counts.items():
+        print(f"{args.cmd} {table}: {n} rows")
+    print(f"Done in {dt:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
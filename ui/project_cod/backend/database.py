@@ -1,7 +1,17 @@
+import os
+import re
 import sqlite3
 import json
+import gzip
+import html
 import uuid
-from datetime import datetime
+import zlib
+import threading
+import queue
+import time
+import atexit
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 try:
     import config
 except ImportError:
@@ -10,10 +20,141 @@ except ImportError:
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     import config
 
-def init_db():
-    conn = sqlite3.connect(config.DATABASE_PATH)
-    c = conn.cursor()
-    
+from backend import metrics
+
+try:
+    import zstandard
+    _HAS_ZSTD = True
+except ImportError:
+    _HAS_ZSTD = False
+
+# ---------------------------------------
+# COLUMN CODEC
+# ---------------------------------------
+# final_report, transcript and diagnosis_result are stored as BLOBs with a
+# 2-byte codec tag when compression pays off; short values and rows written
+# before compression existed stay plain TEXT. decode_text() accepts both.
+
+_TAG_ZLIB = b"Z1"
+_TAG_ZSTD = b"S1"
+
+# python-zstandard (de)compressors are not thread-safe: one pair per thread
+_zstd_local = threading.local()
+
+
+def _zstd():
+    pair = getattr(_zstd_local, "pair", None)
+    if pair is None:
+        pair = _zstd_local.pair = (zstandard.ZstdCompressor(level=10), zstandard.ZstdDecompressor())
+    return pair
+
+
+def encode_text(value):
+    if value is None or not isinstance(value, str):
+        return value
+    raw = value.encode("utf-8")
+    if len(raw) < config.COMPRESSION_MIN_BYTES:
+        return value
+    if _HAS_ZSTD:
+        packed = _TAG_ZSTD + _zstd()[0].compress(raw)
+    else:
+        packed = _TAG_ZLIB + zlib.compress(raw, 6)
+    return packed if len(packed) < len(raw) else value
+
+
+def decode_text(value):
+    if not isinstance(value, (bytes, memoryview)):
+        return value
+    value = bytes(value)
+    tag, body = value[:2], value[2:]
+    if tag == _TAG_ZLIB:
+        return zlib.decompress(body).decode("utf-8")
+    if tag == _TAG_ZSTD:
+        if not _HAS_ZSTD:
+            raise RuntimeError("Row is zstd-compressed but the 'zstandard' package is not installed")
+        return _zstd()[1].decompress(body).decode("utf-8")
+    return value.decode("utf-8")
+
+
+# ---------------------------------------
+# CONNECTION MANAGER
+# ---------------------------------------
+# One connection per thread (sqlite3 connections must not be shared across
+# threads). Each connection runs in WAL mode so history readers never block
+# session writers. Schema setup runs once per database file per process.
+
+PRAGMAS = (
+    "PRAGMA auto_vacuum=INCREMENTAL",  # only effective on new files or after compact()
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",   # safe with WAL, avoids an fsync per commit
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",    # ~16 MB page cache
+)
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+def _open(path):
+    # isolation_level=None: we issue BEGIN/COMMIT ourselves (see transaction())
+    conn = sqlite3.connect(
+        path,
+        isolation_level=None,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=True,
+    )
+    for p in PRAGMAS:
+        conn.execute(p)
+    # Lets SQL read compressed columns (ad-hoc queries, the v5 migration);
+    # since v9 no trigger or view depends on it
+    conn.create_function("cod_text", 1, decode_text, deterministic=True)
+    return conn
+
+
+def get_connection():
+    """Returns this thread's connection to config.DATABASE_PATH, opening it on first use."""
+    path = config.DATABASE_PATH
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = _open(path)
+        _ensure_schema(conn, path)
+    return conn
+
+
+def close_connection():
+    """Closes the calling thread's connections (e.g. at worker shutdown)."""
+    conns = getattr(_local, "conns", None) or {}
+    for conn in conns.values():
+        conn.close()
+    conns.clear()
+
+
+@contextmanager
+def transaction(conn=None):
+    """BEGIN IMMEDIATE ... COMMIT, rolled back on error."""
+    conn = conn or get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
+
+
+# ---------------------------------------
+# SCHEMA / MIGRATIONS
+# ---------------------------------------
+def _migrate_v1(c):
     # Patients table (optional if we want to reuse patients)
     c.execute('''CREATE TABLE IF NOT EXISTS patients (
                     id TEXT PRIMARY KEY,
@@ -34,62 +175,935 @@ def init_db():
                     timestamp TIMESTAMP,
                     FOREIGN KEY(patient_id) REFERENCES patients(id)
                 )''')
-    
-    conn.commit()
-    conn.close()
-
-def save_session(name, age, gender, symptoms, diagnosis_json, report, transcript=""):
-    init_db()
-    conn = sqlite3.connect(config.DATABASE_PATH)
-    c = conn.cursor()
-
-    # Check if patient exists (simple fuzzy check or just create new for now to avoid complexity)
-    # Ideally we'd match on name+age, but let's just create a new entry for every session 
-    # unless we want to implement a lookup. Given the requirements, let's keep it simple.
-    
-    patient_id = str(uuid.uuid4())
-    c.execute("INSERT INTO patients (id, name, age, gender, created_at) VALUES (?, ?, ?, ?, ?)",
-              (patient_id, name, age, gender, datetime.now()))
-
-    session_id = str(uuid.uuid4())
+
+
+def _migrate_v2(c):
+    # Keyset pagination for the history view: newest first, id as tie-breaker
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_timestamp ON sessions(timestamp DESC, id DESC)")
+
+
+def _migrate_v3(c):
+    # Full-text search over past consultations. External-content FTS5 table
+    # reading from a view, so report text is not stored twice.
+    c.execute('''CREATE VIEW IF NOT EXISTS sessions_search_source AS
+                    SELECT s.rowid AS session_rowid,
+                           p.name AS name,
+                           s.symptoms AS symptoms,
+                           s.final_report AS final_report,
+                           s.transcript AS transcript
+                    FROM sessions s
+                    LEFT JOIN patients p ON s.patient_id = p.id''')
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS sessions_fts USING fts5(
+                    name, symptoms, final_report, transcript,
+                    content='sessions_search_source',
+                    content_rowid='session_rowid',
+                    tokenize='porter unicode61'
+                )''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS sessions_fts_ai AFTER INSERT ON sessions BEGIN
+                    INSERT INTO sessions_fts(rowid, name, symptoms, final_report, transcript)
+                    VALUES (new.rowid,
+                            (SELECT name FROM patients WHERE id = new.patient_id),
+                            new.symptoms, new.final_report, new.transcript);
+                END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS sessions_fts_ad AFTER DELETE ON sessions BEGIN
+                    INSERT INTO sessions_fts(sessions_fts, rowid, name, symptoms, final_report, transcript)
+                    VALUES ('delete', old.rowid,
+                            (SELECT name FROM patients WHERE id = old.patient_id),
+                            old.symptoms, old.final_report, old.transcript);
+                END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS sessions_fts_au AFTER UPDATE ON sessions BEGIN
+                    INSERT INTO sessions_fts(sessions_fts, rowid, name, symptoms, final_report, transcript)
+                    VALUES ('delete', old.rowid,
+                            (SELECT name FROM patients WHERE id = old.patient_id),
+                            old.symptoms, old.final_report, old.transcript);
+                    INSERT INTO sessions_fts(rowid, name, symptoms, final_report, transcript)
+                    VALUES (new.rowid,
+                            (SELECT name FROM patients WHERE id = new.patient_id),
+                            new.symptoms, new.final_report, new.transcript);
+                END''')
+    # Index sessions stored before this migration
+    c.execute("INSERT INTO sessions_fts(sessions_fts) VALUES ('rebuild')")
+
+
+def _migrate_v4(c):
+    # Patient identity: one row per (normalised name, age, gender) or external id
+    cols = {r[1] for r in c.execute("PRAGMA table_info(patients)")}
+    if "identity_key" not in cols:
+        c.execute("ALTER TABLE patients ADD COLUMN identity_key TEXT")
+    if "external_id" not in cols:
+        c.execute("ALTER TABLE patients ADD COLUMN external_id TEXT")
+
+    # Merge the duplicates created by the old one-patient-per-session writes:
+    # the earliest row per key survives and inherits every session
+    canonical = {}
+    rows = c.execute("SELECT id, name, age, gender, external_id FROM patients ORDER BY created_at, id").fetchall()
+    for pid, name, age, gender, ext in rows:
+        key = patient_identity_key(name, age, gender, ext)
+        if key is None:
+            continue
+        keep = canonical.setdefault(key, pid)
+        if keep == pid:
+            c.execute("UPDATE patients SET identity_key = ? WHERE id = ?", (key, pid))
+        else:
+            c.execute("UPDATE sessions SET patient_id = ? WHERE patient_id = ?", (keep, pid))
+            c.execute("DELETE FROM patients WHERE id = ?", (pid,))
+
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_patients_identity ON patients(identity_key) WHERE identity_key IS NOT NULL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_patient ON sessions(patient_id, timestamp DESC, id DESC)")
+
+
+def _migrate_v5(c):
+    # Compressed columns: FTS must index the decoded text, so the search view
+    # and triggers go through cod_text() (registered on every connection)
+    for trg in ("sessions_fts_ai", "sessions_fts_ad", "sessions_fts_au"):
+        c.execute(f"DROP TRIGGER IF EXISTS {trg}")
+    c.execute("DROP VIEW IF EXISTS sessions_search_source")
+    c.execute('''CREATE VIEW sessions_search_source AS
+                    SELECT s.rowid AS session_rowid,
+                           p.name AS name,
+                           s.symptoms AS symptoms,
+                           cod_text(s.final_report) AS final_report,
+                           cod_text(s.transcript) AS transcript
+                    FROM sessions s
+                    LEFT JOIN patients p ON s.patient_id = p.id''')
+    c.execute('''CREATE TRIGGER sessions_fts_ai AFTER INSERT ON sessions BEGIN
+                    INSERT INTO sessions_fts(rowid, name, symptoms, final_report, transcript)
+                    VALUES (new.rowid,
+                            (SELECT name FROM patients WHERE id = new.patient_id),
+                            new.symptoms, cod_text(new.final_report), cod_text(new.transcript));
+                END''')
+    c.execute('''CREATE TRIGGER sessions_fts_ad AFTER DELETE ON sessions BEGIN
+                    INSERT INTO sessions_fts(sessions_fts, rowid, name, symptoms, final_report, transcript)
+                    VALUES ('delete', old.rowid,
+                            (SELECT name FROM patients WHERE id = old.patient_id),
+                            old.symptoms, cod_text(old.final_report), cod_text(old.transcript));
+                END''')
+    # Only re-index when searchable text changes (compression rewrites bytes, not text)
+    c.execute('''CREATE TRIGGER sessions_fts_au AFTER UPDATE ON sessions
+                WHEN old.patient_id IS NOT new.patient_id
+                  OR old.symptoms IS NOT new.symptoms
+                  OR cod_text(old.final_report) IS NOT cod_text(new.final_report)
+                  OR cod_text(old.transcript) IS NOT cod_text(new.transcript)
+                BEGIN
+                    INSERT INTO sessions_fts(sessions_fts, rowid, name, symptoms, final_report, transcript)
+                    VALUES ('delete', old.rowid,
+                            (SELECT name FROM patients WHERE id = old.patient_id),
+                            old.symptoms, cod_text(old.final_report), cod_text(old.transcript));
+                    INSERT INTO sessions_fts(rowid, name, symptoms, final_report, transcript)
+                    VALUES (new.rowid,
+                            (SELECT name FROM patients WHERE id = new.patient_id),
+                            new.symptoms, cod_text(new.final_report), cod_text(new.transcript));
+                END''')
+
+    # Compress rows written before this migration
+    rows = c.execute("SELECT rowid, diagnosis_result, final_report, transcript FROM sessions").fetchall()
+    c.executemany(
+        "UPDATE sessions SET diagnosis_result = ?, final_report = ?, transcript = ? WHERE rowid = ?",
+        [(encode_text(d), encode_text(r), encode_text(t), rid) for rid, d, r, t in rows],
+    )
+
+
+def _migrate_v6(c):
+    # Normalised diagnoses + per-day rollups, so dashboards never parse JSON
+    cols = {r[1] for r in c.execute("PRAGMA table_info(sessions)")}
+    if "questions_asked" not in cols:
+        c.execute("ALTER TABLE sessions ADD COLUMN questions_asked INTEGER")
+
+    c.execute('''CREATE TABLE IF NOT EXISTS session_diagnoses (
+                    session_id TEXT NOT NULL,
+                    rank INTEGER NOT NULL,       -- 1 = top diagnosis
+                    disease TEXT NOT NULL,
+                    probability REAL,
+                    day TEXT NOT NULL,           -- YYYY-MM-DD of the session, denormalised for rollups
+                    PRIMARY KEY (session_id, rank),
+                    FOREIGN KEY(session_id) REFERENCES sessions(id) ON DELETE CASCADE
+                )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sdiag_disease ON session_diagnoses(disease, day)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sdiag_day_rank ON session_diagnoses(day, rank)")
+
+    c.execute('''CREATE TABLE IF NOT EXISTS diagnosis_daily (
+                    day TEXT NOT NULL,
+                    disease TEXT NOT NULL,
+                    top1_count INTEGER NOT NULL DEFAULT 0,
+                    mention_count INTEGER NOT NULL DEFAULT 0,
+                    top1_prob_sum REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, disease)
+                )''')
+
+    # Rollups follow session_diagnoses (including cascaded deletes/archiving)
+    c.execute('''CREATE TRIGGER IF NOT EXISTS session_diagnoses_ai AFTER INSERT ON session_diagnoses BEGIN
+                    INSERT INTO diagnosis_daily (day, disease, top1_count, mention_count, top1_prob_sum)
+                    VALUES (new.day, new.disease,
+                            new.rank = 1, 1,
+                            CASE WHEN new.rank = 1 THEN new.probability ELSE 0 END)
+                    ON CONFLICT(day, disease) DO UPDATE SET
+                        top1_count = top1_count + excluded.top1_count,
+                        mention_count = mention_count + 1,
+                        top1_prob_sum = top1_prob_sum + excluded.top1_prob_sum;
+                END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS session_diagnoses_ad AFTER DELETE ON session_diagnoses BEGIN
+                    UPDATE diagnosis_daily SET
+                        top1_count = top1_count - (old.rank = 1),
+                        mention_count = mention_count - 1,
+                        top1_prob_sum = top1_prob_sum - CASE WHEN old.rank = 1 THEN old.probability ELSE 0 END
+                    WHERE day = old.day AND disease = old.disease;
+                    DELETE FROM diagnosis_daily
+                    WHERE day = old.day AND disease = old.disease AND mention_count <= 0;
+                END''')
+
+    # Backfill from the JSON blobs already stored
+    rows = c.execute("SELECT id, timestamp, diagnosis_result FROM sessions").fetchall()
+    for sid, ts, diag in rows:
+        try:
+            probs = json.loads(decode_text(diag) or "{}")
+        except (ValueError, TypeError):
+            continue
+        if isinstance(probs, dict):
+            c.executemany(_INSERT_DIAGNOSIS, _diagnosis_rows(sid, str(ts)[:10], probs))
+
+
+def _migrate_v7(c):
+    # Per-consultation engine trace (backend/tracing.py): compact JSON through encode_text()
+    cols = {r[1] for r in c.execute("PRAGMA table_info(sessions)")}
+    if "trace" not in cols:
+        c.execute("ALTER TABLE sessions ADD COLUMN trace BLOB")
+
+
+def _migrate_v8(c):
+    # The rollups are history: archiving (a cascaded delete) must not shrink
+    # them. Only delete_session() takes a session back out, explicitly.
+    c.execute("DROP TRIGGER IF EXISTS session_diagnoses_ad")
+
+
+def _migrate_v9(c):
+    # Search without a Python UDF in the schema: the v5 triggers called
+    # cod_text(), so any connection without it (sqlite3 CLI, backup tools)
+    # failed on every write to sessions. sessions_fts now stores its own
+    # plain text; index_sessions() fills it from the Python write path and
+    # the remaining triggers are plain SQL.
+    for trg in ("sessions_fts_ai", "sessions_fts_ad", "sessions_fts_au"):
+        c.execute(f"DROP TRIGGER IF EXISTS {trg}")
+    c.execute("DROP TABLE IF EXISTS sessions_fts")
+    c.execute("DROP VIEW IF EXISTS sessions_search_source")
+    c.execute('''CREATE VIRTUAL TABLE sessions_fts USING fts5(
+                    name, symptoms, final_report, transcript,
+                    tokenize='porter unicode61'
+                )''')
+    c.execute('''CREATE TRIGGER sessions_fts_ad AFTER DELETE ON sessions BEGIN
+                    DELETE FROM sessions_fts WHERE rowid = old.rowid;
+                END''')
+    c.execute('''CREATE TRIGGER sessions_fts_au AFTER UPDATE OF patient_id, symptoms ON sessions BEGIN
+                    UPDATE sessions_fts
+                    SET name = (SELECT name FROM patients WHERE id = new.patient_id),
+                        symptoms = new.symptoms
+                    WHERE rowid = new.rowid;
+                END''')
+
+    rows = c.execute("SELECT id, final_report, transcript FROM sessions").fetchall()
+    index_sessions(c, [(sid, decode_text(r), decode_text(t)) for sid, r, t in rows])
+
+
+def _migrate_v10(c):
+    # Every dashboard analytic reads a rollup, so all of them count the same
+    # sessions: everything ever saved, archived or not (see archive_sessions).
+    # Top-1 confidence is kept in 1/100 buckets, re-binned at query time.
+    c.execute('''CREATE TABLE IF NOT EXISTS confidence_daily (
+                    day TEXT NOT NULL,
+                    disease TEXT NOT NULL,
+                    bucket INTEGER NOT NULL,     -- floor(top-1 probability * 100), 0..99
+                    sessions INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, disease, bucket)
+                )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS question_daily (
+                    day TEXT NOT NULL,
+                    questions INTEGER NOT NULL,
+                    sessions INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, questions)
+                )''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS session_diagnoses_conf_ai AFTER INSERT ON session_diagnoses
+                WHEN new.rank = 1 BEGIN
+                    INSERT INTO confidence_daily (day, disease, bucket, sessions)
+                    VALUES (new.day, new.disease, MIN(MAX(CAST(new.probability * 100 AS INTEGER), 0), 99), 1)
+                    ON CONFLICT(day, disease, bucket) DO UPDATE SET sessions = sessions + 1;
+                END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS sessions_questions_ai AFTER INSERT ON sessions
+                WHEN new.questions_asked IS NOT NULL BEGIN
+                    INSERT INTO question_daily (day, questions, sessions)
+                    VALUES (substr(new.timestamp, 1, 10), new.questions_asked, 1)
+                    ON CONFLICT(day, questions) DO UPDATE SET sessions = sessions + 1;
+                END''')
+
+    # Backfill from the sessions still in the live DB
+    c.execute('''INSERT INTO confidence_daily (day, disease, bucket, sessions)
+                 SELECT day, disease, MIN(MAX(CAST(probability * 100 AS INTEGER), 0), 99) AS b, COUNT(*)
+                 FROM session_diagnoses WHERE rank = 1
+                 GROUP BY day, disease, b''')
+    c.execute('''INSERT INTO question_daily (day, questions, sessions)
+                 SELECT substr(timestamp, 1, 10) AS d, questions_asked, COUNT(*)
+                 FROM sessions WHERE questions_asked IS NOT NULL
+                 GROUP BY d, questions_asked''')
+
+
+# (version, fn(conn)) — append only, never edit an applied migration
+MIGRATIONS = [
+    (1, _migrate_v1),
+    (2, _migrate_v2),
+    (3, _migrate_v3),
+    (4, _migrate_v4),
+    (5, _migrate_v5),
+    (6, _migrate_v6),
+    (7, _migrate_v7),
+    (8, _migrate_v8),
+    (9, _migrate_v9),
+    (10, _migrate_v10),
+]
+
+
+def _ensure_schema(conn, path):
+    if path in _schema_ready:
+        return
+    with _schema_lock:
+        if path in _schema_ready:
+            return
+        conn.execute('''CREATE TABLE IF NOT EXISTS schema_migrations (
+                            version INTEGER PRIMARY KEY,
+                            applied_at TIMESTAMP
+                        )''')
+        for version, migrate in MIGRATIONS:
+            # Checked inside the write lock so concurrent processes apply each step once
+            with transaction(conn):
+                done = conn.execute(
+                    "SELECT 1 FROM schema_migrations WHERE version = ?", (version,)
+                ).fetchone()
+                if done:
+                    continue
+                migrate(conn)
+                conn.execute(
+                    "INSERT INTO schema_migrations (version, applied_at) VALUES (?, ?)",
+                    (version, datetime.now()),
+                )
+        _schema_ready.add(path)
+
+
+def init_db():
+    """Opens the connection and applies pending migrations (idempotent, cheap after the first call)."""
+    get_connection()
+
+
+def schema_version():
+    row = get_connection().execute("SELECT MAX(version) FROM schema_migrations").fetchone()
+    return row[0] or 0
+
+
+# ---------------------------------------
+# PATIENTS
+# ---------------------------------------
+def patient_identity_key(name, age, gender, external_id=None):
+    """
+    Dedup key for a patient: the external id when we have one, otherwise
+    normalised name + age + gender. Anonymous patients (no name, no id)
+    get None and are never merged.
+    """
+    if external_id:
+        return f"ext:{str(external_id).strip()}"
+    norm = " ".join(re.findall(r"\w+", (name or "").lower()))
+    if not norm:
+        return None
+    age_s = str(age).strip() if age not in (None, "") else ""
+    gender_s = (gender or "").strip().lower()[:1]
+    return f"{norm}|{age_s}|{gender_s}"
+
+def _upsert_patient(c, name, age, gender, external_id, created_at):
+    """Returns the id of the matching patient, inserting it if new (index seek, no scan)."""
+    key = patient_identity_key(name, age, gender, external_id)
+    if key is not None:
+        row = c.execute("SELECT id FROM patients WHERE identity_key = ?", (key,)).fetchone()
+        if row:
+            return row[0]
+
+    pid = str(uuid.uuid4())
+    c.execute("""INSERT INTO patients (id, name, age, gender, created_at, identity_key, external_id)
+                 VALUES (?, ?, ?, ?, ?, ?, ?)""",
+              (pid, name, age, gender, created_at, key, external_id))
+    return pid
+
+@metrics.timed("cod_db_seconds", op="find_patient")
+def find_patient(name, age, gender, external_id=None):
+    key = patient_identity_key(name, age, gender, external_id)
+    if key is None:
+        return None
+    row = get_connection().execute("SELECT id FROM patients WHERE identity_key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+@metrics.timed("cod_db_seconds", op="patient_sessions")
+def get_patient_sessions(patient_id, limit=20, cursor=None):
+    """
+    A patient's sessions, newest first, served from idx_sessions_patient.
+    Same (rows, next_cursor) contract as get_sessions_page().
+    """
+    conn = get_connection()
+    if cursor is None:
+        c = conn.execute("""
+            SELECT id, timestamp, symptoms
+            FROM sessions
+            WHERE patient_id = ?
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        """, (patient_id, limit + 1))
+    else:
+        c = conn.execute("""
+            SELECT id, timestamp, symptoms
+            FROM sessions
+            WHERE patient_id = ? AND (timestamp, id) < (?, ?)
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        """, (patient_id, cursor[0], cursor[1], limit + 1))
+    rows = c.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1][1], rows[-1][0])
+    return rows, next_cursor
+
+
+# ---------------------------------------
+# SESSIONS
+# ---------------------------------------
+_INSERT_DIAGNOSIS = "INSERT INTO session_diagnoses (session_id, rank, disease, probability, day) VALUES (?, ?, ?, ?, ?)"
+
+def _diagnosis_rows(session_id, day, probs):
+    ranked = []
+    for d, p in probs.items():
+        try:
+            ranked.append((str(d), float(p)))
+        except (TypeError, ValueError):
+            continue
+    ranked.sort(key=lambda x: x[1], reverse=True)
+    return [(session_id, i + 1, d, p, day) for i, (d, p) in enumerate(ranked)]
+
+def _build_session_record(name, age, gender, symptoms, diagnosis_json, report, transcript="",
+                          external_id=None, questions_asked=None, trace=None):
     # diagnosis_json needs to be string
     if isinstance(diagnosis_json, dict):
         diag_str = json.dumps(diagnosis_json)
+        probs = diagnosis_json
     else:
         diag_str = str(diagnosis_json)
-        
+        probs = {}
+
     # symptoms list to string
     if isinstance(symptoms, list):
         sym_str = ", ".join(symptoms)
     else:
         sym_str = str(symptoms)
 
-    c.execute("INSERT INTO sessions (id, patient_id, symptoms, diagnosis_result, final_report, transcript, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)",
-              (session_id, patient_id, sym_str, diag_str, report, transcript, datetime.now()))
+    # Ids and timestamp are fixed here, not at write time, so queued
+    # sessions keep their consultation time and callers get the id at once
+    return {
+        "session_id": str(uuid.uuid4()),
+        "external_id": external_id,
+        "name": name,
+        "age": age,
+        "gender": gender,
+        "symptoms": sym_str,
+        "diagnosis_result": diag_str,
+        "final_report": report,
+        "transcript": transcript,
+        "probabilities": probs,
+        "questions_asked": questions_asked,
+        "trace": json.dumps(trace, separators=(",", ":"), default=str) if trace else None,
+        "timestamp": datetime.now(),
+    }
+
+def index_sessions(c, rows):
+    """
+    Adds sessions to the search index. rows: (session_id, final_report,
+    transcript) as plain text, for sessions already inserted in this
+    transaction; sessions that are already indexed are left alone.
+    """
+    c.executemany("""INSERT INTO sessions_fts(rowid, name, symptoms, final_report, transcript)
+                     SELECT s.rowid, p.name, s.symptoms, ?, ?
+                     FROM sessions s
+                     LEFT JOIN patients p ON s.patient_id = p.id
+                     WHERE s.id = ? AND NOT EXISTS (SELECT 1 FROM sessions_fts WHERE rowid = s.rowid)""",
+                  [(report, transcript, sid) for sid, report, transcript in rows])
+
+@metrics.timed("cod_db_seconds", op="write")
+def _write_sessions(records, conn=None):
+    """Inserts a batch of session records in one transaction."""
+    with transaction(conn) as c:
+        # Patient resolved at write time so queued sessions of one patient share a row
+        for r in records:
+            r["patient_id"] = _upsert_patient(c, r["name"], r["age"], r["gender"],
+                                              r["external_id"], r["timestamp"])
+        c.executemany("INSERT INTO sessions (id, patient_id, symptoms, diagnosis_result, final_report, transcript, timestamp, questions_asked, trace) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                      [(r["session_id"], r["patient_id"], r["symptoms"], encode_text(r["diagnosis_result"]),
+                        encode_text(r["final_report"]), encode_text(r["transcript"]), r["timestamp"],
+                        r["questions_asked"], encode_text(r.get("trace"))) for r in records])
+        index_sessions(c, [(r["session_id"], r["final_report"], r["transcript"]) for r in records])
+        # Analytics rows (rollups are maintained by triggers)
+        c.executemany(_INSERT_DIAGNOSIS, [
+            row for r in records
+            for row in _diagnosis_rows(r["session_id"], r["timestamp"].strftime("%Y-%m-%d"), r["probabilities"])
+        ])
 
-    conn.commit()
-    conn.close()
-    return session_id
+def save_session(name, age, gender, symptoms, diagnosis_json, report, transcript="",
+                 external_id=None, questions_asked=None, trace=None):
+    """Synchronous save; returns once the session is committed. trace: ConsultationTrace.to_dict()"""
+    record = _build_session_record(name, age, gender, symptoms, diagnosis_json, report, transcript,
+                                   external_id, questions_asked, trace)
+    _write_sessions([record])
+    return record["session_id"]
+
+def save_session_async(name, age, gender, symptoms, diagnosis_json, report, transcript="",
+                       external_id=None, questions_asked=None, trace=None):
+    """
+    Write-behind save: queues the session and returns its id immediately.
+    The row becomes visible once the background writer commits its batch.
+    """
+    record = _build_session_record(name, age, gender, symptoms, diagnosis_json, report, transcript,
+                                   external_id, questions_asked, trace)
+    get_session_writer().submit(record)
+    return record["session_id"]
+
+@metrics.timed("cod_db_seconds", op="sessions_page")
+def get_sessions_page(limit=20, cursor=None):
+    """
+    One page of history, newest first, without report bodies.
+    cursor is the (timestamp, id) of the last row of the previous page.
+    Returns (rows, next_cursor); rows are (id, timestamp, name, symptoms),
+    next_cursor is None on the last page.
+    """
+    conn = get_connection()
+    if cursor is None:
+        c = conn.execute("""
+            SELECT s.id, s.timestamp, p.name, s.symptoms
+            FROM sessions s
+            JOIN patients p ON s.patient_id = p.id
+            ORDER BY s.timestamp DESC, s.id DESC
+            LIMIT ?
+        """, (limit + 1,))
+    else:
+        c = conn.execute("""
+            SELECT s.id, s.timestamp, p.name, s.symptoms
+            FROM sessions s
+            JOIN patients p ON s.patient_id = p.id
+            WHERE (s.timestamp, s.id) < (?, ?)
+            ORDER BY s.timestamp DESC, s.id DESC
+            LIMIT ?
+        """, (cursor[0], cursor[1], limit + 1))
+    rows = c.fetchall()
+
+    # Fetch one extra row to know whether another page exists
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1][1], rows[-1][0])
+    return rows, next_cursor
+
+@metrics.timed("cod_db_seconds", op="session_report")
+def get_session_report(session_id):
+    """Full final_report for one session (loaded on demand by the history view)."""
+    row = get_connection().execute(
+        "SELECT final_report FROM sessions WHERE id = ?", (session_id,)
+    ).fetchone()
+    return decode_text(row[0]) if row else None
+
+def _load_trace(value):
+    raw = decode_text(value)
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
+
+@metrics.timed("cod_db_seconds", op="session_trace")
+def get_session_trace(session_id):
+    """Stored engine trace of one session as a dict (see backend/tracing.py), or None."""
+    row = get_connection().execute(
+        "SELECT trace FROM sessions WHERE id = ?", (session_id,)
+    ).fetchone()
+    return _load_trace(row[0]) if row else None
+
+@metrics.timed("cod_db_seconds", op="get_session")
+def get_session(session_id):
+    """Full decoded session as a dict, or None."""
+    row = get_connection().execute("""
+        SELECT s.id, s.timestamp, s.patient_id, p.name, p.age, p.gender,
+               s.symptoms, s.diagnosis_result, s.final_report, s.transcript, s.trace
+        FROM sessions s
+        LEFT JOIN patients p ON s.patient_id = p.id
+        WHERE s.id = ?
+    """, (session_id,)).fetchone()
+    if row is None:
+        return None
+    sid, ts, pid, name, age, gender, syms, diag, rpt, tr, trace = row
+    return {
+        "id": sid, "timestamp": ts, "patient_id": pid,
+        "name": name, "age": age, "gender": gender,
+        "symptoms": syms,
+        "diagnosis_result": decode_text(diag),
+        "final_report": decode_text(rpt),
+        "transcript": decode_text(tr),
+        "trace": _load_trace(trace),
+    }
+
+def _fts_query(text):
+    # Free text -> FTS5 query: every word quoted (no syntax errors on
+    # punctuation), implicit AND, last word as a prefix so typing narrows live
+    words = re.findall(r"\w+", (text or "").lower())
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+# Match delimiters in search snippets. Control characters, not markup: the
+# snippet is patient-entered text and must be escaped before it is shown.
+SNIPPET_START, SNIPPET_END = "\x02", "\x03"
+
+
+def snippet_html(snippet):
+    """Search snippet -> HTML-escaped text with <mark> around the matches."""
+    text = html.escape(snippet or "")
+    return text.replace(SNIPPET_START, "<mark>").replace(SNIPPET_END, "</mark>")
+
+@metrics.timed("cod_db_seconds", op="search")
+def search_sessions(query, limit=20, offset=0):
+    """
+    Full-text search over patient name, symptoms, report and transcript.
+    Returns rows (id, timestamp, name, symptoms, snippet), best match first.
+    Matches in the snippet are wrapped in SNIPPET_START / SNIPPET_END; use
+    snippet_html() to render it.
+    """
+    match = _fts_query(query)
+    if match is None:
+        return []
+    c = get_connection().execute("""
+        SELECT s.id, s.timestamp, p.name, s.symptoms,
+               snippet(sessions_fts, -1, ?, ?, '…', 12)
+        FROM sessions_fts
+        JOIN sessions s ON s.rowid = sessions_fts.rowid
+        LEFT JOIN patients p ON s.patient_id = p.id
+        WHERE sessions_fts MATCH ?
+        ORDER BY sessions_fts.rank
+        LIMIT ? OFFSET ?
+    """, (SNIPPET_START, SNIPPET_END, match, limit, offset))
+    return c.fetchall()
 
 def get_sessions_summary():
-    init_db()
-    conn = sqlite3.connect(config.DATABASE_PATH)
-    c = conn.cursor()
-    c.execute("""
-        SELECT s.id, s.timestamp, p.name, s.symptoms, s.final_report 
-        FROM sessions s 
-        JOIN patients p ON s.patient_id = p.id 
+    # Legacy: loads every session including report bodies. Prefer get_sessions_page().
+    c = get_connection().execute("""
+        SELECT s.id, s.timestamp, p.name, s.symptoms, s.final_report
+        FROM sessions s
+        JOIN patients p ON s.patient_id = p.id
         ORDER BY s.timestamp DESC
     """)
-    rows = c.fetchall()
-    conn.close()
-    return rows
+    return [(sid, ts, name, syms, decode_text(rpt)) for sid, ts, name, syms, rpt in c.fetchall()]
 
+@metrics.timed("cod_db_seconds", op="delete")
 def delete_session(session_id):
-    init_db()
-    conn = sqlite3.connect(config.DATABASE_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
-    conn.commit()
-    conn.close()
+    """Removes a session and takes it back out of the daily rollups."""
+    with transaction() as c:
+        rows = c.execute(
+            "SELECT rank, probability, day, disease FROM session_diagnoses WHERE session_id = ?", (session_id,)
+        ).fetchall()
+        c.executemany('''UPDATE diagnosis_daily SET
+                             top1_count = top1_count - (? = 1),
+                             mention_count = mention_count - 1,
+                             top1_prob_sum = top1_prob_sum - ?
+                         WHERE day = ? AND disease = ?''',
+                      [(rank, (prob or 0.0) if rank == 1 else 0.0, day, disease)
+                       for rank, prob, day, disease in rows])
+        c.execute("DELETE FROM diagnosis_daily WHERE mention_count <= 0")
+        c.executemany('''UPDATE confidence_daily SET sessions = sessions - 1
+                         WHERE day = ? AND disease = ? AND bucket = MIN(MAX(CAST(? * 100 AS INTEGER), 0), 99)''',
+                      [(day, disease, prob) for rank, prob, day, disease in rows if rank == 1])
+        c.execute("DELETE FROM confidence_daily WHERE sessions <= 0")
+        c.execute('''UPDATE question_daily SET sessions = sessions - 1
+                     WHERE (day, questions) IN (SELECT substr(timestamp, 1, 10), questions_asked
+                                                FROM sessions WHERE id = ?)''', (session_id,))
+        c.execute("DELETE FROM question_daily WHERE sessions <= 0")
+        c.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+
+# ---------------------------------------
+# ANALYTICS
+# ---------------------------------------
+# Days are 'YYYY-MM-DD' strings; start is inclusive, end exclusive.
+# All of these read the daily rollups, so they cover the same population:
+# every session saved, including those archive_sessions() has moved out.
+
+@metrics.timed("cod_db_seconds", op="top_diagnoses")
+def top_diagnoses(start_day, end_day, limit=10):
+    """[(disease, times_top1, mean_top1_confidence)] from the daily rollup."""
+    c = get_connection().execute("""
+        SELECT disease, SUM(top1_count) AS n, SUM(top1_prob_sum) / SUM(top1_count)
+        FROM diagnosis_daily
+        WHERE day >= ? AND day < ? AND top1_count > 0
+        GROUP BY disease
+        ORDER BY n DESC
+        LIMIT ?
+    """, (start_day, end_day, limit))
+    return c.fetchall()
+
+@metrics.timed("cod_db_seconds", op="diagnosis_trend")
+def diagnosis_trend(disease, start_day, end_day):
+    """[(day, times_top1, times_in_differential)] for one disease."""
+    c = get_connection().execute("""
+        SELECT day, top1_count, mention_count
+        FROM diagnosis_daily
+        WHERE disease = ? AND day >= ? AND day < ?
+        ORDER BY day
+    """, (disease, start_day, end_day))
+    return c.fetchall()
+
+@metrics.timed("cod_db_seconds", op="confidence_distribution")
+def confidence_distribution(start_day, end_day, disease=None, bins=10):
+    """Histogram of top-1 confidence: [(bin_lower_edge, count)]. bins must divide 100."""
+    if bins <= 0 or 100 % bins:
+        raise ValueError(f"bins must divide 100, got {bins}")
+    sql = """
+        SELECT bucket / ? AS b, SUM(sessions)
+        FROM confidence_daily
+        WHERE day >= ? AND day < ?
+    """
+    params = [100 // bins, start_day, end_day]
+    if disease is not None:
+        sql += " AND disease = ?"
+        params.append(disease)
+    sql += " GROUP BY b ORDER BY b"
+    return [(b / bins, n) for b, n in get_connection().execute(sql, params).fetchall()]
+
+@metrics.timed("cod_db_seconds", op="question_count_stats")
+def question_count_stats(start_day, end_day):
+    """Follow-up questions per consultation: {'histogram': [(questions, sessions)], 'mean': float}."""
+    rows = get_connection().execute("""
+        SELECT questions, SUM(sessions)
+        FROM question_daily
+        WHERE day >= ? AND day < ?
+        GROUP BY questions
+        ORDER BY questions
+    """, (start_day, end_day)).fetchall()
+    total = sum(n for _, n in rows)
+    mean = sum(q * n for q, n in rows) / total if total else 0.0
+    return {"histogram": rows, "mean": mean}
+
+
+# ---------------------------------------
+# RETENTION / COMPACTION
+# ---------------------------------------
+@metrics.timed("cod_db_seconds", op="archive")
+def archive_sessions(older_than_days=None, archive_dir=None, chunk_size=500):
+    """
+    Moves sessions older than the retention window into a gzip'd JSONL cold
+    file, then deletes them from the live DB; the daily rollups keep them.
+    Works in chunks so memory stays flat; each chunk is written and fsync'd
+    before its rows are deleted.
+    Returns (archive_path or None, number of sessions archived).
+    """
+    days = config.SESSION_RETENTION_DAYS if older_than_days is None else older_than_days
+    archive_dir = archive_dir or config.ARCHIVE_DIR
+    cutoff = datetime.now() - timedelta(days=days)
+    conn = get_connection()
+
+    path = None
+    total = 0
+    out = None
+    try:
+        while True:
+            rows = conn.execute("""
+                SELECT s.rowid, s.id, s.timestamp, s.patient_id, p.name, p.age, p.gender,
+                       s.symptoms, s.diagnosis_result, s.final_report, s.transcript, s.trace
+                FROM sessions s
+                LEFT JOIN patients p ON s.patient_id = p.id
+                WHERE s.timestamp < ?
+                ORDER BY s.timestamp
+                LIMIT ?
+            """, (cutoff, chunk_size)).fetchall()
+            if not rows:
+                break
+
+            if out is None:
+                os.makedirs(archive_dir, exist_ok=True)
+                path = os.path.join(archive_dir, f"sessions-{datetime.now():%Y%m%d-%H%M%S}.jsonl.gz")
+                out = gzip.open(path, "at", encoding="utf-8")
+
+            for rid, sid, ts, pid, name, age, gender, syms, diag, rpt, tr, trace in rows:
+                out.write(json.dumps({
+                    "id": sid, "timestamp": str(ts), "patient_id": pid,
+                    "name": name, "age": age, "gender": gender,
+                    "symptoms": syms,
+                    "diagnosis_result": decode_text(diag),
+                    "final_report": decode_text(rpt),
+                    "transcript": decode_text(tr),
+                    "trace": _load_trace(trace),
+                }) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+
+            with transaction(conn) as c:
+                c.executemany("DELETE FROM sessions WHERE rowid = ?", [(r[0],) for r in rows])
+            total += len(rows)
+    finally:
+        if out is not None:
+            out.close()
+
+    return path, total
+
+
+@metrics.timed("cod_db_seconds", op="compact")
+def compact(max_pages=None):
+    """
+    Returns free pages to the filesystem. The first call on a database created
+    before incremental auto-vacuum runs one full VACUUM to switch modes; after
+    that it is an incremental_vacuum of at most max_pages (all if None).
+    Returns the number of pages freed.
+    """
+    conn = get_connection()
+    before = conn.execute("PRAGMA page_count").fetchone()[0]
+
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+    elif max_pages is None:
+        conn.execute("PRAGMA incremental_vacuum")
+    else:
+        conn.execute(f"PRAGMA incremental_vacuum({int(max_pages)})")
+
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return before - conn.execute("PRAGMA page_count").fetchone()[0]
+
+
+# ---------------------------------------
+# WRITE-BEHIND SESSION QUEUE
+# ---------------------------------------
+class SessionWriter:
+    """
+    Background thread that drains queued session records and commits them
+    in batches (one transaction per batch).
+
+    - bounded queue: submit() blocks up to put_timeout, then falls back to
+      a synchronous write so a session is never dropped
+    - 'database is locked' / busy errors are retried with backoff
+    - flush() waits for everything queued so far; close() flushes and stops
+    """
+
+    def __init__(self, max_queue=1000, max_batch=100, linger=0.05,
+                 put_timeout=1.0, retries=5, backoff=0.1):
+        self.max_batch = max_batch
+        self.linger = linger
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.failed = []          # records that could not be written after all retries
+        self.last_error = None
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, record):
+        if self._closed:
+            _write_sessions([record])
+            return
+        try:
+            self._queue.put(record, timeout=self.put_timeout)
+        except queue.Full:
+            # Backpressure: the writer is behind, pay the write inline instead
+            _write_sessions([record])
+        metrics.set_gauge("cod_session_writer_queue", self._queue.qsize())
+
+    def flush(self):
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    self._queue.task_done()
+                    return
+
+                batch = [item]
+                stop = False
+                deadline = time.monotonic() + self.linger
+                while len(batch) < self.max_batch:
+                    try:
+                        nxt = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if nxt is _STOP:
+                        stop = True
+                        break
+                    batch.append(nxt)
+
+                self._commit(batch)
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+                if stop:
+                    return
+        finally:
+            close_connection()
+
+    def _commit(self, batch):
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                _write_sessions(batch)
+                metrics.inc("cod_session_writes_total", len(batch))
+                metrics.set_gauge("cod_session_writer_queue", self._queue.qsize())
+                return
+            except sqlite3.OperationalError as e:
+                msg = str(e).lower()
+                if ("locked" not in msg and "busy" not in msg) or attempt == self.retries:
+                    self._fail(batch, e)
+                    return
+                time.sleep(delay)
+                delay *= 2
+            except Exception as e:
+                self._fail(batch, e)
+                return
+
+    def _fail(self, batch, err):
+        self.last_error = err
+        self.failed.extend(batch)
+        print(f"⚠ Session writer failed to persist {len(batch)} session(s):", err)
+
+
+_STOP = object()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_session_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = SessionWriter()
+                atexit.register(shutdown_session_writer)
+    return _writer
+
+
+def flush_sessions():
+    """Blocks until every queued session has been committed."""
+    if _writer is not None:
+        _writer.flush()
+
 
+def shutdown_session_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
@@ -0,0 +1,42 @@
+# backend/db_maintenance.py
+# Usage (from ui/project_cod):
+#   python -m backend.db_maintenance archive --days 365
+#   python -m backend.db_maintenance compact --pages 2000
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from backend import database
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Patient DB retention and compaction")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    a = sub.add_parser("archive", help="move old sessions to compressed cold files")
+    a.add_argument("--days", type=int, default=config.SESSION_RETENTION_DAYS)
+    a.add_argument("--dir", default=config.ARCHIVE_DIR)
+
+    c = sub.add_parser("compact", help="incremental VACUUM + WAL checkpoint")
+    c.add_argument("--pages", type=int, default=None, help="max pages to free (default: all)")
+
+    args = ap.parse_args(argv)
+    size_before = os.path.getsize(config.DATABASE_PATH) if os.path.exists(config.DATABASE_PATH) else 0
+
+    if args.cmd == "archive":
+        path, n = database.archive_sessions(args.days, args.dir)
+        print(f"Archived {n} session(s)" + (f" -> {path}" if path else ""))
+    else:
+        freed = database.compact(args.pages)
+        print(f"Freed {freed} page(s)")
+
+    size_after = os.path.getsize(config.DATABASE_PATH)
+    print(f"DB size: {size_before / 1e6:.2f} MB -> {size_after / 1e6:.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
+import os
 import re
 import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 try:
     import config
@@ -8,12 +11,24 @@ except ImportError:
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     import config
 
-from backend.model_loader import hybrid_retrieve, ensure_disease_map
+from backend import metrics, tracing
+from backend.model_loader import hybrid_retrieve, ensure_disease_map, get_loader
+from backend.symptom_extractor import get_extractor
+from backend.triage import detect_red_flags, urgent_result
 
 # Load disease map
 disease_symptom_map = ensure_disease_map()
 
 
+def _on_retriever_swap(state):
+    # Keep the module-level map in step with RetrieverLoader.reload()
+    global disease_symptom_map
+    disease_symptom_map = state.disease_symptom_map
+
+
+get_loader().add_listener(_on_retriever_swap)
+
+
 # ============================================================
 # AGE / GENDER FILTER
 # ============================================================
@@ -58,8 +73,10 @@ def is_incompatible(disease_name, age, gender):
 # ============================================================
 # SCORING ENGINE
 # ============================================================
-def score_candidates(candidates, symptoms, age=None, gender=None, negatives=None):
-
+@metrics.timed("cod_stage_seconds", stage="scoring")
+def score_candidates(candidates, symptoms, age=None, gender=None, negatives=None, rank_bonus=True):
+    # rank_bonus: candidates is a retrieval ranking, earlier entries get a
+    # small boost. Pass False for an unordered list (e.g. a benchmark's options).
     scores = {}
     for i, d in enumerate(candidates):
 
@@ -83,7 +100,7 @@ def score_candidates(candidates, symptoms, age=None, gender=None, negatives=None
             1
             + config.SCORE_WEIGHT_EXACT * exact
             + config.SCORE_WEIGHT_PARTIAL * partial
-            + config.SCORE_WEIGHT_RANK_DECAY * (len(candidates) - i)
+            + (config.SCORE_WEIGHT_RANK_DECAY * (len(candidates) - i) if rank_bonus else 0)
         )
 
         s_txt = " ".join(symptoms).lower()
@@ -165,6 +182,7 @@ def candidate_symptom_pool(candidates, max_per=6, max_total=20):
 # ============================================================
 # BEST FOLLOW-UP QUESTION (INFO GAIN)
 # ============================================================
+@metrics.timed("cod_stage_seconds", stage="followup")
 def choose_best_followup(candidates, symptoms, asked, min_questions=3):
 
     base = score_candidates(candidates, symptoms)
@@ -175,28 +193,39 @@ def choose_best_followup(candidates, symptoms, asked, min_questions=3):
 
     best = None
     best_delta = 0
+    trace = tracing.current()
+    gains = [] if trace is not None else None
 
     for p in pool:
         new = score_candidates(candidates, symptoms + [p])
         H1 = -sum(q * math.log(q + 1e-9) for q in new.values())
         d = H0 - H1
+        if gains is not None:
+            gains.append((p, d))
 
         if d > best_delta:
             best_delta = d
             best = p
 
-    if best is None and len(asked) < min_questions and pool:
-        return pool[0]
+    fallback = best is None and len(asked) < min_questions and bool(pool)
+    if fallback:
+        best = pool[0]
 
+    if trace is not None:
+        trace.event("question", question=best, gain=round(best_delta, 4), entropy=round(H0, 4),
+                    pool=len(pool), fallback=fallback,
+                    alternatives=tracing.top_items([g for g in gains if g[0] != best], 3))
     return best
 
 
 # ============================================================
 # DIAGNOSTIC REASONING REPORT (CLEANED + EXPANDED)
 # ============================================================
+@metrics.timed("cod_stage_seconds", stage="report")
 def build_final_report(name, age, gender, symptoms, candidates, probs):
 
     ranked = sorted(probs.items(), key=lambda x: x[1], reverse=True)
+    tracing.record("report", candidates=list(candidates), top=tracing.top_items(ranked))
     if not ranked:
         return "Not enough data to generate a report."
         
@@ -245,8 +274,8 @@ def build_final_report(name, age, gender, symptoms, candidates, probs):
         "Evidence for **{d}** is weak, primarily limited to {symptoms}."
     ]
 
-    import random
-
+    # Template picked by rank, not at random, so a replayed consultation
+    # reproduces the stored report byte for byte (backend/replay.py)
     for i, (d, p) in enumerate(ranked[:5]):
         kb = (disease_symptom_map.get(d, "") or "").lower()
         matching_symptoms = [s for s in symptoms if s.lower() in kb]
@@ -302,17 +331,115 @@ def build_final_report(name, age, gender, symptoms, candidates, probs):
     return "\n".join(report)
 
 
+# ============================================================
+# INTERACTIVE FOLLOW-UP STEP (+ SPECULATION)
+# ============================================================
+def score_step(symptoms, initial_text, age=None, gender=None, negatives=None,
+               k=8, lang="en", fallback_text=None):
+    """
+    Retrieval + scoring for one turn of the interactive loop.
+    Query is the confirmed symptoms followed by the patient's own description.
+    """
+    prefix = ", ".join(symptoms) + " "
+    fallback = (lambda: prefix + fallback_text) if fallback_text else None
+    candidates = hybrid_retrieve(prefix + (initial_text or ""), k=k, lang=lang, bm25_fallback=fallback)
+    probs = score_candidates(candidates, symptoms, age, gender, negatives=list(negatives or []))
+    tracing.record("ranking", symptoms=list(symptoms), negatives=sorted(negatives or []),
+                   top=tracing.top_items(probs))
+    return candidates, probs
+
+
+def followup_step(symptoms, initial_text, asked, age=None, gender=None, negatives=None,
+                  k=8, lang="en", fallback_text=None, min_questions=None):
+    """score_step + the next question. Returns (candidates, probs, next_question)."""
+    if min_questions is None:
+        min_questions = config.MIN_FOLLOWUP_QUESTIONS
+    candidates, probs = score_step(symptoms, initial_text, age, gender, negatives, k, lang, fallback_text)
+    next_q = choose_best_followup(candidates, symptoms, asked, min_questions=min_questions) if probs else None
+    return candidates, probs, next_q
+
+
+_YES_WORDS = ["yes", "yeah", "have", "sure", "correct", "yep", "positive"]
+_NO_WORDS = ["no", "nah", "don't", "not", "negative"]
+
+
+def classify_answer(answer_en):
+    """
+    "yes" / "no" / None for a free-text answer (English) to a follow-up question.
+    An explicit no wins over yes words ("No I don't have it").
+    """
+    a = (answer_en or "").lower()
+    is_yes = any(w in a for w in _YES_WORDS)
+    is_no = any(w in a for w in _NO_WORDS)
+    if is_no:
+        return "no"
+    return "yes" if is_yes else None
+
+
+_spec_pool = None
+_spec_lock = threading.Lock()
+
+
+def _speculation_pool():
+    global _spec_pool
+    if _spec_pool is None:
+        with _spec_lock:
+            if _spec_pool is None:
+                _spec_pool = ThreadPoolExecutor(max_workers=config.SPECULATION_WORKERS,
+                                                thread_name_prefix="speculate")
+    return _spec_pool
+
+
+def speculate_followups(question, symptoms, initial_text, asked, age=None, gender=None,
+                        negatives=None, **kw):
+    """
+    While the patient reads `question`, precompute the next turn for both a
+    "yes" (question becomes a symptom) and a "no" (question becomes a
+    negative) answer on background workers.
+
+    Returns {"yes": (symptoms, negatives, asked, future), "no": (...)}; each
+    future resolves to followup_step(...) for that branch. Callers use the
+    branch whose inputs match what was actually answered and cancel the other.
+    """
+    asked_next = set(asked) | {question.lower()}
+    negatives = set(negatives or [])
+    branches = {
+        "yes": (list(symptoms) + [question], negatives, asked_next),
+        "no": (list(symptoms), negatives | {question}, asked_next),
+    }
+    pool = _speculation_pool()
+    traced = tracing.current() is not None
+    out = {}
+    for name, (syms, negs, asked_b) in branches.items():
+        # Each branch records into its own trace; the caller merges the one it uses
+        branch_trace = tracing.ConsultationTrace() if traced else None
+        fut = pool.submit(tracing.run_traced, branch_trace, followup_step,
+                          syms, initial_text, asked_b, age, gender, negs, **kw)
+        fut.trace = branch_trace
+        out[name] = (syms, negs, asked_b, fut)
+    return out
+
+
 # ============================================================
 # PIPELINE TESTER
 # ============================================================
 def predict_from_text(text, name="N/A", age=None, gender=None, k=6):
 
+    stated, negatives = get_extractor().extract_with_negation(text)
+
+    # Emergencies are answered before any embedding or ranking
+    flags = detect_red_flags(text)
+    if flags:
+        return urgent_result(flags, name, age, gender, stated)
+
     init = hybrid_retrieve(text, k=k)
     filtered = [d for d in init if not is_incompatible(d, age, gender)] or init
 
+    # Symptoms the patient actually named come first, then KB seeds
+    # (never one the patient denied)
     seed = candidate_symptom_pool(filtered)[:3]
-    asked = set()
-    current = seed.copy()
+    asked = {n.lower() for n in negatives}
+    current = stated + [s for s in seed if s.lower() not in stated and s.lower() not in negatives]
 
     max_q = config.MAX_FOLLOWUP_QUESTIONS
     min_q = config.MIN_FOLLOWUP_QUESTIONS
@@ -323,7 +450,7 @@ def predict_from_text(text, name="N/A", age=None, gender=None, k=6):
 
         # Check confidence for early stopping (only after min questions)
         if i >= min_q:
-            temp_probs = score_candidates(cand, current, age, gender)
+            temp_probs = score_candidates(cand, current, age, gender, negatives=negatives)
             top_p = max(temp_probs.values()) if temp_probs else 0.0
             if top_p >= config.CONFIDENCE_THRESHOLD_STOP:
                 break
@@ -338,12 +465,14 @@ def predict_from_text(text, name="N/A", age=None, gender=None, k=6):
     final = hybrid_retrieve(", ".join(current), k=k)
     final = [d for d in final if not is_incompatible(d, age, gender)] or final
 
-    probs = score_candidates(final, current, age, gender)
+    probs = score_candidates(final, current, age, gender, negatives=negatives)
     report = build_final_report(name, age, gender, current, final, probs)
 
     return {
         "symptoms": current,
         "candidates": final,
         "probabilities": probs,
-        "report": report
+        "report": report,
+        "urgent": False,
+        "red_flags": [],
     }
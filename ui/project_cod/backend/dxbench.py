@@ -0,0 +1,142 @@
+# backend/dxbench.py
+# Loader for Dataset/Test dataset/dxbench.csv.
+#
+# The symptom columns are numpy reprs, e.g.
+#   "[array(['Dizziness', 'True'], dtype=object)\n array(['Headache', 'True'], dtype=object)]"
+# and candidate_diseases is "['A' 'B'\n 'C']". We parse them with plain
+# regexes instead of eval().
+
+import csv
+import os
+import re
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    _HAS_ARROW = True
+except ImportError:
+    _HAS_ARROW = False
+
+try:
+    import config
+except ImportError:
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import config
+
+DXBENCH_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(config.BASE_DIR)), "Dataset", "Test dataset", "dxbench.csv"
+)
+DXBENCH_CACHE_PATH = os.path.join(config.BACKEND_DIR, "eval_cache", "dxbench.parquet")
+
+_ARRAY = re.compile(r"array\(\[(.*?)\],\s*dtype=object\)", re.S)
+_QUOTED = re.compile(r"'((?:[^'\\]|\\.)*)'|\"((?:[^\"\\]|\\.)*)\"", re.S)
+
+
+def _strings(txt):
+    return [(a if a or not b else b).replace("\\'", "'").replace('\\"', '"').strip()
+            for a, b in _QUOTED.findall(txt or "")]
+
+
+def parse_symptom_array(txt):
+    """numpy repr -> [(symptom, present_bool)]"""
+    out = []
+    for m in _ARRAY.finditer(txt or ""):
+        parts = _strings(m.group(1))
+        if not parts:
+            continue
+        present = parts[-1] != "False" if len(parts) > 1 else True
+        out.append((parts[0], present))
+    return out
+
+
+def parse_candidates(txt):
+    return _strings(txt)
+
+
+def load_cases(path=DXBENCH_PATH):
+    """
+    Returns a list of dicts:
+    {id, disease, department, candidates, explicit: [(symptom, present)], implicit: [...]}
+    """
+    cases = []
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            cases.append({
+                "id": row["id"],
+                "disease": row["disease"],
+                "department": row["department"],
+                "candidates": parse_candidates(row["candidate_diseases"]),
+                "explicit": parse_symptom_array(row["explicit_symptoms"]),
+                "implicit": parse_symptom_array(row["implicit_symptoms"]),
+            })
+    return cases
+
+
+# ---------------------------------------
+# COLUMNAR CACHE
+# ---------------------------------------
+# The regex parse is the slow part; the parsed cases are kept as Parquet
+# (symptom lists as parallel name/present list columns) and reused until
+# the CSV changes.
+def _schema():
+    strs = pa.list_(pa.string())
+    flags = pa.list_(pa.bool_())
+    return pa.schema([
+        ("id", pa.string()), ("disease", pa.string()), ("department", pa.string()),
+        ("candidates", strs),
+        ("explicit_symptoms", strs), ("explicit_present", flags),
+        ("implicit_symptoms", strs), ("implicit_present", flags),
+        ("source_mtime_ns", pa.int64()),
+    ])
+
+
+def _write_cache(cases, cache_path, mtime_ns):
+    cols = {
+        "id": [c["id"] for c in cases],
+        "disease": [c["disease"] for c in cases],
+        "department": [c["department"] for c in cases],
+        "candidates": [c["candidates"] for c in cases],
+        "source_mtime_ns": [mtime_ns] * len(cases),
+    }
+    for part in ("explicit", "implicit"):
+        cols[f"{part}_symptoms"] = [[s for s, _ in c[part]] for c in cases]
+        cols[f"{part}_present"] = [[p for _, p in c[part]] for c in cases]
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp = cache_path + ".tmp"
+    pq.write_table(pa.table(cols, schema=_schema()), tmp, compression="zstd")
+    os.replace(tmp, cache_path)
+
+
+def _read_cache(cache_path, mtime_ns):
+    if not os.path.exists(cache_path):
+        return None
+    table = pq.read_table(cache_path)
+    stamps = table.column("source_mtime_ns")
+    if len(stamps) == 0 or stamps[0].as_py() != mtime_ns:
+        return None
+    cols = table.to_pydict()
+    return [
+        {
+            "id": cols["id"][i],
+            "disease": cols["disease"][i],
+            "department": cols["department"][i],
+            "candidates": cols["candidates"][i],
+            "explicit": list(zip(cols["explicit_symptoms"][i], cols["explicit_present"][i])),
+            "implicit": list(zip(cols["implicit_symptoms"][i], cols["implicit_present"][i])),
+        }
+        for i in range(table.num_rows)
+    ]
+
+
+def load_cases_cached(path=DXBENCH_PATH, cache_path=DXBENCH_CACHE_PATH):
+    """load_cases() through the Parquet cache (plain parse without pyarrow)."""
+    if not _HAS_ARROW:
+        return load_cases(path)
+    mtime_ns = os.stat(path).st_mtime_ns
+    cases = _read_cache(cache_path, mtime_ns)
+    if cases is None:
+        cases = load_cases(path)
+        _write_cache(cases, cache_path, mtime_ns)
+    return cases
@@ -0,0 +1,227 @@
+# backend/eval_dxbench.py
+# End-to-end DxBench evaluation of the interactive engine.
+#
+# Each case is one simulated consultation: the explicit symptoms are the
+# patient's opening message, and follow-up questions are answered by an
+# oracle built from the implicit symptoms (yes / no / unknown). Cases run
+# on a process pool; every worker keeps its own retriever (or talks to the
+# shared retrieval daemon when COD_RETRIEVAL_DAEMON is set).
+#
+# Usage (from ui/project_cod):
+#   python -m backend.eval_dxbench [--workers 8] [--limit 200] [--json out.json]
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from backend import tracing
+from backend.dxbench import load_cases_cached
+
+# From the consultation trace. Stages nest (followup includes the scoring
+# calls it makes), so they overlap and need not add up to total.
+STAGES = ("retrieval", "scoring", "followup", "total")
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOP = {"and", "or", "of", "the", "a", "in", "on", "with", "to", "no", "not"}
+
+
+# ---------------------------------------
+# ORACLE
+# ---------------------------------------
+def _words(text):
+    return {w for w in _WORD.findall(text.lower()) if w not in _STOP}
+
+
+def oracle_answer(question, implicit):
+    """
+    "yes" / "no" for a question matching an implicit symptom (present /
+    absent), None when the case says nothing about it.
+    """
+    q = question.lower()
+    qw = _words(q)
+    for symptom, present in implicit:
+        s = symptom.lower()
+        sw = _words(s)
+        if q == s or q in s or s in q or (qw and sw and len(qw & sw) / len(qw | sw) >= 0.5):
+            return "yes" if present else "no"
+    return None
+
+
+# ---------------------------------------
+# ONE CASE
+# ---------------------------------------
+def run_case(case, k=8):
+    """
+    Simulated consultation -> {id, gold, ranked, questions, timings}.
+    Turns go through diagnosis_engine.followup_step and the final ranking
+    repeats the app's report step, so the numbers describe the engine the
+    app and API run. Stage times come from the consultation's trace.
+    """
+    from backend.diagnosis_engine import followup_step, score_candidates, is_incompatible
+    from backend.model_loader import hybrid_retrieve, ensure_disease_map
+
+    t_case = time.perf_counter()
+    trace = tracing.ConsultationTrace()
+    with tracing.activate(trace):
+        symptoms = [s for s, present in case["explicit"] if present]
+        negatives = {s for s, present in case["explicit"] if not present}
+        text = ", ".join(symptoms)
+        age, gender = case.get("age"), case.get("gender")
+        asked, questions, rounds = set(), 0, 1
+
+        while True:
+            candidates, probs, next_q = followup_step(symptoms, text, asked, age, gender, sorted(negatives), k=k)
+            top_p = max(probs.values()) if probs else 0.0
+            if (not probs or not next_q
+                    or (top_p >= config.CONFIDENCE_THRESHOLD_STOP and rounds >= config.MIN_FOLLOWUP_QUESTIONS)
+                    or rounds >= config.MAX_FOLLOWUP_QUESTIONS):
+                break
+
+            questions += 1
+            answer = oracle_answer(next_q, case["implicit"])
+            if answer == "yes":
+                symptoms.append(next_q)
+            elif answer == "no":
+                negatives.add(next_q)
+            asked.add(next_q.lower())
+            rounds += 1
+
+        # Final ranking, as in the app's report step
+        final = hybrid_retrieve(", ".join(symptoms) + " " + text, k=k)
+        final = [d for d in final if not is_incompatible(d, age, gender)] or final
+        probs = score_candidates(final, symptoms, age, gender, negatives=sorted(negatives))
+        ranked = sorted(probs, key=probs.get, reverse=True)
+
+    stages = {name: sec for name, (_, sec) in trace.stages.items()}
+    timings = {
+        "retrieval": stages.get("retrieve", 0.0) + stages.get("retrieve_remote", 0.0),
+        "scoring": stages.get("scoring", 0.0),
+        "followup": stages.get("followup", 0.0),
+    }
+
+    # Closed-set variant: DxBench's own candidate list, ranked by the same
+    # scorer. The list is unranked (the gold answer is often first), so no
+    # positional bonus, and a per-case shuffle so ties don't go to index 0.
+    options = list(case["candidates"])
+    random.Random(str(case["id"])).shuffle(options)
+    choice_probs = score_candidates(options, symptoms, negatives=list(negatives), rank_bonus=False)
+    choice = max(choice_probs, key=choice_probs.get) if choice_probs else None
+    kb = ensure_disease_map()
+
+    timings["total"] = time.perf_counter() - t_case
+    return {
+        "id": case["id"],
+        "gold": case["disease"],
+        "ranked": ranked[:k],
+        "choice": choice,
+        "options": len(options),
+        "options_missing_from_kb": sum(1 for c in options if c not in kb),
+        "gold_missing_from_kb": case["disease"] not in kb,
+        "questions": questions,
+        "timings": timings,
+    }
+
+
+def _init_worker():
+    try:
+        import torch
+        torch.set_num_threads(1)  # N processes x 1 thread, not N x all cores
+    except ImportError:
+        pass
+    from backend.model_loader import ensure_disease_map
+    ensure_disease_map()
+
+
+def _run_chunk(args):
+    cases, k = args
+    return [run_case(c, k) for c in cases]
+
+
+# ---------------------------------------
+# AGGREGATION
+# ---------------------------------------
+def summarize(results):
+    n = len(results)
+    if not n:
+        return {"cases": 0}
+
+    def hit(r, top):
+        gold = r["gold"].lower()
+        return any(d.lower() == gold for d in r["ranked"][:top])
+
+    summary = {
+        "cases": n,
+        "top1": sum(hit(r, 1) for r in results) / n,
+        "top3": sum(hit(r, 3) for r in results) / n,
+        "choice_accuracy": sum((r["choice"] or "").lower() == r["gold"].lower() for r in results) / n,
+        # Options unknown to the KB all score alike; choice can only guess among them
+        "options_missing_from_kb": sum(r["options_missing_from_kb"] for r in results),
+        "options_total": sum(r["options"] for r in results),
+        "gold_missing_from_kb": sum(r["gold_missing_from_kb"] for r in results),
+        "questions_mean": float(np.mean([r["questions"] for r in results])),
+        "latency_ms": {},
+    }
+    for stage in STAGES:
+        xs = np.array([r["timings"][stage] for r in results]) * 1000
+        summary["latency_ms"][stage] = {p: float(np.percentile(xs, int(p[1:]))) for p in ("p50", "p90", "p99")}
+    return summary
+
+
+def evaluate(cases, workers=None, k=8, chunk=16):
+    workers = workers or os.cpu_count() or 1
+    chunks = [(cases[i:i + chunk], k) for i in range(0, len(cases), chunk)]
+    if workers == 1:
+        _init_worker()
+        return [r for c in chunks for r in _run_chunk(c)]
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        for part in pool.map(_run_chunk, chunks):
+            results.extend(part)
+    return results
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="DxBench evaluation of the interactive engine")
+    ap.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    ap.add_argument("--limit", type=int, default=None, help="evaluate only the first N cases")
+    ap.add_argument("--k", type=int, default=8)
+    ap.add_argument("--json", default=None, help="write summary (+ per-case results) here")
+    args = ap.parse_args(argv)
+
+    cases = load_cases_cached()
+    if args.limit:
+        cases = cases[:args.limit]
+
+    t0 = time.perf_counter()
+    results = evaluate(cases, args.workers, args.k)
+    wall = time.perf_counter() - t0
+    summary = summarize(results)
+    summary["wall_seconds"] = wall
+
+    print(f"DxBench: {summary['cases']} cases in {wall:.1f}s")
+    print(f"  top-1 {summary['top1']:.3f}   top-3 {summary['top3']:.3f}   "
+          f"choice {summary['choice_accuracy']:.3f}   questions {summary['questions_mean']:.2f}")
+    print(f"  closed-set options missing from the KB: {summary['options_missing_from_kb']}"
+          f"/{summary['options_total']}   gold missing: {summary['gold_missing_from_kb']}/{summary['cases']}")
+    print(f"  {'stage':<10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+    for stage, pct in summary["latency_ms"].items():
+        print(f"  {stage:<10}{pct['p50']:>10.1f}{pct['p90']:>10.1f}{pct['p99']:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"summary": summary, "cases": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
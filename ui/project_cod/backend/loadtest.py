@@ -0,0 +1,376 @@
+# backend/loadtest.py
+# Load generator: N simulated patients consulting at once.
+#
+# Patients
+#   dxbench    opening text = the case's explicit symptoms; follow-ups are
+#              answered from its implicit symptoms (eval oracle)
+#   meddialog  opening text = the patient's turns; follow-ups are
+#              answered from the symptoms extracted from them
+# Questions neither source covers are answered "not sure".
+#
+# Targets
+#   inprocess  api_server's consultation steps on an EnginePool, no HTTP
+#              (sessions go to a throwaway database unless --database)
+#   http       a running API (python -m backend.api_server), over urllib
+#
+# Patients arrive as a Poisson process (--rate per second, 0 = all at once)
+# and wait an exponential think time (mean --think seconds) before each
+# answer. Every turn (start / answer) is timed; the report gives throughput,
+# p50/p95/p99 latency, error rates, and the same per --interval window.
+#
+# Usage (from ui/project_cod):
+#   python -m backend.loadtest --patients 50 --rate 2 --think 1.5
+#   python -m backend.loadtest --source meddialog --target http --url http://127.0.0.1:8765
+#   python -m backend.loadtest --patients 200 --rate 0 --think 0 --json load.json
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from backend.meddialog_convert import MEDDIALOG_DIR, iter_dialogues, split_turns
+
+
+# ---------------------------------------
+# SIMULATED PATIENTS
+# ---------------------------------------
+class Patient:
+    """Opening text plus ground truth to answer follow-ups from."""
+
+    def __init__(self, pid, text, truth, source):
+        self.id = pid
+        self.text = text
+        self.truth = truth      # [(symptom, present)]
+        self.source = source
+
+    def answer(self, question):
+        from backend.eval_dxbench import oracle_answer
+        return oracle_answer(question or "", self.truth) or "not sure"
+
+
+def dxbench_patients(n, seed=0):
+    from backend.dxbench import load_cases_cached
+
+    cases = [c for c in load_cases_cached() if any(p for _, p in c["explicit"])]
+    rng = random.Random(seed)
+    picks = [rng.choice(cases) for _ in range(n)]
+    return [Patient(c["id"], ", ".join(s for s, p in c["explicit"] if p), c["implicit"], "dxbench")
+            for c in picks]
+
+
+def meddialog_patients(n, seed=0, split="test"):
+    from backend.symptom_extractor import get_extractor
+
+    extractor = get_extractor()
+    usable = []
+    for i, d in enumerate(iter_dialogues(os.path.join(MEDDIALOG_DIR, f"english-{split}.json"))):
+        text = split_turns(d)[0] or (d.get("description") or "").strip()
+        if not text:
+            continue
+        present, absent = extractor.extract_with_negation(text)
+        truth = [(s, True) for s in present] + [(s, False) for s in absent]
+        usable.append((f"meddialog-{split}-{i}", text, truth))
+
+    rng = random.Random(seed)
+    return [Patient(pid, text, truth, "meddialog")
+            for pid, text, truth in (rng.choice(usable) for _ in range(n))]
+
+
+# ---------------------------------------
+# TARGETS
+# ---------------------------------------
+class TurnError(Exception):
+    """A failed turn; `kind` is busy / timeout / http_<status> / connection / error."""
+
+    def __init__(self, kind, message=""):
+        super().__init__(message or kind)
+        self.kind = kind
+
+
+class InProcessTarget:
+    """
+    The API's consultation steps called directly, on the same bounded
+    EnginePool the HTTP server uses (so saturation shows up as "busy").
+    """
+
+    def __init__(self, workers=None, max_pending=None, database=None):
+        if database is None:
+            database = os.path.join(tempfile.mkdtemp(prefix="cod-load-"), "load.db")
+        config.DATABASE_PATH = database
+
+        from backend import api_server
+        from backend.model_loader import load_retriever
+
+        self._api = api_server
+        self.pool = api_server.EnginePool(workers, max_pending)
+        self.database = database
+        load_retriever()  # KB load is not part of any patient's first turn
+
+    def _run(self, fn, *args):
+        from concurrent.futures import TimeoutError as FutureTimeout
+        try:
+            return self.pool.run(fn, *args)
+        except self._api.Saturated:
+            raise TurnError("busy")
+        except FutureTimeout:
+            raise TurnError("timeout")
+        except self._api.ApiError as e:
+            raise TurnError(f"http_{e.status}", str(e))
+        except Exception as e:
+            raise TurnError("error", repr(e))
+
+    def start(self, patient):
+        c = self._run(self._api.start_consultation, {"symptoms": patient.text, "language": "en"})
+        return c, (None if c.finished else c.question)
+
+    def answer(self, handle, text):
+        def step(c, body):
+            with c.lock:
+                return self._api.answer_question(c, body)
+        c = self._run(step, handle, {"answer": text})
+        return c, (None if c.finished else c.question)
+
+    def close(self):
+        from backend import database
+        self.pool.shutdown()
+        database.flush_sessions()
+
+
+class HttpTarget:
+    """POST /consultations and /consultations/<id>/answer against a running API."""
+
+    def __init__(self, url, timeout=60.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _post(self, path, body):
+        req = urllib.request.Request(
+            self.url + path, data=json.dumps(body).encode("utf-8"),
+            headers={"Content-Type": "application/json"}, method="POST",
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return json.loads(resp.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            kind = {429: "busy", 504: "timeout"}.get(e.code, f"http_{e.code}")
+            raise TurnError(kind, e.read().decode("utf-8", "replace")[:200])
+        except TimeoutError:
+            raise TurnError("timeout")
+        except (urllib.error.URLError, ConnectionError) as e:
+            raise TurnError("connection", str(e))
+
+    @staticmethod
+    def _next(c):
+        # question_en: the simulated patient answers from English ground truth
+        return c["id"], (c.get("question_en") if c.get("status") == "question" else None)
+
+    def start(self, patient):
+        return self._next(self._post("/consultations", {"symptoms": patient.text, "language": "en"}))
+
+    def answer(self, handle, text):
+        return self._next(self._post(f"/consultations/{handle}/answer", {"answer": text}))
+
+    def close(self):
+        pass
+
+
+# ---------------------------------------
+# RUN
+# ---------------------------------------
+class LoadRun:
+    """Collects per-turn records and per-patient lifetimes across threads."""
+
+    def __init__(self, target, think=0.0, max_turns=None, seed=0):
+        self.target = target
+        self.think = think
+        self.max_turns = max_turns or config.MAX_FOLLOWUP_QUESTIONS + 1
+        self.seed = seed
+        self.turns = []         # (start offset s, latency s, kind, error kind or None)
+        self.patients = []      # (start offset s, end offset s, outcome)
+        self._lock = threading.Lock()
+        self._t0 = None
+
+    def _now(self):
+        return time.perf_counter() - self._t0
+
+    def _turn(self, kind, fn, *args):
+        t = self._now()
+        try:
+            out = fn(*args)
+            err = None
+        except TurnError as e:
+            out, err = None, e.kind
+        with self._lock:
+            self.turns.append((t, self._now() - t, kind, err))
+        return out, err
+
+    def _consult(self, i, patient):
+        rng = random.Random(self.seed * 100003 + i)
+        began = self._now()
+        out, err = self._turn("start", self.target.start, patient)
+        turns = 1
+        while err is None and out[1] and turns < self.max_turns:
+            if self.think > 0:
+                time.sleep(rng.expovariate(1.0 / self.think))
+            handle, question = out
+            out, err = self._turn("answer", self.target.answer, handle, patient.answer(question))
+            turns += 1
+        outcome = err or ("finished" if out[1] is None else "abandoned")
+        with self._lock:
+            self.patients.append((began, self._now(), outcome))
+
+    def run(self, patients, rate=0.0):
+        rng = random.Random(self.seed)
+        self._t0 = time.perf_counter()
+        threads, due = [], 0.0
+        for i, p in enumerate(patients):
+            if rate > 0:
+                due += rng.expovariate(rate)
+                delay = due - self._now()
+                if delay > 0:
+                    time.sleep(delay)
+            th = threading.Thread(target=self._consult, args=(i, p), name=f"patient-{i}", daemon=True)
+            th.start()
+            threads.append(th)
+        for th in threads:
+            th.join()
+        self.wall = self._now()
+        return self
+
+
+# ---------------------------------------
+# REPORT
+# ---------------------------------------
+def _pcts(latencies):
+    if not latencies:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ms = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"p50": round(float(p50), 1), "p95": round(float(p95), 1),
+            "p99": round(float(p99), 1), "max": round(float(ms.max()), 1)}
+
+
+def summarize(run, interval=5.0):
+    turns, wall = run.turns, max(run.wall, 1e-9)
+    ok = [lat for _, lat, _, err in turns if err is None]
+    errors = Counter(err for *_, err in turns if err is not None)
+    outcomes = Counter(o for *_, o in run.patients)
+
+    by_kind = {}
+    for kind in ("start", "answer"):
+        lats = [lat for _, lat, k, err in turns if k == kind and err is None]
+        by_kind[kind] = {"turns": sum(1 for t in turns if t[2] == kind), **_pcts(lats)}
+
+    windows = []
+    n_windows = int(wall // interval) + 1
+    for w in range(n_windows):
+        lo, hi = w * interval, (w + 1) * interval
+        in_w = [t for t in turns if lo <= t[0] < hi]
+        if not in_w and w == n_windows - 1:
+            break
+        lats = [lat for _, lat, _, err in in_w if err is None]
+        n_err = sum(1 for t in in_w if t[3] is not None)
+        active = sum(1 for b, e, _ in run.patients if b < hi and e >= lo)
+        windows.append({
+            "t": round(lo, 1),
+            "turns": len(in_w),
+            "turns_per_s": round(len(in_w) / interval, 2),
+            "errors": n_err,
+            "error_rate": round(n_err / len(in_w), 4) if in_w else 0.0,
+            "active_patients": active,
+            **{k: v for k, v in _pcts(lats).items() if k in ("p50", "p95")},
+        })
+
+    return {
+        "wall_s": round(wall, 2),
+        "patients": len(run.patients),
+        "outcomes": dict(outcomes),
+        "turns": len(turns),
+        "turns_per_s": round(len(turns) / wall, 2),
+        "consultations_per_s": round(outcomes.get("finished", 0) / wall, 3),
+        "errors": dict(errors),
+        "error_rate": round(sum(errors.values()) / len(turns), 4) if turns else 0.0,
+        "latency_ms": _pcts(ok),
+        "by_kind": by_kind,
+        "windows": windows,
+    }
+
+
+def print_report(s, args):
+    print(f"\n{s['patients']} patients ({args.source}) -> {args.target}"
+          f"   rate {args.rate or 'burst'}/s   think {args.think}s   wall {s['wall_s']}s")
+    print(f"  turns {s['turns']}  ({s['turns_per_s']}/s)   finished consultations "
+          f"{s['outcomes'].get('finished', 0)}  ({s['consultations_per_s']}/s)")
+    lat = s["latency_ms"]
+    print(f"  latency ms   p50 {lat['p50']}   p95 {lat['p95']}   p99 {lat['p99']}   max {lat['max']}")
+    for kind, k in s["by_kind"].items():
+        print(f"    {kind:<7} {k['turns']:>5} turns   p50 {k['p50']}   p95 {k['p95']}   p99 {k['p99']}")
+    errs = ", ".join(f"{k} {v}" for k, v in sorted(s["errors"].items())) or "none"
+    print(f"  errors {s['error_rate']:.2%}   ({errs})")
+
+    print(f"\n  {'t (s)':>7} {'turns/s':>8} {'active':>7} {'err %':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    for w in s["windows"]:
+        p50 = "-" if w["p50"] is None else w["p50"]
+        p95 = "-" if w["p95"] is None else w["p95"]
+        print(f"  {w['t']:>7} {w['turns_per_s']:>8} {w['active_patients']:>7} "
+              f"{w['error_rate'] * 100:>6.1f} {p50:>8} {p95:>8}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Simulated-patient load test for the diagnosis engine")
+    ap.add_argument("--patients", type=int, default=20)
+    ap.add_argument("--source", choices=["dxbench", "meddialog"], default="dxbench")
+    ap.add_argument("--split", default="test", help="MedDialog split (train/dev/test)")
+    ap.add_argument("--target", choices=["inprocess", "http"], default="inprocess")
+    ap.add_argument("--url", default=f"http://{config.API_HOST}:{config.API_PORT}")
+    ap.add_argument("--rate", type=float, default=1.0, help="patient arrivals per second (0 = all at once)")
+    ap.add_argument("--think", type=float, default=1.0, help="mean think time before each answer, seconds")
+    ap.add_argument("--max-turns", type=int, default=None)
+    ap.add_argument("--workers", type=int, default=None, help="in-process engine workers")
+    ap.add_argument("--max-pending", type=int, default=None, help="in-process queued jobs before 'busy'")
+    ap.add_argument("--database", default=None, help="in-process session database (default: a temp file)")
+    ap.add_argument("--timeout", type=float, default=60.0, help="HTTP request timeout, seconds")
+    ap.add_argument("--interval", type=float, default=5.0, help="report window, seconds")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", default=None, help="write the full report here")
+    args = ap.parse_args(argv)
+
+    if args.source == "dxbench":
+        patients = dxbench_patients(args.patients, args.seed)
+    else:
+        patients = meddialog_patients(args.patients, args.seed, args.split)
+
+    if args.target == "inprocess":
+        target = InProcessTarget(args.workers, args.max_pending, args.database)
+    else:
+        target = HttpTarget(args.url, args.timeout)
+
+    try:
+        run = LoadRun(target, think=args.think, max_turns=args.max_turns, seed=args.seed)
+        run.run(patients, rate=args.rate)
+    finally:
+        target.close()
+
+    summary = summarize(run, args.interval)
+    print_report(summary, args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), **summary}, f, indent=2)
+        print(f"\nReport written to {args.json}")
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+# backend/meddialog_convert.py
+# MedDialog -> CoD training samples, streamed.
+#
+# Port of the notebook's "STEP C" conversion, built to run over the whole
+# corpus (hundreds of thousands of dialogues) in bounded memory:
+#   * dialogues are parsed incrementally from the JSON array (or JSONL),
+#     one object at a time, never the whole file
+#   * candidates come from the backend retriever, one hybrid_retrieve_many
+#     call per batch; symptoms/negatives from the backend extractor
+#   * batches run on a process pool with a fixed number in flight, and
+#     results are written in input order
+#   * output is sharded JSONL (shard-00000.jsonl, ...). A shard is renamed
+#     into place only once full, and progress.json records how many
+#     dialogues it covers, so an interrupted run resumes after the last
+#     complete shard.
+#
+# Each line is {"input": ..., "output": <json string>}, the same shape the
+# notebook wrote:
+#   Patient Symptoms: ...\nNegative Findings: ...\nCandidates: ...
+#   -> step_1_symptom_abstraction ... step_5_decision_making
+#
+# Usage (from ui/project_cod):
+#   python -m backend.meddialog_convert                        # all english-*.json
+#   python -m backend.meddialog_convert --inputs english-train.json --workers 8
+#   python -m backend.meddialog_convert --resume               # continue a stopped run
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+MEDDIALOG_DIR = os.path.join(os.path.dirname(os.path.dirname(config.BASE_DIR)), "Dataset", "Meddialog")
+DEFAULT_OUT_DIR = os.path.join(config.BACKEND_DIR, "meddialog_cod")
+PROGRESS_FILE = "progress.json"
+
+RETRIEVER_TOPK = 15   # candidates retrieved per dialogue (notebook value)
+MAX_SYMPTOMS = 6
+DOCTOR_SUMMARY_CHARS = 400
+
+
+# ---------------------------------------
+# STREAMING READER
+# ---------------------------------------
+def iter_dialogues(path, chunk_size=1 << 20):
+    """
+    Yields the objects of a top-level JSON array (or of a JSONL / concatenated
+    JSON file) one at a time. Memory is bounded by chunk_size plus the
+    largest single dialogue.
+    """
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+    with open(path, encoding="utf-8") as f:
+        while True:
+            # Skip separators: whitespace, the array brackets, commas
+            while pos < len(buf) and buf[pos] in " \t\r\n,[]":
+                pos += 1
+            if pos >= len(buf):
+                if eof:
+                    return
+                buf, pos = f.read(chunk_size), 0
+                eof = not buf
+                continue
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more = f.read(chunk_size)
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield obj
+            pos = end
+            if pos > chunk_size:
+                buf, pos = buf[pos:], 0
+
+
+def split_turns(dialogue):
+    """
+    (patient text, doctor text) of one dialogue. Accepts the released format
+    ("patient: ..." strings under "utterances") and the CSV export's
+    [{"speaker", "utterance"}] turns.
+    """
+    patient, doctor = [], []
+    for turn in dialogue.get("utterances") or dialogue.get("turns") or []:
+        if isinstance(turn, dict):
+            speaker, text = turn.get("speaker", ""), turn.get("utterance", "")
+        else:
+            speaker, _, text = str(turn).partition(":")
+        speaker = speaker.strip().lower()
+        if "patient" in speaker:
+            patient.append(text.strip())
+        elif "doctor" in speaker:
+            doctor.append(text.strip())
+    return " ".join(patient).strip(), " ".join(doctor).strip()
+
+
+def default_inputs():
+    paths = glob.glob(os.path.join(MEDDIALOG_DIR, "english-*.json"))
+    order = {"train": 0, "dev": 1, "test": 2}
+    return sorted(paths, key=lambda p: (order.get(os.path.basename(p)[8:-5], 9), p))
+
+
+def iter_corpus(paths):
+    """(global index, "file#i", patient text, doctor text) over every input, in order."""
+    n = 0
+    for path in paths:
+        name = os.path.basename(path)
+        for i, d in enumerate(iter_dialogues(path)):
+            src, tgt = split_turns(d) if isinstance(d, dict) else ("", "")
+            yield n, f"{name}#{i}", src, tgt
+            n += 1
+
+
+# ---------------------------------------
+# ONE SAMPLE
+# ---------------------------------------
+def kb_symptoms(candidates, disease_map, limit=MAX_SYMPTOMS):
+    """The notebook's abstraction: KB symptom phrases of the top-5 candidates."""
+    parts = []
+    for c in candidates[:5]:
+        parts.extend(s.strip() for s in re.split(r"[;,\n\.]", str(disease_map.get(c, ""))) if s.strip())
+    return list(dict.fromkeys(parts))[:limit]
+
+
+def build_sample(src, tgt, candidates, symptoms, negatives, disease_map):
+    """One CoD sample dict ({"input", "output"}) from a retrieved dialogue."""
+    if not symptoms:
+        symptoms = kb_symptoms(candidates, disease_map)
+    symptoms = list(dict.fromkeys(symptoms))[:MAX_SYMPTOMS]
+    top5 = candidates[:5]
+
+    input_text = (
+        f"Patient Symptoms: {', '.join(symptoms) if symptoms else src[:256]}.\n"
+        f"Negative Findings: {', '.join(negatives) if negatives else 'None'}.\n"
+        f"Candidates: {', '.join(top5)}."
+    )
+
+    # Heuristic label: the first candidate the doctor names
+    tgt_l = tgt.lower()
+    true_disease = next((c for c in candidates if c.lower() in tgt_l), "Unknown")
+    if true_disease != "Unknown":
+        rem = 0.2 / (len(candidates) - 1) if len(candidates) > 1 else 0.0
+        dist = {c: (0.8 if c == true_disease else rem) for c in candidates}
+    else:
+        dist = {c: 1 / len(candidates) for c in candidates} if candidates else {}
+
+    output_json = {
+        "step_1_symptom_abstraction": {"extracted_symptoms": symptoms},
+        "step_2_candidate_recall": {"retrieved_diseases": top5},
+        "step_3_diagnostic_reasoning": {"doctor_text_summary": tgt[:DOCTOR_SUMMARY_CHARS]},
+        "step_4_confidence_assessment": {"scores": dist, "max_confidence": max(dist.values()) if dist else 0.0},
+        "step_5_decision_making": {"judge": True, "disease": true_disease},
+    }
+    return {"input": input_text, "output": json.dumps(output_json)}
+
+
+# ---------------------------------------
+# WORKERS
+# ---------------------------------------
+def _init_worker():
+    try:
+        import torch
+        torch.set_num_threads(1)  # N processes x 1 thread, not N x all cores
+    except ImportError:
+        pass
+    from backend.model_loader import load_retriever
+    from backend.symptom_extractor import get_extractor
+    load_retriever()
+    get_extractor()
+
+
+def convert_batch(batch, k=RETRIEVER_TOPK):
+    """[(index, key, src, tgt)] -> [(index, jsonl line)]; one retrieval call per batch."""
+    from backend.model_loader import hybrid_retrieve_many, load_retriever
+    from backend.symptom_extractor import get_extractor
+
+    state = load_retriever()
+    extractor = get_extractor()
+    all_candidates = hybrid_retrieve_many([{"symptoms": src, "k": k} for _, _, src, _ in batch], state=state)
+
+    out = []
+    for (idx, key, src, tgt), candidates in zip(batch, all_candidates):
+        symptoms, negatives = extractor.extract_with_negation(src)
+        sample = build_sample(src, tgt, candidates or [], symptoms, negatives, state.disease_symptom_map)
+        sample["source"] = key
+        out.append((idx, json.dumps(sample, ensure_ascii=False)))
+    return out
+
+
+# ---------------------------------------
+# SHARDED OUTPUT + PROGRESS
+# ---------------------------------------
+class ShardWriter:
+    """
+    Appends lines to shard-NNNNN.jsonl.tmp; at shard_size lines the file is
+    fsynced, renamed into place and progress.json rewritten (atomically)
+    with the number of input dialogues the finished shards cover.
+    """
+
+    def __init__(self, out_dir, shard_size, progress):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.progress = progress
+        self._f = None
+        self._lines = 0
+        self._last_index = None
+
+    def _path(self, n):
+        return os.path.join(self.out_dir, f"shard-{n:05d}.jsonl")
+
+    def write(self, index, line):
+        if self._f is None:
+            self._f = open(self._path(len(self.progress["shards"])) + ".tmp", "w", encoding="utf-8")
+        self._f.write(line + "\n")
+        self._lines += 1
+        self._last_index = index
+        if self._lines >= self.shard_size:
+            self._close_shard(self._last_index + 1)
+
+    def _close_shard(self, consumed):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+        path = self._path(len(self.progress["shards"]))
+        os.replace(path + ".tmp", path)
+        self.progress["shards"].append({"file": os.path.basename(path), "samples": self._lines})
+        self.progress["consumed"] = consumed
+        self.progress["samples"] += self._lines
+        save_progress(self.out_dir, self.progress)
+        self._f, self._lines = None, 0
+
+    def finish(self, consumed):
+        """Closes the last (partial) shard; consumed = dialogues read in total."""
+        if self._f is not None:
+            self._close_shard(consumed)
+        self.progress["consumed"] = consumed
+        self.progress["complete"] = True
+        save_progress(self.out_dir, self.progress)
+
+
+def load_progress(out_dir):
+    path = os.path.join(out_dir, PROGRESS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_progress(out_dir, progress):
+    path = os.path.join(out_dir, PROGRESS_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(progress, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _start_progress(out_dir, settings, resume):
+    os.makedirs(out_dir, exist_ok=True)
+    for tmp in glob.glob(os.path.join(out_dir, "shard-*.jsonl.tmp")):
+        os.remove(tmp)  # an unfinished shard is redone from its first dialogue
+
+    progress = load_progress(out_dir)
+    if progress is not None:
+        if not resume:
+            raise SystemExit(f"{out_dir} already holds a conversion; pass --resume or choose another --out")
+        if progress["settings"] != settings:
+            raise SystemExit("--resume with different inputs/settings than the stored run:\n"
+                             f"  stored: {progress['settings']}\n  now:    {settings}")
+        return progress
+
+    for old in glob.glob(os.path.join(out_dir, "shard-*.jsonl")):
+        os.remove(old)  # shards without a progress file are not trustworthy
+    progress = {"settings": settings, "consumed": 0, "samples": 0, "shards": [], "complete": False}
+    save_progress(out_dir, progress)
+    return progress
+
+
+# ---------------------------------------
+# PIPELINE
+# ---------------------------------------
+def _batches(corpus, batch_size, stats):
+    batch = []
+    for idx, key, src, tgt in corpus:
+        stats["read"] = idx + 1
+        if not src or not tgt:
+            stats["skipped"] += 1
+            continue
+        batch.append((idx, key, src, tgt))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def convert(inputs, out_dir=DEFAULT_OUT_DIR, workers=None, batch_size=64, shard_size=10000,
+            k=RETRIEVER_TOPK, limit=None, resume=False, max_inflight=None, log_every=10.0):
+    """Runs the conversion; returns the final progress dict."""
+    settings = {"inputs": [os.path.abspath(p) for p in inputs], "k": k,
+                "shard_size": shard_size, "limit": limit}
+    progress = _start_progress(out_dir, settings, resume)
+    if progress["complete"]:
+        print(f"Already complete: {progress['samples']} samples in {len(progress['shards'])} shards")
+        return progress
+
+    start = progress["consumed"]
+    # islice stops reading at the limit; the skipped prefix is still parsed
+    corpus = itertools.islice(iter_corpus(inputs), start, limit)
+    if start:
+        print(f"Resuming after {start} dialogues ({progress['samples']} samples, {len(progress['shards'])} shards)")
+
+    stats = {"read": start, "skipped": 0, "written": 0}
+    writer = ShardWriter(out_dir, shard_size, progress)
+    workers = workers or os.cpu_count() or 1
+    max_inflight = max_inflight or 2 * workers
+    t0 = last_log = time.perf_counter()
+
+    def emit(results):
+        nonlocal last_log
+        for idx, line in results:
+            writer.write(idx, line)
+        stats["written"] += len(results)
+        now = time.perf_counter()
+        if now - last_log >= log_every:
+            last_log = now
+            print(f"  read {stats['read']}   written {stats['written']}   "
+                  f"{stats['written'] / (now - t0):.1f} samples/s")
+
+    if workers == 1:
+        _init_worker()
+        for batch in _batches(corpus, batch_size, stats):
+            emit(convert_batch(batch, k))
+    else:
+        # Results are written in submission order; at most max_inflight
+        # batches are parsed ahead, so memory stays flat on any corpus size
+        inflight = deque()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            for batch in _batches(corpus, batch_size, stats):
+                if len(inflight) >= max_inflight:
+                    emit(inflight.popleft().result())
+                inflight.append(pool.submit(convert_batch, batch, k))
+            while inflight:
+                emit(inflight.popleft().result())
+
+    writer.finish(stats["read"])
+    wall = time.perf_counter() - t0
+    print(f"Converted {stats['written']} dialogues in {wall:.1f}s "
+          f"({stats['skipped']} without patient+doctor text skipped) -> "
+          f"{progress['samples']} samples in {len(progress['shards'])} shards under {out_dir}")
+    return progress
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Stream MedDialog dialogues into CoD-style JSONL training samples")
+    ap.add_argument("--inputs", nargs="*", default=None,
+                    help="MedDialog JSON/JSONL files (names resolve under Dataset/Meddialog; default: english-*.json)")
+    ap.add_argument("--out", default=DEFAULT_OUT_DIR)
+    ap.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    ap.add_argument("--batch", type=int, default=64, help="dialogues per retrieval batch")
+    ap.add_argument("--shard-size", type=int, default=10000, help="samples per output shard")
+    ap.add_argument("--k", type=int, default=RETRIEVER_TOPK, help="candidates retrieved per dialogue")
+    ap.add_argument("--limit", type=int, default=None, help="convert only the first N dialogues")
+    ap.add_argument("--max-inflight", type=int, default=None, help="batches queued on the pool (default: 2 x workers)")
+    ap.add_argument("--resume", action="store_true", help="continue the run recorded in --out")
+    args = ap.parse_args(argv)
+
+    inputs = args.inputs or default_inputs()
+    inputs = [p if os.path.exists(p) else os.path.join(MEDDIALOG_DIR, p) for p in inputs]
+    missing = [p for p in inputs if not os.path.exists(p)]
+    if not inputs or missing:
+        raise SystemExit(f"MedDialog input not found: {missing or MEDDIALOG_DIR}")
+
+    return convert(inputs, args.out, args.workers, args.batch, args.shard_size, args.k,
+                   args.limit, args.resume, args.max_inflight)
+
+
+if __name__ == "__main__":
+    main()
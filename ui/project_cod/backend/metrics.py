@@ -0,0 +1,298 @@
+# backend/metrics.py
+# In-process metrics registry: counters, gauges and latency histograms.
+#
+#   from backend import metrics
+#   @metrics.timed("cod_stage_seconds", stage="scoring")
+#   def score_candidates(...): ...
+#
+#   with metrics.timer("cod_stage_seconds", stage="bm25"):
+#       ...
+#   metrics.inc("cod_translation_cache_total", result="lru_hit")
+#
+# Export with prometheus_text() or to_json() (the API serves both at
+# /metrics and /metrics.json). With config.METRICS_ENABLED off, timers and
+# counters return immediately: one flag check and one ContextVar lookup per
+# call. The same timings and counters also go to the active consultation
+# trace (backend/tracing.py), if any.
+
+import bisect
+import functools
+import os
+import threading
+import time
+
+try:
+    import config
+except ImportError:
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import config
+
+from backend import tracing
+
+# Seconds; spans sub-millisecond BM25 lookups up to slow translations
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "cod_stage_seconds": "Time spent per engine stage",
+    "cod_db_seconds": "Time spent per database operation",
+    "cod_translation_cache_total": "Translation lookups by cache result",
+    "cod_translation_failures_total": "Translation backend calls that failed or timed out",
+    "cod_translation_saturated_total": "Translations skipped because hung backend calls held every slot",
+    "cod_session_writer_queue": "Sessions waiting in the write-behind queue",
+    "cod_session_writes_total": "Sessions committed by the write-behind writer",
+    "cod_retrievals_total": "hybrid_retrieve queries by path",
+    "cod_api_responses_total": "HTTP API responses by status code",
+    "cod_api_consultations": "Live consultations held by the API",
+}
+
+_enabled = config.METRICS_ENABLED
+
+
+def enabled():
+    return _enabled
+
+
+def set_enabled(flag):
+    global _enabled
+    _enabled = bool(flag)
+
+
+# ---------------------------------------
+# METRIC TYPES
+# ---------------------------------------
+class Counter:
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return {"value": self.value}
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        return {"value": self.value}
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self.counts)
+            total, n = self.sum, self.count
+        cumulative, running = [], 0
+        for c in counts:
+            running += c
+            cumulative.append(running)
+        return {
+            "count": n,
+            "sum": total,
+            "mean": total / n if n else 0.0,
+            "buckets": dict(zip([*map(str, self.buckets), "+Inf"], cumulative)),
+        }
+
+
+# ---------------------------------------
+# REGISTRY
+# ---------------------------------------
+class Registry:
+    """(name, sorted label items) -> metric. Children are created on first use."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, labels):
+        return self._get_key(cls, (name, tuple(sorted(labels.items()))))
+
+    def _get_key(self, cls, key):
+        m = self._metrics.get(key)
+        if m is None:
+            with self._lock:
+                m = self._metrics.get(key)
+                if m is None:
+                    m = self._metrics[key] = cls()
+        return m
+
+    def counter(self, name, **labels):
+        return self._get(Counter, name, labels)
+
+    def gauge(self, name, **labels):
+        return self._get(Gauge, name, labels)
+
+    def histogram(self, name, **labels):
+        return self._get(Histogram, name, labels)
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
+
+    def to_json(self):
+        out = {}
+        for (name, labels), m in sorted(self._metrics.items(), key=lambda kv: kv[0]):
+            out.setdefault(name, {"type": m.kind, "series": []})["series"].append(
+                {"labels": dict(labels), **m.snapshot()})
+        return out
+
+    def prometheus_text(self):
+        lines = []
+        for name, entry in self.to_json().items():
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} {entry['type']}")
+            for s in entry["series"]:
+                labels = s["labels"]
+                if entry["type"] == "histogram":
+                    for le, c in s["buckets"].items():
+                        lines.append(f"{name}_bucket{_fmt_labels({**labels, 'le': le})} {c}")
+                    lines.append(f"{name}_sum{_fmt_labels(labels)} {s['sum']:.9g}")
+                    lines.append(f"{name}_count{_fmt_labels(labels)} {s['count']}")
+                else:
+                    lines.append(f"{name}{_fmt_labels(labels)} {s['value']:.9g}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value):
+    # Text exposition format: backslash, double quote and newline are escaped
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels):
+    if not labels:
+        return ""
+    body = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+    return "{" + body + "}"
+
+
+REGISTRY = Registry()
+
+
+# ---------------------------------------
+# HELPERS
+# ---------------------------------------
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def _trace_key(name, labels):
+    # cod_stage_seconds{stage="bm25"} -> "bm25"; cod_db_seconds{op="write"} -> "db.write"
+    if name == "cod_stage_seconds":
+        return labels.get("stage", name)
+    base = name[4:] if name.startswith("cod_") else name
+    for suffix in ("_seconds", "_total"):
+        if base.endswith(suffix):
+            base = base[:-len(suffix)]
+    return ".".join([base, *map(str, labels.values())])
+
+
+class _Timer:
+    __slots__ = ("hist", "trace", "key", "t0")
+
+    def __init__(self, hist, trace, key):
+        self.hist = hist
+        self.trace = trace
+        self.key = key
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        dt = time.perf_counter() - self.t0
+        if self.hist is not None:
+            self.hist.observe(dt)
+        if self.trace is not None:
+            self.trace.add_stage(self.key, dt)
+        return False
+
+
+def timer(name, **labels):
+    """Context manager observing elapsed seconds into histogram name{labels}."""
+    trace = tracing.current()
+    if not _enabled and trace is None:
+        return _NULL_TIMER
+    return _Timer(REGISTRY.histogram(name, **labels) if _enabled else None, trace, _trace_key(name, labels))
+
+
+def timed(name, **labels):
+    """
+    Decorator form of timer(). The series key is built once; the histogram
+    itself is looked up per call, so Registry.reset() never orphans it.
+    """
+    def deco(fn):
+        series = (name, tuple(sorted(labels.items())))
+        key = _trace_key(name, labels)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            trace = tracing.current()
+            if not _enabled and trace is None:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                dt = time.perf_counter() - t0
+                if _enabled:
+                    REGISTRY._get_key(Histogram, series).observe(dt)
+                if trace is not None:
+                    trace.add_stage(key, dt)
+        return wrapper
+    return deco
+
+
+def inc(name, amount=1, **labels):
+    if _enabled:
+        REGISTRY.counter(name, **labels).inc(amount)
+    trace = tracing.current()
+    if trace is not None:
+        trace.count(_trace_key(name, labels), amount)
+
+
+def set_gauge(name, value, **labels):
+    if _enabled:
+        REGISTRY.gauge(name, **labels).set(value)
+
+
+def prometheus_text():
+    return REGISTRY.prometheus_text()
+
+
+def to_json():
+    return REGISTRY.to_json()
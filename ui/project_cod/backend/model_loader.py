@@ -1,6 +1,8 @@
 # backend/model_loader.py
 
-import os, pickle, re
+import hashlib, json, os, pickle, re, threading, time
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
 import numpy as np
 import pandas as pd
 from datasets import load_dataset
@@ -21,70 +23,69 @@ except ImportError:
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     import config
 
+from backend import metrics, tracing
+
 BASE_MODEL = config.BASE_MODEL_NAME
 MODEL_DIR = config.MODEL_ADAPTER_DIR
 
 RETRIEVER_CACHE = config.RETRIEVER_CACHE_DIR
 os.makedirs(RETRIEVER_CACHE, exist_ok=True)
 
-# global cached objects
-_retriever_loaded = False
-kb_df = None
-bm25 = None
-corpus = None
-faiss_index = None
-embedder = None
-disease_symptom_map = None
-# --- ENSURE DISEASE MAP AVAILABLE ---
-def ensure_disease_map():
+EMBEDDER_NAME = "sentence-transformers/all-mpnet-base-v2"
+
+# ---------------------------------------
+# RETRIEVER STATE
+# ---------------------------------------
+class RetrieverState(NamedTuple):
     """
-    Safe getter for disease_symptom_map.
-    Ensures the retriever is loaded and returns the map.
+    Read-only bundle of everything hybrid_retrieve needs.
+    Unpacks like the old load_retriever() tuple:
+    kb_df, disease_map, bm25, tokenized_corpus, faiss_index, embedder
     """
-    from backend.model_loader import load_retriever
-    global disease_symptom_map
+    kb_df: pd.DataFrame
+    disease_symptom_map: Mapping[str, str]
+    bm25: BM25Okapi
+    corpus: list
+    faiss_index: object
+    embedder: SentenceTransformer
 
-    if disease_symptom_map is None:
-        _, disease_symptom_map, _, _, _, _ = load_retriever()
 
-    return disease_symptom_map
+def _cache_paths(cache_dir):
+    return {
+        "kb": os.path.join(cache_dir, "kb.pkl"),
+        "bm25": os.path.join(cache_dir, "bm25.pkl"),
+        "corpus": os.path.join(cache_dir, "corpus.pkl"),
+        "faiss": os.path.join(cache_dir, "faiss.index"),
+        "map": os.path.join(cache_dir, "symptom_map.pkl"),
+    }
 
 
-# ---------------------------------------
-# LOAD / BUILD RETRIEVER
-# ---------------------------------------
-def load_retriever():
+def _get_embedder(embedder=None):
+    # Reuse an already loaded encoder across reloads (it never changes)
+    return embedder or SentenceTransformer(EMBEDDER_NAME)
+
+
+def build_retriever_state(cache_dir=RETRIEVER_CACHE, rebuild=False, embedder=None):
     """
     Loads cached retriever OR builds one from HF dataset.
-    Returns: kb_df, disease_map, bm25, tokenized_corpus, faiss_index, embedder
+    Pure function: touches no shared state, so it is safe to run
+    while other threads keep querying the previous state.
     """
-    global _retriever_loaded, kb_df, bm25, corpus, faiss_index, embedder, disease_symptom_map
-
-    if _retriever_loaded:
-        return kb_df, disease_symptom_map, bm25, corpus, faiss_index, embedder
-
-    KB = os.path.join(RETRIEVER_CACHE, "kb.pkl")
-    BM25 = os.path.join(RETRIEVER_CACHE, "bm25.pkl")
-    CORPUS = os.path.join(RETRIEVER_CACHE, "corpus.pkl")
-    FAISS = os.path.join(RETRIEVER_CACHE, "faiss.index")
-    MAP = os.path.join(RETRIEVER_CACHE, "symptom_map.pkl")
+    paths = _cache_paths(cache_dir)
 
     # -------------- load cache ----------------
-    if all(os.path.exists(x) for x in [KB, BM25, CORPUS, FAISS, MAP]):
-        kb_df = pd.read_pickle(KB)
+    if not rebuild and all(os.path.exists(x) for x in paths.values()):
+        df = pd.read_pickle(paths["kb"])
 
-        with open(MAP, "rb") as f:
-            disease_symptom_map = pickle.load(f)
-        with open(BM25, "rb") as f:
+        with open(paths["map"], "rb") as f:
+            disease_map = pickle.load(f)
+        with open(paths["bm25"], "rb") as f:
             bm25 = pickle.load(f)
-        with open(CORPUS, "rb") as f:
-            corpus = pickle.load(f)
-
-        faiss_index = faiss.read_index(FAISS)
-        embedder = SentenceTransformer("sentence-transformers/all-mpnet-base-v2")
+        with open(paths["corpus"], "rb") as f:
+            tokenized = pickle.load(f)
 
-        _retriever_loaded = True
-        return kb_df, disease_symptom_map, bm25, corpus, faiss_index, embedder
+        idx = faiss.read_index(paths["faiss"])
+        return RetrieverState(df, MappingProxyType(disease_map), bm25, tokenized, idx, _get_embedder(embedder))
 
     # -------------- build retriever ----------------
     ds = load_dataset("FreedomIntelligence/Disease_Database", "en", split="train")
@@ -95,83 +96,397 @@ def load_retriever():
     sym_col = sym_cols[0]
     df["symptom_text"] = df[sym_col].astype(str)
 
-    disease_symptom_map = {row["disease"]: row["symptom_text"] for _, row in df.iterrows()}
+    disease_map = {row["disease"]: row["symptom_text"] for _, row in df.iterrows()}
 
     tokenized = [re.findall(r"\w+", s.lower()) for s in df["symptom_text"]]
     bm25 = BM25Okapi(tokenized)
 
-    embedder = SentenceTransformer("sentence-transformers/all-mpnet-base-v2")
+    embedder = _get_embedder(embedder)
     embs = embedder.encode(df["symptom_text"].tolist(), convert_to_numpy=True)
     faiss.normalize_L2(embs)
     idx = faiss.IndexFlatIP(embs.shape[1])
     idx.add(embs)
 
     # cache all components
-    df.to_pickle(KB)
-    with open(MAP, "wb") as f: pickle.dump(disease_symptom_map, f)
-    with open(BM25, "wb") as f: pickle.dump(bm25, f)
-    with open(CORPUS, "wb") as f: pickle.dump(tokenized, f)
-    faiss.write_index(idx, FAISS)
+    os.makedirs(cache_dir, exist_ok=True)
+    df.to_pickle(paths["kb"])
+    with open(paths["map"], "wb") as f: pickle.dump(disease_map, f)
+    with open(paths["bm25"], "wb") as f: pickle.dump(bm25, f)
+    with open(paths["corpus"], "wb") as f: pickle.dump(tokenized, f)
+    faiss.write_index(idx, paths["faiss"])
+
+    return RetrieverState(df, MappingProxyType(disease_map), bm25, tokenized, idx, embedder)
+
+
+# ---------------------------------------
+# LOADER (single-flight, atomic reload)
+# ---------------------------------------
+class RetrieverLoader:
+    """
+    Owns the shared RetrieverState.
+
+    - get(): first caller builds/loads under a lock, concurrent callers
+      wait for that one load instead of starting their own.
+    - reload(): builds a fresh state without holding the read path,
+      then swaps the reference. In-flight queries keep the snapshot
+      they started with.
+    """
+
+    def __init__(self, cache_dir=RETRIEVER_CACHE, builder=build_retriever_state):
+        self.cache_dir = cache_dir
+        self._builder = builder
+        self._state = None
+        self._load_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._listeners = []
+
+    @property
+    def loaded(self):
+        return self._state is not None
+
+    def get(self):
+        state = self._state
+        if state is not None:
+            return state
+
+        with self._load_lock:
+            if self._state is None:
+                self._swap(self._builder(self.cache_dir))
+            return self._state
+
+    def reload(self, rebuild=False):
+        # One reload at a time; readers are never blocked by it
+        with self._reload_lock:
+            old = self._state
+            new = self._builder(
+                self.cache_dir,
+                rebuild=rebuild,
+                embedder=old.embedder if old is not None else None,
+            )
+            with self._load_lock:
+                self._swap(new)
+            return new
+
+    def set_state(self, state):
+        """Installs a prebuilt state (tests, benchmarks, synthetic KBs)."""
+        with self._load_lock:
+            self._swap(state)
+
+    def release(self):
+        """Drops the state; the next get() loads it again. In-flight queries keep their snapshot."""
+        with self._load_lock:
+            self._state = None
+
+    def add_listener(self, fn):
+        """fn(state) is called every time a new state is installed."""
+        self._listeners.append(fn)
+        if self._state is not None:
+            fn(self._state)
+
+    def _swap(self, state):
+        self._state = state
+        for fn in list(self._listeners):
+            fn(state)
+
+
+_loader = RetrieverLoader()
+
+
+def get_loader():
+    return _loader
 
-    kb_df = df
-    corpus = tokenized
-    faiss_index = idx
 
-    _retriever_loaded = True
-    return kb_df, disease_symptom_map, bm25, corpus, faiss_index, embedder
+def load_retriever():
+    """
+    Returns the shared RetrieverState
+    (kb_df, disease_map, bm25, tokenized_corpus, faiss_index, embedder).
+    """
+    return _loader.get()
+
+
+def reload_retriever(rebuild=False):
+    """Re-reads the cache (or rebuilds it) and swaps it in atomically."""
+    return _loader.reload(rebuild=rebuild)
 
 
 # ---------------------------------------
 # Ensure disease_symptom_map available
 # ---------------------------------------
 def ensure_disease_map():
-    """Safely loads disease_symptom_map and returns it."""
-    global disease_symptom_map
-    if disease_symptom_map is None:
-        _, disease_symptom_map, _, _, _, _ = load_retriever()
-    return disease_symptom_map
+    """Safely loads disease_symptom_map and returns it (read-only)."""
+    global _remote_map
+    client = _remote_client()
+    if client is not None:
+        # Front-end workers only need the map; the daemon keeps the indexes
+        if _remote_map is None:
+            try:
+                _remote_map = MappingProxyType(client.disease_map())
+                _remote_ok()
+            except OSError as e:
+                _remote_failed(e)
+                return _loader.get().disease_symptom_map
+        return _remote_map
+    return _loader.get().disease_symptom_map
+
+
+def warm_retrieval():
+    """
+    Startup hook for front ends. With a retrieval daemon configured only
+    the disease map is fetched, so this process never holds its own
+    index; otherwise the full retriever is loaded in-process.
+    """
+    if _remote_client() is not None:
+        return ensure_disease_map()
+    return load_retriever()
 
 
 # ---------------------------------------
-# Hybrid Retrieve
+# MULTILINGUAL DENSE INDEX (optional)
 # ---------------------------------------
-def hybrid_retrieve(symptoms, k=6, alpha=0.6):
-    """
-    BM25 + FAISS hybrid retriever with robust preprocessing.
-    """
-    global kb_df, disease_symptom_map, bm25, corpus, faiss_index, embedder
+class MultilingualState(NamedTuple):
+    """Second dense index over the same KB rows, built with a multilingual encoder."""
+    faiss_index: object
+    embedder: SentenceTransformer
+
+
+def _kb_fingerprint(kb_df):
+    # Identifies the KB rows (and encoder) an on-disk index was built from
+    h = hashlib.sha256(config.MULTILINGUAL_EMBEDDER_NAME.encode("utf-8"))
+    for disease, text in zip(kb_df["disease"], kb_df["symptom_text"]):
+        h.update(f"{disease}\t{text}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def build_multilingual_state(kb_state, cache_dir=RETRIEVER_CACHE, rebuild=False, embedder=None):
+    """Multilingual index over kb_state's rows, cached on disk under the KB's fingerprint."""
+    path = os.path.join(cache_dir, "faiss_multilingual.index")
+    meta_path = path + ".json"
+    embedder = embedder or SentenceTransformer(config.MULTILINGUAL_EMBEDDER_NAME)
+    kb_df = kb_state.kb_df
+    fingerprint = _kb_fingerprint(kb_df)
+
+    if not rebuild and os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as f:
+            stored = json.load(f).get("kb")
+        # Must line up row-for-row with kb_df; a file from another KB is rebuilt
+        if stored == fingerprint:
+            idx = faiss.read_index(path)
+            if idx.ntotal == len(kb_df):
+                return MultilingualState(idx, embedder)
+
+    embs = embedder.encode(kb_df["symptom_text"].tolist(), convert_to_numpy=True, batch_size=64)
+    faiss.normalize_L2(embs)
+    idx = faiss.IndexFlatIP(embs.shape[1])
+    idx.add(embs)
+    faiss.write_index(idx, path)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({"kb": fingerprint, "rows": len(kb_df)}, f)
+    return MultilingualState(idx, embedder)
 
-    load_retriever()  # ensure loaded
 
-    if isinstance(symptoms, list):
-        symptoms = ", ".join(symptoms)
+# Multilingual indexes keyed by the RetrieverState they were built from, so
+# a batch never pairs one KB's rows with another KB's vectors. The previous
+# KB's entry is kept for queries still running on its snapshot.
+_ml_lock = threading.Lock()
+_ml_states = ()   # ((kb_state, MultilingualState), ...), newest last
+
+
+def multilingual_state(kb_state=None):
+    """The multilingual index for exactly kb_state (default: the current KB), built on first use."""
+    global _ml_states
+    kb_state = kb_state or _loader.get()
+    for kb, ml in _ml_states:
+        if kb is kb_state:
+            return ml
+    with _ml_lock:
+        for kb, ml in _ml_states:
+            if kb is kb_state:
+                return ml
+        embedder = _ml_states[-1][1].embedder if _ml_states else None
+        ml = build_multilingual_state(kb_state, embedder=embedder)
+        _ml_states = (_ml_states + ((kb_state, ml),))[-2:]
+        return ml
+
+
+def _on_kb_swap(state):
+    # A new KB invalidates the multilingual rows: build its index up front
+    if _ml_states:
+        multilingual_state(state)
+
 
-    if not symptoms:
-        symptoms = "symptoms"
+_loader.add_listener(_on_kb_swap)
 
-    q = symptoms.lower()
-    toks = re.findall(r"\w+", q)
 
-    # BM25
-    bm = np.array(bm25.get_scores(toks))
+def multilingual_enabled(lang):
+    return config.MULTILINGUAL_RETRIEVAL and lang not in (None, "", "en") and lang in config.SUPPORTED_LANGUAGES
+
+
+# ---------------------------------------
+# Hybrid Retrieve
+# ---------------------------------------
+def _bm25_scores(bm25, text):
+    with metrics.timer("cod_stage_seconds", stage="bm25"):
+        bm = np.array(bm25.get_scores(re.findall(r"\w+", text)))
     if bm.max() > 0:
         bm /= (bm.max() + 1e-12)
+    return bm
+
 
-    # FAISS
-    emb = embedder.encode([q], convert_to_numpy=True)
+def _dense_scores_many(index, embedder, texts, n):
+    """One encoder batch and one index search for all texts -> (len(texts), n) scores."""
+    with metrics.timer("cod_stage_seconds", stage="encode"):
+        emb = embedder.encode(list(texts), convert_to_numpy=True)
     faiss.normalize_L2(emb)
-    sims, ids = faiss_index.search(emb, len(kb_df))
-    fs = np.zeros(len(kb_df))
-    fs[ids[0]] = sims[0]
+    with metrics.timer("cod_stage_seconds", stage="faiss"):
+        sims, ids = index.search(emb, n)
+    fs = np.zeros((len(texts), n))
+    np.put_along_axis(fs, ids, sims, axis=1)
+    mx = fs.max(axis=1, keepdims=True)
+    return np.where(mx > 0, fs / (mx + 1e-12), fs)
+
+
+def _dense_scores(index, embedder, text, n):
+    return _dense_scores_many(index, embedder, [text], n)[0]
 
-    if fs.max() > 0:
-        fs /= (fs.max() + 1e-12)
 
-    # Hybrid
-    final = alpha * fs + (1 - alpha) * bm
-    top_ids = np.argsort(final)[::-1][:k]
+def _query_text(symptoms):
+    if isinstance(symptoms, list):
+        symptoms = ", ".join(symptoms)
+    return (symptoms or "symptoms").lower()
+
+
+# Marker for remote callers: "I have a fallback, but only evaluate it if needed"
+FALLBACK_PENDING = "__fallback_pending__"
+
 
-    return [kb_df.iloc[i]["disease"] for i in top_ids]
+@metrics.timed("cod_stage_seconds", stage="retrieve")
+def hybrid_retrieve_many(queries, state=None):
+    """
+    Batched hybrid_retrieve. queries: dicts with symptoms and optional
+    k, alpha, lang, bm25_fallback (callable or text). All dense lookups
+    for the batch share one encode() and one index search per encoder.
+
+    Returns one disease list per query; None where bm25_fallback is
+    FALLBACK_PENDING and BM25 found nothing (caller re-asks with the text).
+    """
+    trace = tracing.current()
+    t0 = time.perf_counter()
+    state = state or _loader.get()
+    kb_df, _, bm25, _, faiss_index, embedder = state
+    n = len(kb_df)
+    texts = [_query_text(q.get("symptoms")) for q in queries]
+
+    ml_rows = [i for i, q in enumerate(queries) if multilingual_enabled(q.get("lang", "en"))]
+    en_rows = [i for i in range(len(queries)) if i not in set(ml_rows)]
+
+    fs = np.zeros((len(queries), n))
+    if en_rows:
+        fs[en_rows] = _dense_scores_many(faiss_index, embedder, [texts[i] for i in en_rows], n)
+    if ml_rows:
+        ml = multilingual_state(state)
+        fs[ml_rows] = _dense_scores_many(ml.faiss_index, ml.embedder, [texts[i] for i in ml_rows], n)
+
+    ml_set = set(ml_rows)
+    out = []
+    for i, q in enumerate(queries):
+        bm = _bm25_scores(bm25, texts[i])
+        fallback = q.get("bm25_fallback")
+        used_fallback = False
+        if i in ml_set and bm.max() <= 0 and fallback is not None:
+            if fallback == FALLBACK_PENDING:
+                out.append(None)
+                continue
+            if callable(fallback):
+                fallback = fallback()
+            bm = _bm25_scores(bm25, (fallback or "").lower())
+            used_fallback = True
+
+        # Hybrid
+        alpha = q.get("alpha", 0.6)
+        final = alpha * fs[i] + (1 - alpha) * bm
+        top_ids = np.argsort(final)[::-1][:q.get("k", 6)]
+        out.append([kb_df.iloc[j]["disease"] for j in top_ids])
+        if trace is not None:
+            trace.event("retrieve", query=texts[i][:200], k=q.get("k", 6), alpha=alpha,
+                        lang=q.get("lang", "en"), multilingual=i in ml_set, bm25_fallback=used_fallback,
+                        top=[[d, round(float(final[j]), 4)] for d, j in zip(out[-1], top_ids)],
+                        ms=round((time.perf_counter() - t0) * 1000, 2))
+    return out
+
+
+def hybrid_retrieve(symptoms, k=6, alpha=0.6, state=None, lang="en", bm25_fallback=None):
+    """
+    BM25 + FAISS hybrid retriever with robust preprocessing.
+    Works on one state snapshot so a concurrent reload cannot mix indexes.
+
+    lang / bm25_fallback: for a supported non-English query (and
+    config.MULTILINGUAL_RETRIEVAL on) the dense side embeds the raw text with
+    the multilingual encoder. BM25 runs on the raw tokens first and only calls
+    bm25_fallback() (e.g. a translate-to-English) if that finds nothing.
+
+    With config.RETRIEVAL_DAEMON_ADDRESS set (and no explicit state), the
+    query goes to the shared retrieval daemon instead of a local index.
+    """
+    if state is None:
+        client = _remote_client()
+        if client is not None:
+            try:
+                t0 = time.perf_counter()
+                with metrics.timer("cod_stage_seconds", stage="retrieve_remote"):
+                    res = client.retrieve(symptoms, k=k, alpha=alpha, lang=lang, bm25_fallback=bm25_fallback)
+                metrics.inc("cod_retrievals_total", path="remote")
+                _remote_ok()
+                # The daemon returns names only, so remote trace entries carry no scores
+                tracing.record("retrieve", query=_query_text(symptoms)[:200], k=k, alpha=alpha, lang=lang,
+                               remote=True, top=res, ms=round((time.perf_counter() - t0) * 1000, 2))
+                return res
+            except OSError as e:
+                _remote_failed(e)
+
+    metrics.inc("cod_retrievals_total", path="local")
+    query = {"symptoms": symptoms, "k": k, "alpha": alpha, "lang": lang, "bm25_fallback": bm25_fallback}
+    return hybrid_retrieve_many([query], state)[0]
+
+
+# ---------------------------------------
+# SHARED RETRIEVAL DAEMON (optional, see retrieval_daemon.py)
+# ---------------------------------------
+_remote_map = None
+_remote_retry_at = 0.0     # monotonic time before which the daemon is not tried
+_remote_fallback = False   # the in-process index was loaded only to cover an outage
+_remote_lock = threading.Lock()
+
+
+def _remote_client():
+    if not config.RETRIEVAL_DAEMON_ADDRESS or time.monotonic() < _remote_retry_at:
+        return None
+    if _loader.loaded and not _remote_fallback:
+        return None  # this process holds its own index (the daemon itself, tests)
+    from backend.retrieval_daemon import get_client
+    return get_client(config.RETRIEVAL_DAEMON_ADDRESS)
+
+
+def _remote_failed(err):
+    # Daemon gone: serve this call in-process, retry the daemon after a backoff
+    global _remote_retry_at, _remote_fallback
+    with _remote_lock:
+        if time.monotonic() >= _remote_retry_at:
+            print(f"⚠ Retrieval daemon unreachable ({err}); serving in-process, "
+                  f"retrying in {config.RETRIEVAL_DAEMON_RETRY:g}s.")
+        _remote_retry_at = time.monotonic() + config.RETRIEVAL_DAEMON_RETRY
+        if not _loader.loaded:
+            _remote_fallback = True
+
+
+def _remote_ok():
+    # Daemon back: drop the index loaded for the outage
+    global _remote_fallback
+    if _remote_fallback:
+        with _remote_lock:
+            if _remote_fallback:
+                _remote_fallback = False
+                _loader.release()
+                print("✓ Retrieval daemon reachable again; released the in-process index.")
 
 
 # ---------------------------------------
@@ -0,0 +1,451 @@
+# backend/replay.py
+# Deterministic replay of one consultation, with profiling.
+#
+# Sources
+#   --session <id>   a stored session: opening text and every answer come from
+#                    its trace (backend/tracing.py). Sessions saved before
+#                    traces existed are approximated from their symptom list.
+#   --dxbench <id>   a DxBench case, answered by the eval oracle
+#
+# The consultation runs the same engine path as the app/API (followup_step
+# per turn, then retrieval + scoring + build_final_report), in-process and
+# without speculation or the database. It is replayed once per profiler so
+# the tools never distort each other, and every pass must produce the same
+# digest:
+#   cProfile     per-function CPU profile (top list; --pstats for snakeviz)
+#   sampler      collapsed stacks for flamegraph.pl / speedscope (--flame)
+#   tracemalloc  top allocation sites and peak
+#
+# Usage (from ui/project_cod):
+#   python -m backend.replay --session 3f2a... [--flame out.folded] [--pstats out.prof]
+#   python -m backend.replay --dxbench 17 [--top 30] [--json out.json]
+
+import argparse
+import cProfile
+import hashlib
+import io
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from backend import tracing
+
+
+# ---------------------------------------
+# SEEDING
+# ---------------------------------------
+def seed_everything(seed=0, threads=None):
+    """
+    Seeds every RNG the engine could touch. The engine itself draws no
+    random numbers; this pins library-level randomness (and, with
+    threads=1, BLAS reduction order in the encoder) so replays match exactly.
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    try:
+        import torch
+        torch.manual_seed(seed)
+        if threads:
+            torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+# ---------------------------------------
+# SCRIPTS: what the patient says
+# ---------------------------------------
+def script_from_session(session):
+    """
+    Replay script from a stored session. Answers are keyed by the question
+    asked; a question the recorded patient never saw gets no answer.
+    """
+    trace = session.get("trace") or {}
+    events = trace.get("events") or []
+    start = next((e for e in events if e.get("kind") == "start"), None)
+    answers = {}
+    asked = []
+    for e in events:
+        if e.get("kind") == "answer" and not e.get("speculative"):
+            answers[e["question"].lower()] = (e.get("verdict"), e.get("also") or [], e.get("denied") or [])
+            asked.append(e["question"])
+
+    script = {
+        "source": f"session:{session['id']}",
+        "name": session.get("name") or "",
+        "age": session.get("age") or "",
+        "gender": session.get("gender") or "",
+        "expected_questions": asked,
+        "expected_report": session.get("final_report"),
+        "exact": start is not None,
+    }
+    if start is not None:
+        script.update(text=start.get("text") or "", text_en=start.get("text_en") or start.get("text") or "",
+                      language=start.get("language") or "en")
+        script["answer"] = lambda q: answers.get(q.lower(), (None, [], []))
+    else:
+        # No trace: the stored symptom list stands in for the opening text,
+        # and a question is a "yes" exactly when it ended up among the symptoms
+        syms = [s.strip() for s in (session.get("symptoms") or "").split(",") if s.strip()]
+        present = {s.lower() for s in syms}
+        script.update(text=", ".join(syms), text_en=", ".join(syms), language="en",
+                      expected_questions=None)
+        script["answer"] = lambda q: ("yes" if q.lower() in present else "no", [], [])
+    return script
+
+
+def script_from_dxbench(case):
+    from backend.eval_dxbench import oracle_answer
+
+    text = ", ".join(s for s, present in case["explicit"] if present)
+    return {
+        "source": f"dxbench:{case['id']}",
+        "name": "", "age": "", "gender": "",
+        "text": text, "text_en": text, "language": "en",
+        "explicit": case["explicit"],
+        "expected_questions": None,
+        "expected_report": None,
+        "exact": True,
+        "gold": case["disease"],
+        "answer": lambda q: (oracle_answer(q, case["implicit"]), [], []),
+    }
+
+
+def load_script(session_id=None, dxbench_id=None):
+    if session_id:
+        from backend import database
+        session = database.get_session(session_id)
+        if session is None:
+            raise SystemExit(f"No stored session {session_id!r}")
+        return script_from_session(session)
+
+    from backend.dxbench import load_cases_cached
+    wanted = {str(dxbench_id), f"DxBench_{dxbench_id}"}  # "17" or "DxBench_17"
+    for case in load_cases_cached():
+        if str(case["id"]) in wanted:
+            return script_from_dxbench(case)
+    raise SystemExit(f"No DxBench case {dxbench_id!r}")
+
+
+# ---------------------------------------
+# ONE CONSULTATION
+# ---------------------------------------
+def run_consultation(script, k=8):
+    """
+    The app's engine path for one scripted patient. Returns the outcome
+    (questions, final ranking, report) and the replay's own trace.
+    """
+    from backend.diagnosis_engine import (
+        followup_step, score_candidates, build_final_report, is_incompatible,
+    )
+    from backend.model_loader import hybrid_retrieve
+    from backend.symptom_extractor import get_extractor
+    from backend.triage import detect_red_flags, urgent_report
+
+    trace = tracing.ConsultationTrace(max_events=10 ** 6)
+    with tracing.activate(trace):
+        text, text_en, lang = script["text"], script["text_en"], script["language"]
+        age, gender = script["age"], script["gender"]
+
+        red_flags = detect_red_flags(text, text_en)
+        if "explicit" in script:
+            symptoms = [s for s, present in script["explicit"] if present]
+            negatives = {s for s, present in script["explicit"] if not present}
+        else:
+            symptoms, ruled_out = get_extractor().extract_with_negation(text_en)
+            negatives = set(ruled_out)
+
+        asked, questions, rounds = set(), [], 1
+        probs, candidates = {}, []
+        while not red_flags:
+            candidates, probs, next_q = followup_step(
+                symptoms, text, asked, age, gender, sorted(negatives),
+                k=k, lang=lang, fallback_text=text_en,
+            )
+            top_p = max(probs.values()) if probs else 0.0
+            if (not probs or not next_q
+                    or (top_p >= config.CONFIDENCE_THRESHOLD_STOP and rounds >= config.MIN_FOLLOWUP_QUESTIONS)
+                    or rounds >= config.MAX_FOLLOWUP_QUESTIONS):
+                break
+
+            questions.append(next_q)
+            verdict, also, denied = script["answer"](next_q)
+            red_flags = detect_red_flags(next_q if verdict == "yes" else "")
+            current = {s.lower() for s in symptoms}
+            if verdict == "yes" and next_q.lower() not in current:
+                symptoms.append(next_q)
+                current.add(next_q.lower())
+            elif verdict == "no":
+                negatives.add(next_q)
+            symptoms.extend(s for s in also if s != next_q.lower() and s not in current)
+            negatives.update(s for s in denied if s != next_q.lower() and s not in current)
+            asked.add(next_q.lower())
+            rounds += 1
+
+        if red_flags:
+            probs = {}
+            report = urgent_report(red_flags, script["name"], age, gender, symptoms)
+        else:
+            full_query = ", ".join(symptoms) + " " + (text_en or text)
+            candidates = hybrid_retrieve(full_query, k=k)
+            candidates = [d for d in candidates if not is_incompatible(d, age, gender)] or candidates
+            probs = score_candidates(candidates, symptoms, age, gender, negatives=sorted(negatives))
+            report = build_final_report(script["name"], age, gender, symptoms, candidates, probs)
+
+    outcome = {
+        "questions": questions,
+        "symptoms": symptoms,
+        "negatives": sorted(negatives),
+        "red_flags": [f.id for f in red_flags],
+        "ranking": tracing.top_items(probs, n=len(probs), digits=12),
+        "report": report,
+    }
+    outcome["digest"] = hashlib.sha256(json.dumps(outcome, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return outcome, trace
+
+
+# ---------------------------------------
+# PROFILERS
+# ---------------------------------------
+class StackSampler:
+    """
+    Samples one thread's Python stack every `interval` seconds and counts
+    identical stacks: the "collapsed" format of flamegraph.pl / speedscope
+    ("outer;inner;leaf count" per line).
+    """
+
+    def __init__(self, thread_id=None, interval=0.001, root=None):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.root = root  # stacks start at this function (drops the CLI frames above it)
+        self.counts = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._switch = None
+
+    @staticmethod
+    def _label(code):
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+    def _run(self):
+        while not self._stop.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                if frame.f_code.co_name == self.root:
+                    break
+                frame = frame.f_back
+            if self.root and frame is None:
+                stack = []  # outside the replayed consultation
+            if stack:
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+                self.samples += 1
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        # A shorter GIL switch interval lets the sampler in while Python code spins
+        self._switch = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch, self.interval))
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        sys.setswitchinterval(self._switch)
+        return False
+
+    def collapsed(self):
+        return "".join(f"{stack} {n}\n" for stack, n in sorted(self.counts.items()))
+
+
+def profile_cpu(script, k=8, top=25, pstats_path=None):
+    prof = cProfile.Profile()
+    prof.enable()
+    outcome, trace = run_consultation(script, k)
+    prof.disable()
+    if pstats_path:
+        prof.dump_stats(pstats_path)
+
+    stats = pstats.Stats(prof)
+    rows = []
+    for (filename, line, func), (cc, nc, tt, ct, _) in stats.stats.items():
+        rows.append({"function": f"{func} ({os.path.basename(filename)}:{line})",
+                     "calls": nc, "tottime_ms": tt * 1000, "cumtime_ms": ct * 1000})
+    rows.sort(key=lambda r: r["cumtime_ms"], reverse=True)
+
+    text = io.StringIO()
+    pstats.Stats(prof, stream=text).sort_stats("cumulative").print_stats(top)
+    return outcome, trace, rows[:top], text.getvalue()
+
+
+def profile_stacks(script, k=8, interval=0.001, repeat=5):
+    """Samples `repeat` back-to-back replays; one consultation is often only a few ms."""
+    with StackSampler(interval=interval, root="run_consultation") as sampler:
+        for _ in range(repeat):
+            outcome, _ = run_consultation(script, k)
+    return outcome, sampler
+
+
+def profile_memory(script, k=8, top=25, frames=8):
+    tracemalloc.start(frames)
+    try:
+        outcome, _ = run_consultation(script, k)
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    rows = [{"site": f"{os.path.basename(s.traceback[0].filename)}:{s.traceback[0].lineno}",
+             "kib": s.size / 1024, "blocks": s.count}
+            for s in snapshot.statistics("lineno")[:top]]
+    return outcome, rows, peak
+
+
+# ---------------------------------------
+# DRIVER
+# ---------------------------------------
+def replay(script, k=8, seed=0, threads=None, top=25, interval=0.001, repeat=5,
+           pstats_path=None, warmup=True, profile=True):
+    # In-process only: profiling a socket round trip to the daemon tells us nothing
+    config.RETRIEVAL_DAEMON_ADDRESS = None
+    from backend.model_loader import load_retriever
+    load_retriever()
+
+    seed_everything(seed, threads)
+    if warmup:
+        run_consultation(script, k)  # lazy loads and first-call caches stay out of the profiles
+
+    seed_everything(seed, threads)
+    t0 = time.perf_counter()
+    outcome, trace = run_consultation(script, k)
+    wall_ms = (time.perf_counter() - t0) * 1000
+
+    result = {
+        "source": script["source"],
+        "seed": seed,
+        "exact_script": script["exact"],
+        "wall_ms": wall_ms,
+        "outcome": outcome,
+        "trace": trace.to_dict(),
+        "digests": {"plain": outcome["digest"]},
+    }
+    if script.get("expected_questions") is not None:
+        result["questions_match"] = outcome["questions"] == script["expected_questions"]
+        result["expected_questions"] = script["expected_questions"]
+    if script.get("expected_report") is not None:
+        result["report_matches"] = outcome["report"] == script["expected_report"]
+    if "gold" in script:
+        result["gold"] = script["gold"]
+
+    if profile:
+        seed_everything(seed, threads)
+        out, _, cpu_rows, cpu_text = profile_cpu(script, k, top, pstats_path)
+        result["digests"]["cprofile"] = out["digest"]
+        result["cpu"] = cpu_rows
+        result["cpu_text"] = cpu_text
+
+        seed_everything(seed, threads)
+        out, sampler = profile_stacks(script, k, interval, repeat)
+        result["digests"]["sampler"] = out["digest"]
+        result["collapsed"] = sampler.collapsed()
+        result["samples"] = sampler.samples
+
+        seed_everything(seed, threads)
+        out, mem_rows, peak = profile_memory(script, k, top)
+        result["digests"]["tracemalloc"] = out["digest"]
+        result["allocations"] = mem_rows
+        result["peak_kib"] = peak / 1024
+
+    result["deterministic"] = len(set(result["digests"].values())) == 1
+    return result
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Deterministic consultation replay with profiling")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--session", help="stored session id")
+    src.add_argument("--dxbench", help="DxBench case id")
+    ap.add_argument("--k", type=int, default=8)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--threads", type=int, default=1, help="encoder threads (1 = bit-exact; 0 = library default)")
+    ap.add_argument("--top", type=int, default=25, help="rows in the CPU and allocation top lists")
+    ap.add_argument("--sample-ms", type=float, default=1.0, help="stack sampling interval")
+    ap.add_argument("--repeat", type=int, default=5, help="replays sampled for the flame graph")
+    ap.add_argument("--flame", default=None, help="write collapsed stacks here (flamegraph.pl / speedscope)")
+    ap.add_argument("--pstats", default=None, help="write the raw cProfile stats here (snakeviz)")
+    ap.add_argument("--json", default=None, help="write the full result here")
+    ap.add_argument("--no-profile", action="store_true", help="replay and compare only")
+    ap.add_argument("--no-warmup", action="store_true", help="profile the cold first run")
+    args = ap.parse_args(argv)
+
+    script = load_script(args.session, args.dxbench)
+    res = replay(script, args.k, args.seed, args.threads or None, args.top, args.sample_ms / 1000,
+                 args.repeat, args.pstats, not args.no_warmup, not args.no_profile)
+    out = res["outcome"]
+
+    print(f"Replay of {res['source']} (seed {res['seed']}): {len(out['questions'])} questions, "
+          f"{res['wall_ms']:.1f} ms")
+    if not res["exact_script"]:
+        print("⚠ No trace stored for this session: answers approximated from its symptom list.")
+    for i, q in enumerate(out["questions"], 1):
+        print(f"  Q{i}: {q}")
+    if out["red_flags"]:
+        print(f"  Urgent: {', '.join(out['red_flags'])}")
+    for d, p in out["ranking"][:5]:
+        print(f"  {p:6.1%}  {d}")
+    if "gold" in res:
+        print(f"  Gold: {res['gold']}")
+    if "questions_match" in res:
+        print(f"Questions match the recording: {res['questions_match']}")
+        if not res["questions_match"]:
+            print(f"  recorded: {res['expected_questions']}")
+    if "report_matches" in res:
+        print(f"Report matches the stored report: {res['report_matches']}")
+
+    print(f"\n{'stage':<20}{'calls':>8}{'ms':>10}")
+    for stage, s in res["trace"]["stages"].items():
+        print(f"{stage:<20}{s['calls']:>8}{s['ms']:>10.2f}")
+
+    if "cpu" in res:
+        print(f"\nCPU profile (top {args.top} by cumulative time)")
+        print(f"{'cum ms':>10}{'self ms':>10}{'calls':>9}  function")
+        for r in res["cpu"]:
+            print(f"{r['cumtime_ms']:>10.2f}{r['tottime_ms']:>10.2f}{r['calls']:>9}  {r['function']}")
+        print(f"\nAllocations (top {args.top} sites, peak {res['peak_kib']:.0f} KiB)")
+        for r in res["allocations"]:
+            print(f"{r['kib']:>10.1f} KiB{r['blocks']:>8} blocks  {r['site']}")
+        print(f"\n{res['samples']} stack samples over {args.repeat} replays")
+
+    if args.flame and "collapsed" in res:
+        with open(args.flame, "w") as f:
+            f.write(res["collapsed"])
+        print(f"Collapsed stacks -> {args.flame}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({k: v for k, v in res.items() if k not in ("cpu_text", "collapsed")}, f, indent=2, default=str)
+
+    if not res["deterministic"]:
+        print(f"⚠ Passes disagree: {res['digests']}")
+        sys.exit(1)
+    print(f"Deterministic across passes (digest {out['digest']})")
+
+
+if __name__ == "__main__":
+    main()
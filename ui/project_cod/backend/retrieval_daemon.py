@@ -0,0 +1,326 @@
+# backend/retrieval_daemon.py
+# One process owns the KB, BM25, FAISS index and embedder; Streamlit/API
+# workers query it over a Unix socket (or localhost TCP) instead of each
+# loading their own copy.
+#
+# Usage (from ui/project_cod):
+#   python -m backend.retrieval_daemon --address unix:/tmp/cod-retrieval.sock
+#   COD_RETRIEVAL_DAEMON=unix:/tmp/cod-retrieval.sock streamlit run frontend/streamlit_app.py
+#
+# With config.RETRIEVAL_DAEMON_ADDRESS set, model_loader.hybrid_retrieve and
+# ensure_disease_map go through get_client() transparently.
+#
+# Wire format: 4-byte big-endian length + JSON, both directions, many
+# requests per connection. Queries arriving within RETRIEVAL_DAEMON_LINGER
+# of each other (from any connection) are coalesced into one encoder batch.
+
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from backend import metrics
+
+_HEADER = struct.Struct(">I")
+MAX_MESSAGE = 64 * 1024 * 1024
+
+
+# ---------------------------------------
+# FRAMING
+# ---------------------------------------
+def send_message(sock, obj):
+    data = json.dumps(obj).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        buf += chunk
+    return bytes(buf)
+
+
+def recv_message(sock):
+    (n,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if n > MAX_MESSAGE:
+        raise ConnectionError(f"message too large ({n} bytes)")
+    return json.loads(_recv_exact(sock, n))
+
+
+def parse_address(address):
+    """'unix:/path' or '/path' -> (AF_UNIX, path); 'host:port' -> (AF_INET, (host, port))"""
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    if address.startswith("/"):
+        return socket.AF_UNIX, address
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+# ---------------------------------------
+# BATCHER
+# ---------------------------------------
+class QueryBatcher:
+    """
+    Single thread draining a queue of (query, Future). It takes whatever
+    arrives within `linger` seconds (up to max_batch) and runs it through
+    one hybrid_retrieve_many() call.
+    """
+
+    def __init__(self, retrieve_many, max_batch=None, linger=None):
+        self._retrieve_many = retrieve_many
+        self.max_batch = max_batch or config.RETRIEVAL_DAEMON_MAX_BATCH
+        self.linger = config.RETRIEVAL_DAEMON_LINGER if linger is None else linger
+        self._q = queue.Queue()
+        self.batches = 0
+        self.queries = 0
+        self._thread = threading.Thread(target=self._run, name="retrieval-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, queries):
+        futs = []
+        for q in queries:
+            fut = Future()
+            self._q.put((q, fut))
+            futs.append(fut)
+        return futs
+
+    def _run(self):
+        while True:
+            batch = [self._q.get()]
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._q.get_nowait())
+                    continue
+                except queue.Empty:
+                    pass
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                results = self._retrieve_many([q for q, _ in batch])
+                for (_, fut), res in zip(batch, results):
+                    fut.set_result(res)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                else:
+                    self._run_singly(batch)
+            self.batches += 1
+            self.queries += len(batch)
+
+    def _run_singly(self, batch):
+        # The coalesced call failed: retry one by one so only the bad query's caller sees the error
+        for q, fut in batch:
+            try:
+                fut.set_result(self._retrieve_many([q])[0])
+            except Exception as e:
+                fut.set_exception(e)
+
+
+# ---------------------------------------
+# SERVER
+# ---------------------------------------
+class _Handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        server = self.server
+        while True:
+            try:
+                req = recv_message(self.request)
+            except (ConnectionError, OSError, ValueError):
+                return
+            try:
+                resp = server.handle_request_message(req)
+            except Exception as e:
+                resp = {"error": f"{type(e).__name__}: {e}"}
+            try:
+                send_message(self.request, resp)
+            except OSError:
+                return
+
+
+class _DaemonMixin:
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128  # every front-end thread holds its own connection
+
+    def setup_daemon(self, state_getter, batcher):
+        self._state = state_getter
+        self.batcher = batcher
+
+    def handle_request_message(self, req):
+        op = req.get("op")
+        if op == "retrieve":
+            futs = self.batcher.submit(req.get("queries", []))
+            return {"results": [f.result() for f in futs]}
+        if op == "disease_map":
+            return {"disease_map": dict(self._state().disease_symptom_map)}
+        if op == "ping":
+            return {"ok": True}
+        if op == "stats":
+            b = self.batcher
+            return {"batches": b.batches, "queries": b.queries,
+                    "mean_batch": b.queries / b.batches if b.batches else 0.0,
+                    "metrics": metrics.to_json()}
+        return {"error": f"unknown op {op!r}"}
+
+
+class UnixRetrievalServer(_DaemonMixin, socketserver.ThreadingUnixStreamServer):
+    pass
+
+
+class TCPRetrievalServer(_DaemonMixin, socketserver.ThreadingTCPServer):
+    pass
+
+
+def make_server(address, state=None, max_batch=None, linger=None):
+    """Binds the daemon; state defaults to the process-wide retriever (loaded now)."""
+    from backend import model_loader
+
+    state_getter = (lambda: state) if state is not None else model_loader.load_retriever
+    state_getter()  # load before accepting connections
+
+    # Snapshot per batch, so a reload never mixes indexes within one batch
+    batcher = QueryBatcher(lambda qs: model_loader.hybrid_retrieve_many(qs, state_getter()),
+                           max_batch, linger)
+
+    family, addr = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(addr):
+            os.unlink(addr)  # stale socket from a previous run
+        server = UnixRetrievalServer(addr, _Handler)
+    else:
+        server = TCPRetrievalServer(addr, _Handler)
+    server.setup_daemon(state_getter, batcher)
+    return server
+
+
+# ---------------------------------------
+# CLIENT
+# ---------------------------------------
+class RetrievalClient:
+    """Thread-safe client; one persistent connection per calling thread."""
+
+    def __init__(self, address, timeout=None):
+        self.address = address
+        self.timeout = config.RETRIEVAL_DAEMON_TIMEOUT if timeout is None else timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        family, addr = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(addr)
+        if family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def request(self, obj):
+        # One reconnect: the daemon may have restarted since the last call
+        for attempt in range(2):
+            sock = getattr(self._local, "sock", None)
+            try:
+                if sock is None:
+                    sock = self._local.sock = self._connect()
+                send_message(sock, obj)
+                resp = recv_message(sock)
+                break
+            except (OSError, ValueError):
+                self.close()
+                if attempt:
+                    raise
+        if "error" in resp:
+            raise RuntimeError(f"retrieval daemon: {resp['error']}")
+        return resp
+
+    def close(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def retrieve_many(self, queries):
+        return self.request({"op": "retrieve", "queries": queries})["results"]
+
+    def retrieve(self, symptoms, k=6, alpha=0.6, lang="en", bm25_fallback=None):
+        """Same contract as model_loader.hybrid_retrieve."""
+        from backend.model_loader import FALLBACK_PENDING
+
+        q = {"symptoms": symptoms, "k": k, "alpha": alpha, "lang": lang}
+        if bm25_fallback is not None:
+            q["bm25_fallback"] = FALLBACK_PENDING if callable(bm25_fallback) else bm25_fallback
+        res = self.retrieve_many([q])[0]
+        if res is None:
+            # BM25 found nothing in the raw text: now pay for the fallback
+            q["bm25_fallback"] = bm25_fallback()
+            res = self.retrieve_many([q])[0]
+        return res
+
+    def disease_map(self):
+        return self.request({"op": "disease_map"})["disease_map"]
+
+    def stats(self):
+        return self.request({"op": "stats"})
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(address):
+    client = _clients.get(address)
+    if client is None:
+        with _clients_lock:
+            client = _clients.setdefault(address, RetrievalClient(address))
+    return client
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Shared retrieval daemon")
+    ap.add_argument("--address", default=config.RETRIEVAL_DAEMON_ADDRESS or "unix:/tmp/cod-retrieval.sock")
+    ap.add_argument("--max-batch", type=int, default=config.RETRIEVAL_DAEMON_MAX_BATCH)
+    ap.add_argument("--linger-ms", type=float, default=config.RETRIEVAL_DAEMON_LINGER * 1000)
+    args = ap.parse_args(argv)
+
+    # This process is the index owner; never forward to ourselves
+    config.RETRIEVAL_DAEMON_ADDRESS = None
+
+    t0 = time.perf_counter()
+    server = make_server(args.address, max_batch=args.max_batch, linger=args.linger_ms / 1000)
+    print(f"Retrieval daemon on {args.address} (loaded in {time.perf_counter() - t0:.1f}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        family, addr = parse_address(args.address)
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.unlink(addr)
+
+
+if __name__ == "__main__":
+    main()
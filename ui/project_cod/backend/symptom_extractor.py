@@ -0,0 +1,193 @@
+# backend/symptom_extractor.py
+# Phrase-trie symptom extractor built from the KB vocabulary.
+#
+# Every short symptom phrase in disease_symptom_map (split the same way as
+# candidate_symptom_pool) plus config.SYMPTOM_SYNONYMS is compiled into a
+# word-level trie. Extraction tokenises the text once and walks the trie
+# from each token, keeping the longest match (leftmost-longest, no overlaps),
+# so "chest pain" wins over "pain" and "pain" never matches inside "painting".
+# Work is linear in the input length (phrases are capped at MAX_PHRASE_WORDS).
+
+import os
+import re
+import threading
+
+try:
+    import config
+except ImportError:
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import config
+
+MAX_PHRASE_WORDS = 4
+
+_WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+_SPLIT = re.compile(r"[;,.\n•\-/()]+")
+_CLAUSE = re.compile(r"[;,.!?\n]+|\bbut\b|\bhowever\b")
+
+# Dropped from the ends of KB phrases ("and fever" -> "fever")
+_EDGE_STOP = {
+    "and", "or", "of", "the", "a", "an", "with", "in", "on", "to", "at", "by",
+    "for", "from", "is", "are", "may", "can", "be", "as", "etc", "such", "other",
+}
+# Severity/timing qualifiers stripped from the front so "severe headache" -> "headache"
+_QUALIFIERS = {"severe", "mild", "moderate", "acute", "chronic", "persistent", "recurrent", "occasional", "sudden"}
+# Never a symptom on their own
+_SINGLE_STOP = {
+    "severe", "mild", "moderate", "local", "localized", "acute", "chronic", "general",
+    "symptoms", "symptom", "signs", "sign", "patients", "patient", "disease", "common",
+    "often", "usually", "sometimes", "left", "right", "upper", "lower", "early", "late",
+    "stage", "loss", "increased", "decreased", "abnormal", "high", "low", "body",
+    "history", "onset", "persistent", "recurrent", "significant", "obvious", "rare",
+    # who the patient is
+    "male", "female", "man", "men", "woman", "women", "boy", "girl", "child", "children",
+    "infant", "neonate", "adult", "elderly", "other", "case", "group", "weight",
+    # where, not what: a bare body part is never a finding
+    "abdomen", "ankle", "anus", "arm", "armpit", "axillae", "back", "bone", "buttock", "calves",
+    "cartilage", "cheek", "chest", "cord", "ear", "elbow", "epigastrium", "eye", "face", "feet",
+    "finger", "fingernail", "foot", "forearm", "forehead", "gallbladder", "genital", "groin",
+    "gum", "hair", "hand", "head", "heel", "hip", "jaw", "joint", "knee", "leg", "limb", "liver",
+    "lung", "mouth", "muscle", "neck", "nerve", "nipple", "nose", "ovaries", "palm", "penis",
+    "perineum", "pharynx", "scalp", "sclera", "scrotum", "shin", "shoulder", "skin", "sole",
+    "spine", "spleen", "tendon", "testicle", "thigh", "thorax", "thumb", "toe", "tongue",
+    "trunk", "underarm", "ureter", "urethra", "uterus", "vagina", "vulva", "waist", "wrist",
+}
+
+NEGATION_CUES = {"no", "not", "never", "without", "denies", "deny", "don't", "didn't", "doesn't", "haven't", "hasn't", "none"}
+NEGATION_WINDOW = 3
+
+
+def _norm(word):
+    # Cheap plural folding, applied to both vocabulary and input
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _tokens(text):
+    return [_norm(w) for w in _WORD.findall((text or "").lower())]
+
+
+class SymptomExtractor:
+
+    def __init__(self, phrases=(), synonyms=None):
+        self._root = {}
+        for p in phrases:
+            self.add(p)
+        for variant, canonical in (synonyms or {}).items():
+            self.add(variant, canonical)
+
+    def add(self, phrase, canonical=None):
+        words = _tokens(phrase)
+        if not words or len(words) > MAX_PHRASE_WORDS:
+            return
+        node = self._root
+        for w in words:
+            node = node.setdefault(w, {})
+        # First canonical form wins; explicit synonyms override KB spellings
+        if canonical is not None or None not in node:
+            node[None] = (canonical or phrase).strip().lower()
+
+    def _matches(self, toks):
+        """Yields (start, end, canonical) for leftmost-longest matches."""
+        i, n = 0, len(toks)
+        while i < n:
+            node = self._root
+            best = None
+            j = i
+            while j < n and j - i < MAX_PHRASE_WORDS:
+                node = node.get(toks[j])
+                if node is None:
+                    break
+                j += 1
+                if None in node:
+                    best = (j, node[None])
+            if best:
+                yield i, best[0], best[1]
+                i = best[0]
+            else:
+                i += 1
+
+    def extract(self, text):
+        """Canonical symptom phrases mentioned in text, in order, de-duplicated."""
+        out = []
+        for _, _, canon in self._matches(_tokens(text)):
+            if canon not in out:
+                out.append(canon)
+        return out
+
+    def extract_with_negation(self, text):
+        """
+        (present, negated): a phrase counts as negated when a negation cue
+        appears within NEGATION_WINDOW words before it in the same clause.
+        """
+        present, negated = [], []
+        for clause in _CLAUSE.split((text or "").lower()):
+            toks = _tokens(clause)
+            for start, _, canon in self._matches(toks):
+                window = toks[max(0, start - NEGATION_WINDOW):start]
+                target = negated if any(w in NEGATION_CUES for w in window) else present
+                if canon not in target:
+                    target.append(canon)
+        present = [p for p in present if p not in negated]
+        return present, negated
+
+
+def kb_phrases(disease_map):
+    """Short symptom phrases from the KB, split like candidate_symptom_pool."""
+    seen = set()
+    for txt in disease_map.values():
+        for part in _SPLIT.split(txt or ""):
+            words = part.strip().lower().split()
+            if words and words[0] in NEGATION_CUES:
+                continue  # "no fever" describes an absent finding
+            while words and (words[0] in _EDGE_STOP or words[0] in _QUALIFIERS):
+                words.pop(0)
+            while words and words[-1] in _EDGE_STOP:
+                words.pop()
+            if not words or len(words) > MAX_PHRASE_WORDS:
+                continue
+            if len(words) == 1 and (_norm(words[0]) in _SINGLE_STOP or words[0] in _SINGLE_STOP
+                                    or len(words[0]) < 3):
+                continue
+            if not any(c.isalpha() for c in words[0]):
+                continue
+            phrase = " ".join(words)
+            if phrase not in seen:
+                seen.add(phrase)
+                yield phrase
+
+
+def build_extractor(disease_map):
+    return SymptomExtractor(kb_phrases(disease_map), config.SYMPTOM_SYNONYMS)
+
+
+# ---------------------------------------
+# SHARED INSTANCE (rebuilt when the KB is swapped)
+# ---------------------------------------
+_extractor = None
+_listening = False
+_lock = threading.Lock()
+
+
+def get_extractor():
+    global _extractor, _listening
+    if _extractor is None:
+        with _lock:
+            if _extractor is None:
+                from backend.model_loader import ensure_disease_map, get_loader
+                if not _listening:
+                    get_loader().add_listener(reset_extractor)
+                    _listening = True
+                _extractor = build_extractor(ensure_disease_map())
+    return _extractor
+
+
+def reset_extractor(state=None):
+    """Loader listener: drop the trie so the next call rebuilds it from the new KB."""
+    global _extractor
+    _extractor = None
+
+
+def extract_symptoms(text):
+    return get_extractor().extract(text)
@@ -0,0 +1,158 @@
+import sys
+import os
+import json
+import re
+import tempfile
+import threading
+import time
+import urllib.request
+import urllib.error
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+KB = {
+    "Influenza": "fever, cough, body aches, fatigue, headache",
+    "Common Cold": "cough, runny nose, sneezing, sore throat, mild fever",
+    "Asthma": "shortness of breath, wheezing, chest tightness, cough",
+    "Migraine": "headache, nausea, sensitivity to light, dizziness",
+}
+
+
+def _hermetic():
+    """Throwaway database and a four-disease KB instead of the real build."""
+    import faiss
+    import pandas as pd
+    from types import MappingProxyType
+    from rank_bm25 import BM25Okapi
+    from backend.bench_scaling import HashingEmbedder
+    from backend.model_loader import RetrieverState, get_loader
+
+    config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), "api_test.db")
+    df = pd.DataFrame({"disease": list(KB), "symptom_text": list(KB.values())})
+    tokenized = [re.findall(r"\w+", t.lower()) for t in df["symptom_text"]]
+    embedder = HashingEmbedder()
+    embs = embedder.encode(df["symptom_text"].tolist())
+    faiss.normalize_L2(embs)
+    index = faiss.IndexFlatIP(embedder.dim)
+    index.add(embs)
+    get_loader().set_state(RetrieverState(df, MappingProxyType(KB), BM25Okapi(tokenized), tokenized, index, embedder))
+
+
+# Before importing the API: diagnosis_engine reads the disease map at import
+_hermetic()
+
+from backend import api_server
+from backend.api_server import EnginePool, Saturated, DiagnosisAPI, make_server
+
+
+def _call(base, method, path, body=None):
+    data = None if body is None else json.dumps(body).encode()
+    req = urllib.request.Request(base + path, data=data, method=method,
+                                 headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req) as r:
+            return r.status, json.loads(r.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_pool_backpressure():
+    pool = EnginePool(workers=1, max_pending=0, timeout=2)
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        time.sleep(0.3)
+        return "done"
+
+    t = threading.Thread(target=pool.run, args=(slow,))
+    t.start()
+    started.wait()
+    try:
+        pool.run(lambda: None)
+        assert False, "expected Saturated"
+    except Saturated:
+        print("Saturated pool rejected the second job")
+    t.join()
+    assert pool.run(lambda: 42) == 42
+
+
+def test_answer_timeout_keeps_lock():
+    api = DiagnosisAPI(pool=EnginePool(workers=1, max_pending=1, timeout=0.1))
+    c = api_server.Consultation("", "", "", "fever", "fever", "en")
+    c.question = "cough"
+    api.store.add(c)
+    release = threading.Event()
+    real = api_server.answer_question
+    api_server.answer_question = lambda c, body: release.wait(5)
+    try:
+        try:
+            api.dispatch("POST", f"/consultations/{c.id}/answer", {}, {"answer": "yes"})
+            assert False, "expected a timeout"
+        except api_server.FutureTimeout:
+            pass
+        # The first job is still running: the consultation stays locked
+        assert c.lock.locked()
+        release.set()
+        deadline = time.monotonic() + 2
+        while c.lock.locked() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not c.lock.locked()
+    finally:
+        release.set()
+        api_server.answer_question = real
+
+    c.question = None
+    try:
+        api.dispatch("POST", f"/consultations/{c.id}/answer", {}, {"answer": "yes"})
+        assert False, "expected 409"
+    except api_server.ApiError as e:
+        assert e.status == 409
+    print("Timed-out answer held the consultation lock until its job finished")
+
+
+def test_consultation_over_http():
+    server = make_server("127.0.0.1", 0, DiagnosisAPI(pool=EnginePool(2, 2)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        status, c = _call(base, "POST", "/consultations",
+                          {"name": "API Test", "age": "30", "gender": "F", "symptoms": "fever and cough"})
+        assert status == 201, c
+        rounds = 0
+        while c["status"] == "question" and rounds < 20:
+            status, c = _call(base, "POST", f"/consultations/{c['id']}/answer", {"answer": "yes"})
+            assert status == 200, c
+            rounds += 1
+
+        status, r = _call(base, "GET", f"/consultations/{c['id']}/report")
+        print(f"Finished after {rounds} answers, lead: {r['lead']}")
+        assert status == 200 and r["report"]
+
+        # Engine trace: live on the consultation, and stored with the saved session
+        status, trace = _call(base, "GET", f"/consultations/{c['id']}/trace")
+        kinds = [e["kind"] for e in trace["events"]]
+        print(f"Trace: {len(kinds)} events, stages {sorted(trace['stages'])}")
+        assert status == 200 and "retrieve" in kinds and "report" in kinds
+        assert kinds.count("answer") == rounds
+        api_server.database.flush_sessions()
+        status, stored = _call(base, "GET", f"/sessions/{c['session_id']}/trace")
+        assert status == 200 and stored["events"] == trace["events"]
+
+        status, urgent = _call(base, "POST", "/consultations", {"symptoms": "crushing chest pain"})
+        assert urgent["status"] == "urgent"
+        assert _call(base, "GET", "/consultations/nope")[0] == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+        api_server.database.flush_sessions()
+
+
+if __name__ == "__main__":
+    test_pool_backpressure()
+    test_answer_timeout_keeps_lock()
+    test_consultation_over_http()
+    print("✓ API server tests passed")
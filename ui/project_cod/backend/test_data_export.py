@@ -0,0 +1,76 @@
+import sys
+import os
+import tempfile
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from backend import database, data_export
+
+
+def _use_temp_db():
+    config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), "patients_test.db")
+    database.init_db()
+    return config.DATABASE_PATH
+
+
+def _round_trip(fmt):
+    # Source DB: two sessions for Alice, one anonymous
+    _use_temp_db()
+    report = "### Report\n" + "- fever and cough\n" * 50
+    trace = {"v": 1, "stages": {"bm25": {"calls": 2, "ms": 0.8}}, "counters": {},
+             "events": [{"t": 0.0, "kind": "start", "text": "fever since monday"}]}
+    s1 = database.save_session("Alice Smith", "55", "F", ["fever"], {"Influenza": 0.7, "Common Cold": 0.3},
+                               report, "fever since monday", questions_asked=3, trace=trace)
+    s2 = database.save_session("Alice Smith", "55", "F", ["cough"], {"Asthma": 0.6}, "r2")
+    s3 = database.save_session("", "40", "M", ["headache"], {"Migraine": 0.8}, "r3")
+    src_alice = database.find_patient("Alice Smith", "55", "F")
+
+    out_dir = tempfile.mkdtemp()
+    counts = data_export.export_tables(out_dir, fmt)
+    print(f"{fmt} export: {counts}")
+    assert counts == {"patients": 2, "sessions": 3, "session_diagnoses": 4}
+
+    # Target DB already knows Alice under another id
+    _use_temp_db()
+    database.save_session("Alice Smith", "55", "F", ["rash"], {"Eczema": 0.9}, "r0")
+    dst_alice = database.find_patient("Alice Smith", "55", "F")
+    assert dst_alice != src_alice
+
+    counts = data_export.import_tables(out_dir, fmt)
+    print(f"{fmt} import: {counts}")
+    assert counts == {"patients": 1, "sessions": 3, "session_diagnoses": 4}
+
+    # Alice's imported sessions were folded into the existing identity
+    rows, _ = database.get_patient_sessions(dst_alice)
+    assert {r[0] for r in rows} >= {s1, s2}
+    n = database.get_connection().execute(
+        "SELECT COUNT(*) FROM patients WHERE id = ?", (src_alice,)).fetchone()[0]
+    assert n == 0
+
+    assert database.get_session(s1)["final_report"] == report
+    assert database.get_session_trace(s1) == trace
+    assert database.get_session_trace(s2) is None
+    asked = database.get_connection().execute(
+        "SELECT questions_asked FROM sessions WHERE id = ?", (s1,)).fetchone()[0]
+    assert asked == 3
+    assert database.get_session(s3) is not None
+    assert [h[0] for h in database.search_sessions("monday")] == [s1]
+
+    # A second import of the same files changes nothing
+    assert set(data_export.import_tables(out_dir, fmt).values()) == {0}
+
+
+def test_parquet_round_trip():
+    _round_trip("parquet")
+
+
+def test_arrow_round_trip():
+    _round_trip("arrow")
+
+
+if __name__ == "__main__":
+    test_parquet_round_trip()
+    test_arrow_round_trip()
+    print("✓ Data export tests passed")
@@ -0,0 +1,265 @@
+import sys
+import os
+import tempfile
+import threading
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from backend import database
+
+
+def _use_temp_db():
+    config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), "patients_test.db")
+    return config.DATABASE_PATH
+
+
+def test_schema_and_wal():
+    _use_temp_db()
+    database.init_db()
+    database.init_db()  # second call is a no-op
+
+    conn = database.get_connection()
+    mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    print(f"journal_mode: {mode}, schema version: {database.schema_version()}")
+    assert mode == "wal"
+    assert database.schema_version() == database.MIGRATIONS[-1][0]
+    assert conn is database.get_connection()
+
+
+def test_concurrent_saves():
+    _use_temp_db()
+    errors = []
+
+    def worker(n):
+        try:
+            for i in range(20):
+                database.save_session(f"P{n}", "30", "M", ["fever"], {"Flu": 0.8}, "report")
+        except Exception as e:
+            errors.append(e)
+        finally:
+            database.close_connection()
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    rows = database.get_sessions_summary()
+    print(f"Saved {len(rows)} sessions, errors: {errors}")
+    assert not errors
+    assert len(rows) == 80
+
+
+def test_paginated_history():
+    _use_temp_db()
+    for i in range(7):
+        database.save_session(f"P{i}", "40", "F", ["cough"], {"Asthma": 0.6}, f"report {i}")
+
+    seen = []
+    cursor = None
+    while True:
+        rows, cursor = database.get_sessions_page(limit=3, cursor=cursor)
+        assert all(len(r) == 4 for r in rows)  # no report bodies in the summary
+        seen.extend(r[0] for r in rows)
+        if cursor is None:
+            break
+
+    print(f"Walked {len(seen)} sessions in pages of 3")
+    assert len(seen) == len(set(seen)) == 7
+    assert database.get_session_report(seen[0]) == "report 6"
+
+
+def test_write_behind_queue():
+    _use_temp_db()
+    writer = database.SessionWriter(max_queue=8, max_batch=5)
+    ids = []
+    for i in range(30):
+        rec = database._build_session_record(f"Q{i}", "50", "M", ["rash"], {}, "r")
+        writer.submit(rec)
+        ids.append(rec["session_id"])
+    writer.close()  # flushes before stopping
+
+    rows, _ = database.get_sessions_page(limit=100)
+    print(f"Write-behind persisted {len(rows)} sessions, failed: {len(writer.failed)}")
+    assert {r[0] for r in rows} == set(ids)
+    assert not writer.failed
+
+
+def test_full_text_search():
+    _use_temp_db()
+    database.save_session("Alice", "55", "F", ["chest pain", "sweating"], {}, "Myocardial infarction likely")
+    sid = database.save_session("Bob", "20", "M", ["fever", "cough"], {}, "Influenza likely")
+
+    hits = database.search_sessions("chest")
+    print(f"'chest' -> {[h[2] for h in hits]}")
+    assert [h[2] for h in hits] == ["Alice"]
+    assert [h[0] for h in database.search_sessions("influ")] == [sid]
+    assert database.search_sessions('"( AND') == []
+
+    # Patient text in a snippet is escaped; only the match markers become markup
+    xss = database.save_session("<b>Eve</b>", "30", "F", ["rash"], {}, "<script>alert(1)</script> eczema flare")
+    snippet = database.search_sessions("eczema")[0][4]
+    assert database.snippet_html(snippet) == "&lt;script&gt;alert(1)&lt;/script&gt; <mark>eczema</mark> flare"
+    database.delete_session(xss)
+
+    database.delete_session(sid)
+    assert database.search_sessions("influenza") == []
+
+    # Other tools (no cod_text UDF) can still write to sessions
+    report = "Pneumonia likely\n" + "- productive cough\n" * 100
+    pid = database.save_session("Carol", "60", "F", ["fever"], {}, report)
+    import sqlite3
+    raw = sqlite3.connect(config.DATABASE_PATH)
+    raw.execute("UPDATE sessions SET symptoms = 'fever, rigors' WHERE id = ?", (pid,))
+    raw.execute("INSERT INTO sessions (id, symptoms, final_report) VALUES ('cli', 'rash', 'Eczema')")
+    raw.commit()
+    assert [h[0] for h in database.search_sessions("rigors")] == [pid]
+    assert [h[0] for h in database.search_sessions("productive")] == [pid]
+    raw.execute("DELETE FROM sessions WHERE id = ?", (pid,))
+    raw.commit()
+    raw.close()
+    assert database.search_sessions("productive") == []
+
+
+def test_search_index_migration():
+    # A v8 database (UDF triggers) is re-indexed by v9 without losing rows
+    _use_temp_db()
+    saved = database.MIGRATIONS
+    database.MIGRATIONS = [m for m in saved if m[0] <= 8]
+    try:
+        sid = database.save_session("Dana", "40", "F", ["wheezing"], {"Asthma": 0.8},
+                                    "Asthma likely\n" + "- wheeze\n" * 100, questions_asked=4)
+    finally:
+        database.MIGRATIONS = saved
+    database.close_connection()
+    database._schema_ready.discard(config.DATABASE_PATH)
+
+    assert database.schema_version() == database.MIGRATIONS[-1][0]
+    assert [h[0] for h in database.search_sessions("asthma")] == [sid]
+    assert [h[0] for h in database.search_sessions("dana")] == [sid]
+    # ... and the v10 rollups are backfilled from it
+    start, end = "2000-01-01", "2100-01-01"
+    assert database.question_count_stats(start, end)["histogram"] == [(4, 1)]
+    assert database.confidence_distribution(start, end) == [(0.8, 1)]
+
+
+def test_patient_dedup():
+    _use_temp_db()
+    database.save_session("Alice Smith", "55", "F", ["chest pain"], {}, "r1")
+    database.save_session("  alice   SMITH ", "55", "Female", ["sweating"], {}, "r2")
+    database.save_session("Alice Smith", "56", "F", ["cough"], {}, "r3")
+    database.save_session("", "55", "F", ["cough"], {}, "r4")
+    database.save_session("", "55", "F", ["cough"], {}, "r5")
+
+    pid = database.find_patient("alice smith", "55", "F")
+    rows, cursor = database.get_patient_sessions(pid)
+    n_patients = database.get_connection().execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+    print(f"Alice sessions: {len(rows)}, patients: {n_patients}")
+    assert len(rows) == 2 and cursor is None
+    assert n_patients == 4  # Alice@55, Alice@56, two anonymous
+
+
+def test_compression_and_archive():
+    _use_temp_db()
+    report = "### Diagnostic Reasoning Report\n" + "- fever and productive cough\n" * 100
+    sid = database.save_session("Carol", "60", "F", ["fever"], {"Pneumonia": 0.7}, report, "cough for a week")
+
+    stored = database.get_connection().execute(
+        "SELECT final_report FROM sessions WHERE id = ?", (sid,)).fetchone()[0]
+    print(f"Report: {len(report)} chars -> {len(stored)} bytes stored")
+    assert isinstance(stored, bytes) and len(stored) < len(report) // 5
+    assert database.get_session_report(sid) == report
+    assert [h[0] for h in database.search_sessions("productive")] == [sid]
+
+    path, n = database.archive_sessions(older_than_days=-1, archive_dir=os.path.dirname(config.DATABASE_PATH))
+    assert n == 1 and os.path.exists(path)
+    assert database.get_session(sid) is None
+    assert database.search_sessions("productive") == []
+    database.compact()
+
+    # The codec is used from many threads at once (writer, API handlers, export)
+    texts = [f"report {i}\n" + f"- symptom {i}\n" * 200 for i in range(8)]
+    errors = []
+
+    def codec_round_trips(text):
+        try:
+            for _ in range(50):
+                assert database.decode_text(database.encode_text(text)) == text
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=codec_round_trips, args=(t,)) for t in texts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+
+
+def test_diagnosis_analytics():
+    _use_temp_db()
+    database.save_session("A", "30", "M", ["fever"], {"Influenza": 0.7, "Common Cold": 0.3}, "r", questions_asked=3)
+    database.save_session("B", "31", "M", ["fever"], {"Influenza": 0.55, "COVID-19": 0.45}, "r", questions_asked=5)
+    sid = database.save_session("C", "32", "F", ["cough"], {"Asthma": 0.9, "Influenza": 0.1}, "r", questions_asked=3)
+
+    start, end = "2000-01-01", "2100-01-01"
+    top = database.top_diagnoses(start, end)
+    print(f"Top diagnoses: {top}")
+    assert top[0][0] == "Influenza" and top[0][1] == 2
+    assert abs(top[0][2] - 0.625) < 1e-9
+    assert database.question_count_stats(start, end)["histogram"] == [(3, 2), (5, 1)]
+    assert sum(n for _, n in database.confidence_distribution(start, end)) == 3
+
+    # Deleting a session cascades into the rollups
+    database.delete_session(sid)
+    assert [d for d, _, _ in database.top_diagnoses(start, end)] == ["Influenza"]
+    mentions = sum(m for _, _, m in database.diagnosis_trend("Influenza", start, end))
+    assert mentions == 2
+
+    assert database.question_count_stats(start, end)["histogram"] == [(3, 1), (5, 1)]
+    assert sum(n for _, n in database.confidence_distribution(start, end)) == 2
+
+    # Archiving moves sessions out of the live DB but keeps them in every analytic
+    def snapshot():
+        return (database.get_connection().execute("SELECT * FROM diagnosis_daily ORDER BY day, disease").fetchall(),
+                database.top_diagnoses(start, end), database.question_count_stats(start, end),
+                database.confidence_distribution(start, end), database.confidence_distribution(start, end, bins=4))
+    before = snapshot()
+    _, n = database.archive_sessions(older_than_days=-1, archive_dir=os.path.dirname(config.DATABASE_PATH))
+    assert n == 2 and snapshot() == before
+    assert [d for d, _, _ in database.top_diagnoses(start, end)] == ["Influenza"]
+    assert database.confidence_distribution(start, end) == [(0.5, 1), (0.7, 1)]
+
+
+
+def test_session_trace():
+    _use_temp_db()
+    database.init_db()
+    trace = {
+        "v": 1, "stages": {"bm25": {"calls": 3, "ms": 1.2}}, "counters": {},
+        "events": [{"t": float(i), "kind": "retrieve", "query": "fever, cough " * 10,
+                    "top": [["Influenza", 0.91], ["Common Cold", 0.62]]} for i in range(50)],
+    }
+    sid = database.save_session("Trace", 30, "M", ["fever"], {"Influenza": 0.9}, "report", trace=trace)
+    plain = database.save_session("NoTrace", 30, "M", ["fever"], {"Influenza": 0.9}, "report")
+
+    assert database.get_session_trace(sid) == trace
+    assert database.get_session(sid)["trace"] == trace
+    assert database.get_session_trace(plain) is None
+    stored = database.get_connection().execute("SELECT length(trace) FROM sessions WHERE id = ?", (sid,)).fetchone()[0]
+    print(f"Trace: {len(str(trace))} chars -> {stored} bytes stored")
+    assert stored < len(str(trace)) / 4
+
+
+if __name__ == "__main__":
+    test_schema_and_wal()
+    test_concurrent_saves()
+    test_paginated_history()
+    test_write_behind_queue()
+    test_full_text_search()
+    test_search_index_migration()
+    test_patient_dedup()
+    test_compression_and_archive()
+    test_diagnosis_analytics()
+    test_session_trace()
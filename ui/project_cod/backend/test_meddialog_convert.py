@@ -0,0 +1,92 @@
+import sys
+import os
+import json
+import tempfile
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import meddialog_convert as mc
+
+DIALOGUES = [
+    {"description": "fever", "utterances": ["patient: I have a fever and cough, no rash.",
+                                            "doctor: sounds like influenza, rest and fluids."]},
+    {"description": "x", "utterances": ["patient: headache {with braces} and \"quotes\"", "doctor: migraine likely"]},
+    {"description": "no doctor", "utterances": ["patient: just a question"]},
+]
+
+
+def _write(text):
+    fd, path = tempfile.mkstemp(suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+
+def test_streaming_reader():
+    array = _write(json.dumps(DIALOGUES, indent=2))
+    jsonl = _write("\n".join(json.dumps(d) for d in DIALOGUES) + "\n")
+    # A chunk far smaller than one dialogue forces every object across reads
+    for path in (array, jsonl):
+        for chunk in (7, 64, 1 << 20):
+            assert list(mc.iter_dialogues(path, chunk_size=chunk)) == DIALOGUES
+    assert list(mc.iter_dialogues(_write("[]"))) == []
+
+
+def test_split_turns_and_sample():
+    src, tgt = mc.split_turns(DIALOGUES[0])
+    assert src.startswith("I have a fever") and tgt.startswith("sounds like influenza")
+    assert mc.split_turns({"turns": [{"speaker": "Patient", "utterance": "cough"},
+                                     {"speaker": "Doctor", "utterance": "asthma"}]}) == ("cough", "asthma")
+    assert mc.split_turns(DIALOGUES[2])[1] == ""
+
+    disease_map = {"Influenza": "fever, cough, body aches", "Common Cold": "cough, runny nose"}
+    sample = mc.build_sample(src, tgt, ["Common Cold", "Influenza"], ["fever", "cough"], ["rash"], disease_map)
+    print(sample["input"])
+    assert sample["input"] == ("Patient Symptoms: fever, cough.\nNegative Findings: rash.\n"
+                               "Candidates: Common Cold, Influenza.")
+    out = json.loads(sample["output"])
+    assert out["step_5_decision_making"]["disease"] == "Influenza"
+    assert out["step_4_confidence_assessment"]["scores"] == {"Influenza": 0.8, "Common Cold": 0.2}
+
+    # No extracted symptoms: fall back to the KB phrases of the candidates
+    fallback = mc.build_sample(src, "see a doctor", ["Common Cold", "Influenza"], [], [], disease_map)
+    assert "Patient Symptoms: cough, runny nose, fever, body aches." in fallback["input"]
+    assert json.loads(fallback["output"])["step_5_decision_making"]["disease"] == "Unknown"
+
+
+def test_shards_and_resume():
+    out_dir = tempfile.mkdtemp()
+    settings = {"inputs": ["a.json"], "k": 15, "shard_size": 2, "limit": None}
+    progress = mc._start_progress(out_dir, settings, resume=False)
+    writer = mc.ShardWriter(out_dir, 2, progress)
+    for idx in (0, 1, 3):
+        writer.write(idx, json.dumps({"i": idx}))
+
+    # Interrupted here: one full shard committed, the second still .tmp
+    stored = mc.load_progress(out_dir)
+    assert stored["consumed"] == 2 and stored["samples"] == 2 and not stored["complete"]
+    assert os.path.exists(os.path.join(out_dir, "shard-00001.jsonl.tmp"))
+
+    try:
+        mc._start_progress(out_dir, settings, resume=False)
+        raise AssertionError("expected a refusal without --resume")
+    except SystemExit:
+        pass
+
+    progress = mc._start_progress(out_dir, settings, resume=True)
+    assert not os.path.exists(os.path.join(out_dir, "shard-00001.jsonl.tmp"))
+    writer = mc.ShardWriter(out_dir, 2, progress)
+    writer.write(3, json.dumps({"i": 3}))
+    writer.finish(5)
+
+    final = mc.load_progress(out_dir)
+    assert final["complete"] and final["consumed"] == 5 and final["samples"] == 3
+    assert [s["file"] for s in final["shards"]] == ["shard-00000.jsonl", "shard-00001.jsonl"]
+
+
+if __name__ == "__main__":
+    test_streaming_reader()
+    test_split_turns_and_sample()
+    test_shards_and_resume()
+    print("✓ MedDialog conversion tests passed")
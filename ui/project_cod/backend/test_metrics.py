@@ -0,0 +1,82 @@
+import sys
+import os
+import time
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import metrics
+
+
+def _fresh():
+    metrics.REGISTRY.reset()
+    metrics.set_enabled(True)
+
+
+def test_timer_counter_export():
+    _fresh()
+    with metrics.timer("cod_stage_seconds", stage="bm25"):
+        time.sleep(0.002)
+    metrics.inc("cod_translation_cache_total", 3, result="lru_hit")
+
+    data = metrics.to_json()
+    series = data["cod_stage_seconds"]["series"][0]
+    assert series["labels"] == {"stage": "bm25"} and series["count"] == 1
+    assert series["sum"] >= 0.002 and series["buckets"]["+Inf"] == 1
+    assert data["cod_translation_cache_total"]["series"][0]["value"] == 3
+
+    text = metrics.prometheus_text()
+    print(text)
+    assert "# TYPE cod_stage_seconds histogram" in text
+    assert 'cod_stage_seconds_bucket{stage="bm25",le="+Inf"} 1' in text
+    assert 'cod_translation_cache_total{result="lru_hit"} 3' in text
+
+    # Label values are escaped per the text format
+    metrics.inc("cod_api_responses_total", status='C:\\tmp "x"\nnext')
+    assert 'cod_api_responses_total{status="C:\\\\tmp \\"x\\"\\nnext"} 1' in metrics.prometheus_text()
+
+
+def test_timed_decorator():
+    _fresh()
+
+    @metrics.timed("cod_stage_seconds", stage="scoring")
+    def work(x):
+        return x * 2
+
+    assert work(2) == 4 and work.__name__ == "work"
+    assert metrics.REGISTRY.histogram("cod_stage_seconds", stage="scoring").count == 1
+
+    # Registry.reset() must not orphan the decorated function's histogram
+    metrics.REGISTRY.reset()
+    work(3)
+    assert metrics.to_json()["cod_stage_seconds"]["series"][0]["count"] == 1
+
+
+def test_disabled_is_cheap():
+    _fresh()
+    metrics.set_enabled(False)
+    try:
+        @metrics.timed("cod_stage_seconds", stage="noop")
+        def noop():
+            return None
+
+        t0 = time.perf_counter()
+        for _ in range(100000):
+            noop()
+            with metrics.timer("cod_stage_seconds", stage="noop"):
+                pass
+            metrics.inc("cod_retrievals_total", path="local")
+        per_call = (time.perf_counter() - t0) / 100000 * 1e6
+        print(f"disabled overhead: {per_call:.2f} µs per timed call + timer + counter")
+        assert metrics.REGISTRY.histogram("cod_stage_seconds", stage="noop").count == 0
+        assert "cod_retrievals_total" not in metrics.to_json()
+        assert per_call < 20
+    finally:
+        metrics.set_enabled(True)
+
+
+if __name__ == "__main__":
+    test_timer_counter_export()
+    test_timed_decorator()
+    test_disabled_is_cheap()
+    print("✓ Metrics tests passed")
@@ -0,0 +1,133 @@
+import sys
+import os
+import tempfile
+import threading
+import time
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from backend import model_loader
+from backend.bench_scaling import synthetic_state, symptom_vocabulary
+from backend.retrieval_daemon import make_server, RetrievalClient, QueryBatcher
+
+# Synthetic KB: no dataset download, no writes to retriever_cache/
+STATE = synthetic_state(200)
+QUERIES = [", ".join(symptom_vocabulary()[i:i + 3]) for i in (0, 5, 10, 15)]
+
+
+def _start(state, linger=0.02):
+    address = "unix:" + os.path.join(tempfile.mkdtemp(), "retrieval.sock")
+    server = make_server(address, state=state, linger=linger)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, address
+
+
+def test_remote_matches_local():
+    state = STATE
+    server, address = _start(state)
+    try:
+        client = RetrievalClient(address)
+        for q in QUERIES:
+            assert client.retrieve(q, k=5) == model_loader.hybrid_retrieve(q, k=5, state=state)
+        assert len(client.disease_map()) == len(state.disease_symptom_map)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_concurrent_queries_are_batched():
+    server, address = _start(STATE, linger=0.05)
+    try:
+        client = RetrievalClient(address)
+        threads = [threading.Thread(target=client.retrieve, args=(q,)) for q in QUERIES * 8]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stats = client.stats()
+        print(f"{stats['queries']} queries in {stats['batches']} encoder batches")
+        assert stats["queries"] == 32 and stats["batches"] < 32
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_bad_query_fails_alone():
+    def retrieve_many(queries):
+        if "bad" in queries:
+            raise ValueError("malformed query")
+        return [q.upper() for q in queries]
+
+    batcher = QueryBatcher(retrieve_many, linger=0.05)
+    futs = batcher.submit(["a", "bad", "b"])
+    assert futs[0].result(timeout=5) == "A" and futs[2].result(timeout=5) == "B"
+    try:
+        futs[1].result(timeout=5)
+        assert False, "expected the bad query to fail"
+    except ValueError:
+        pass
+
+
+def test_frontend_stays_remote():
+    """With a daemon configured, startup and the engine path never load a local index."""
+    server, address = _start(STATE)
+    saved = (model_loader._loader, model_loader._remote_map, config.RETRIEVAL_DAEMON_ADDRESS)
+    model_loader._loader = model_loader.RetrieverLoader()
+    model_loader._remote_map = None
+    config.RETRIEVAL_DAEMON_ADDRESS = address
+    try:
+        # Imported here, with the daemon configured: the engine reads the map at import
+        from backend.diagnosis_engine import followup_step
+
+        assert len(model_loader.warm_retrieval()) == 200
+        symptoms = symptom_vocabulary()[:3]
+        candidates, probs, _ = followup_step(symptoms, ", ".join(symptoms), set(), k=5)
+        assert candidates and probs
+        assert not model_loader._loader.loaded
+    finally:
+        model_loader._loader, model_loader._remote_map, config.RETRIEVAL_DAEMON_ADDRESS = saved
+        server.shutdown()
+        server.server_close()
+
+
+def test_outage_falls_back_then_recovers():
+    """A daemon outage is served in-process; after the backoff the daemon is used again."""
+    address = "unix:" + os.path.join(tempfile.mkdtemp(), "retrieval.sock")
+    saved = (model_loader._loader, model_loader._remote_map, config.RETRIEVAL_DAEMON_ADDRESS,
+             config.RETRIEVAL_DAEMON_RETRY)
+    model_loader._loader = model_loader.RetrieverLoader(builder=lambda cache_dir, **kw: STATE)
+    model_loader._remote_map = None
+    config.RETRIEVAL_DAEMON_ADDRESS = address
+    config.RETRIEVAL_DAEMON_RETRY = 0.2
+    server = None
+    try:
+        # Nothing listening yet: this call is served locally
+        expected = model_loader.hybrid_retrieve(QUERIES[0], k=5, state=STATE)
+        assert model_loader.hybrid_retrieve(QUERIES[0], k=5) == expected
+        assert model_loader._loader.loaded
+
+        server = make_server(address, state=STATE, linger=0.02)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        time.sleep(0.3)
+        assert model_loader.hybrid_retrieve(QUERIES[0], k=5) == expected
+        assert RetrievalClient(address).stats()["queries"] == 1
+        assert not model_loader._loader.loaded
+    finally:
+        (model_loader._loader, model_loader._remote_map, config.RETRIEVAL_DAEMON_ADDRESS,
+         config.RETRIEVAL_DAEMON_RETRY) = saved
+        model_loader._remote_retry_at = 0.0
+        model_loader._remote_fallback = False
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    test_remote_matches_local()
+    test_concurrent_queries_are_batched()
+    test_bad_query_fails_alone()
+    test_frontend_stays_remote()
+    test_outage_falls_back_then_recovers()
+    print("✓ Retrieval daemon tests passed")
@@ -0,0 +1,44 @@
+import sys
+import os
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.symptom_extractor import build_extractor
+
+KB = {
+    "Angina": "Chest pain, shortness of breath, sweating, nausea",
+    "Migraine": "Severe headache, nausea, vomiting, sensitivity to light",
+    "Influenza": "Fever, cough, sore throat, muscle aches, no rash",
+}
+
+
+def test_longest_match_and_boundaries():
+    ex = build_extractor(KB)
+    found = ex.extract("Chest pain when I was painting, and headaches")
+    print(f"Extracted: {found}")
+    assert found == ["chest pain", "headache"]
+    assert ex.extract("rashes") == []  # "no rash" is not vocabulary
+
+
+def test_synonyms_and_negation():
+    ex = build_extractor(KB)
+    present, negated = ex.extract_with_negation("High temperature and throwing up, no cough. Can't breathe")
+    print(f"Present: {present}, negated: {negated}")
+    assert present == ["fever", "vomiting", "shortness of breath"]
+    assert negated == ["cough"]
+
+
+def test_demographics_and_body_parts_are_not_symptoms():
+    kb = dict(KB, Angina="Chest pain, pain, arms, left arm pain, male, females, runny nose, rhinorrhea")
+    ex = build_extractor(kb)
+    found = ex.extract("male with pain in my left arm, runny nose")
+    print(f"Extracted: {found}")
+    assert found == ["pain", "runny nose"]
+
+
+if __name__ == "__main__":
+    test_longest_match_and_boundaries()
+    test_synonyms_and_negation()
+    test_demographics_and_body_parts_are_not_symptoms()
+    print("✓ Symptom extractor tests passed")
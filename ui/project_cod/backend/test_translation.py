@@ -0,0 +1,89 @@
+import sys
+import os
+import tempfile
+import time
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.translation import Translator, TranslationBackend, IdentityBackend, UI_LABELS
+
+
+class CountingBackend(TranslationBackend):
+    name = "counting"
+
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+
+    def translate_batch(self, texts, target, source="auto"):
+        self.calls += 1
+        time.sleep(self.delay)
+        return [f"[{target}] {t}" for t in texts]
+
+
+def test_cached_batched_translation():
+    path = os.path.join(tempfile.mkdtemp(), "tr.db")
+    backend = CountingBackend()
+    tr = Translator(backend, cache_path=path)
+
+    tr.prefetch(UI_LABELS, "hi")
+    assert backend.calls == 1
+    assert tr.translate("Your Answer", "hi") == "[hi] Your Answer"
+    assert tr.translate("fever", "en") == "fever"  # ASCII -> English is skipped
+    assert backend.calls == 1
+
+    # A fresh process (new Translator, same file) hits the disk cache only
+    backend2 = CountingBackend()
+    tr2 = Translator(backend2, cache_path=path)
+    out = tr2.translate_many(UI_LABELS, "hi")
+    print(f"Backend calls: first={backend.calls}, after restart={backend2.calls}")
+    assert backend2.calls == 0 and out[0] == "[hi] Language"
+
+
+def test_timeout_falls_back_to_source():
+    tr = Translator(CountingBackend(delay=0.5), timeout=0.05, retries=0)
+    assert tr.translate("Stop", "ta") == "Stop"
+
+
+def test_hung_calls_do_not_starve_translation():
+    import config
+    hung = CountingBackend(delay=1.0)
+    tr = Translator(hung, timeout=0.05, retries=0)
+    # Every slot ends up held by a call that is still running...
+    for i in range(config.TRANSLATION_MAX_INFLIGHT + 2):
+        assert tr.translate(f"word {i}", "ta") == f"word {i}"
+    assert hung.calls == config.TRANSLATION_MAX_INFLIGHT
+    # ...so the next one falls back at once instead of waiting out its timeout
+    t0 = time.perf_counter()
+    assert tr.translate("other", "ta") == "other"
+    assert time.perf_counter() - t0 < 0.05
+
+    # Once they return, their slots are free again
+    time.sleep(1.1)
+    hung.delay = 0.0
+    assert tr.translate("again", "ta") == "[ta] again"
+
+
+def test_identity_results_are_not_cached_on_disk():
+    path = os.path.join(tempfile.mkdtemp(), "tr.db")
+    # No translation library installed: the identity fallback answers...
+    assert Translator(IdentityBackend(), cache_path=path).translate("Stop", "hi") == "Stop"
+
+    # ...but a real backend later still translates, instead of reading "Stop" back
+    backend = CountingBackend()
+    assert Translator(backend, cache_path=path).translate("Stop", "hi") == "[hi] Stop"
+    assert backend.calls == 1
+
+    # Rows from another backend are not served either
+    other = CountingBackend()
+    other.name = "other"
+    assert Translator(other, cache_path=path).translate("Stop", "hi") == "[hi] Stop"
+    assert other.calls == 1
+
+
+if __name__ == "__main__":
+    test_cached_batched_translation()
+    test_timeout_falls_back_to_source()
+    test_hung_calls_do_not_starve_translation()
+    test_identity_results_are_not_cached_on_disk()
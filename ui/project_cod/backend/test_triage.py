@@ -0,0 +1,44 @@
+import sys
+import os
+import time
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.triage import RedFlagMatcher, load_rules, urgent_result
+
+
+def test_red_flag_rules():
+    m = RedFlagMatcher(load_rules())
+    flags = m.check("Crushing chest pain since an hour and my lips turning blue")
+    print(f"Flags: {[f.id for f in flags]}")
+    assert [f.id for f in flags] == ["cardiac_chest_pain", "cyanosis"]
+
+    assert m.check("mild cough, no severe chest pain, not confused") == []
+    assert m.check("I have been confusing the two tablets") == []
+    assert [f.id for f in m.check("SpO2: 89 at home")] == ["low_spo2"]
+    assert m.check("spo2 is 98") == []
+
+
+def test_check_is_fast():
+    m = RedFlagMatcher(load_rules())
+    text = "fever and cough for three days with a mild headache, no vomiting " * 4
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        m.check(text)
+    per_call = (time.perf_counter() - t0) / 1000 * 1e6
+    print(f"check(): {per_call:.1f} µs per call")
+    assert per_call < 1000
+
+
+def test_urgent_result_shape():
+    m = RedFlagMatcher(load_rules())
+    res = urgent_result(m.check("coughing up blood"), "A", 40, "M", ["cough"])
+    assert res["urgent"] and res["candidates"] == [] and "Urgent" in res["report"]
+
+
+if __name__ == "__main__":
+    test_red_flag_rules()
+    test_check_is_fast()
+    test_urgent_result_shape()
+    print("✓ Triage tests passed")
@@ -0,0 +1,143 @@
+# backend/tracing.py
+# Per-consultation trace: what the engine did for one patient.
+#
+#   trace = ConsultationTrace()
+#   with activate(trace):
+#       followup_step(...)          # retrievals, questions, timings land in trace
+#   database.save_session(..., trace=trace.to_dict())
+#
+# The engine records into whichever trace is active in the current context
+# (contextvars, so API worker threads and Streamlit sessions never mix).
+# Stage timings and cache counters come from the backend.metrics timers, so
+# every instrumented stage is traced whether or not metrics are enabled.
+# With no active trace, record() is a single ContextVar lookup.
+
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import config
+except ImportError:
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import config
+
+TRACE_VERSION = 1
+
+_current = contextvars.ContextVar("cod_consultation_trace", default=None)
+
+
+class ConsultationTrace:
+    """
+    Events (retrievals, questions, answers, ...) in order, with a
+    millisecond offset from the start of the consultation, plus per-stage
+    call counts / total time and counters such as cache hits.
+    """
+
+    def __init__(self, max_events=None):
+        self.started = datetime.now()
+        self._p0 = time.perf_counter()
+        self.max_events = max_events or config.TRACE_MAX_EVENTS
+        self.events = []
+        self.stages = {}      # stage -> [calls, seconds]
+        self.counters = {}
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def _ms(self):
+        return round((time.perf_counter() - self._p0) * 1000, 2)
+
+    def event(self, kind, **fields):
+        with self._lock:
+            if len(self.events) >= self.max_events:
+                self.dropped += 1
+                return
+            self.events.append({"t": self._ms(), "kind": kind, **fields})
+
+    def add_stage(self, stage, seconds):
+        with self._lock:
+            s = self.stages.setdefault(stage, [0, 0.0])
+            s[0] += 1
+            s[1] += seconds
+
+    def count(self, key, amount=1):
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def merge(self, other, **tags):
+        """Folds a child trace (e.g. a speculative branch) in, re-based onto our clock."""
+        if other is None:
+            return
+        shift = round((other._p0 - self._p0) * 1000, 2)
+        with other._lock:
+            events = [{**e, "t": round(e["t"] + shift, 2), **tags} for e in other.events]
+            stages = {k: list(v) for k, v in other.stages.items()}
+            counters = dict(other.counters)
+            dropped = other.dropped
+        with self._lock:
+            room = max(0, self.max_events - len(self.events))
+            self.events.extend(events[:room])
+            self.events.sort(key=lambda e: e["t"])
+            dropped += len(events) - len(events[:room])
+            for k, (n, sec) in stages.items():
+                s = self.stages.setdefault(k, [0, 0.0])
+                s[0] += n
+                s[1] += sec
+            for k, v in counters.items():
+                self.counters[k] = self.counters.get(k, 0) + v
+            self.dropped += dropped
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "v": TRACE_VERSION,
+                "started": self.started.isoformat(timespec="milliseconds"),
+                "elapsed_ms": self._ms(),
+                "stages": {k: {"calls": n, "ms": round(sec * 1000, 2)}
+                           for k, (n, sec) in sorted(self.stages.items())},
+                "counters": dict(sorted(self.counters.items())),
+                "events": list(self.events),
+                "dropped": self.dropped,
+            }
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def activate(trace):
+    """Makes `trace` the active trace for this context (None = tracing off)."""
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def run_traced(trace, fn, *args, **kwargs):
+    """fn(*args, **kwargs) with `trace` active; for work handed to another thread."""
+    with activate(trace):
+        return fn(*args, **kwargs)
+
+
+def new_trace():
+    """A fresh trace, or None when config.TRACE_CONSULTATIONS is off."""
+    return ConsultationTrace() if config.TRACE_CONSULTATIONS else None
+
+
+def record(kind, **fields):
+    trace = _current.get()
+    if trace is not None:
+        trace.event(kind, **fields)
+
+
+def top_items(scores, n=5, digits=4):
+    """{name: score} or [(name, score)] -> [[name, rounded score], ...] best first."""
+    items = scores.items() if isinstance(scores, dict) else scores
+    ranked = sorted(items, key=lambda x: x[1], reverse=True)[:n]
+    return [[d, round(float(s), digits)] for d, s in ranked]
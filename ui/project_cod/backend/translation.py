@@ -0,0 +1,317 @@
+# backend/translation.py
+# Cached, batched translation for UI labels, questions, reports and answers.
+#
+#   text -> in-memory LRU -> on-disk SQLite cache -> backend (one batched call)
+#
+# Backends are pluggable: "google" (deep_translator) or "identity" (offline
+# stub that returns the input). Failed translations fall back to the source
+# text and are never cached.
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+try:
+    import config
+except ImportError:
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import config
+
+from backend import metrics
+
+try:
+    from deep_translator import GoogleTranslator
+    _HAS_TRANSLATOR = True
+except ImportError:
+    _HAS_TRANSLATOR = False
+
+
+# Static UI strings; translated together, once per language
+UI_LABELS = [
+    "Language",
+    "Record symptoms in voice",
+    "Start Recording",
+    "Stop Listening",
+    "Record Answer",
+    "Stop",
+    "Your Answer",
+]
+
+
+def _lang(code):
+    # Simplify lang code ("en-US" -> "en")
+    return (code or "en").split("-")[0]
+
+
+# ---------------------------------------
+# BACKENDS
+# ---------------------------------------
+class TranslationBackend:
+    """Interface: translate a list of texts in one go. Must return a list of the same length."""
+    name = "base"
+    persist = True  # write results to the disk cache
+
+    def translate_batch(self, texts, target, source="auto"):
+        raise NotImplementedError
+
+
+class IdentityBackend(TranslationBackend):
+    """Offline stand-in: returns the text unchanged."""
+    name = "identity"
+    persist = False  # untranslated text must never outlive this process
+
+    def translate_batch(self, texts, target, source="auto"):
+        return list(texts)
+
+
+class GoogleBackend(TranslationBackend):
+    """deep_translator.GoogleTranslator, packing short texts into one request."""
+    name = "google"
+    MAX_CHARS = 4500  # Google's per-request limit is 5000
+
+    def translate_batch(self, texts, target, source="auto"):
+        tr = GoogleTranslator(source=source, target=target)
+
+        # Newline-joined packing only for single-line texts, so the split is unambiguous
+        if len(texts) > 1 and all("\n" not in t for t in texts):
+            packed = "\n".join(texts)
+            if len(packed) <= self.MAX_CHARS:
+                out = (tr.translate(packed) or "").split("\n")
+                if len(out) == len(texts):
+                    return [o.strip() for o in out]
+
+        return [tr.translate(t) for t in texts]
+
+
+BACKENDS = {
+    "google": GoogleBackend,
+    "identity": IdentityBackend,
+}
+
+
+# ---------------------------------------
+# CACHES
+# ---------------------------------------
+class _LRU:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._d = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            v = self._d.get(key)
+            if v is not None:
+                self._d.move_to_end(key)
+            return v
+
+    def put(self, key, value):
+        with self._lock:
+            self._d[key] = value
+            self._d.move_to_end(key)
+            while len(self._d) > self.maxsize:
+                self._d.popitem(last=False)
+
+
+class _DiskCache:
+    """
+    (target, text) -> translation in a small SQLite file; one connection per
+    thread. Lookups only return rows written by the asking backend.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute('''CREATE TABLE IF NOT EXISTS translations (
+                                target TEXT NOT NULL,
+                                source_text TEXT NOT NULL,
+                                translated TEXT NOT NULL,
+                                backend TEXT,
+                                PRIMARY KEY (target, source_text)
+                            ) WITHOUT ROWID''')
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, target, texts, backend):
+        found = {}
+        texts = list(texts)
+        # Stay under SQLite's bound-parameter limit
+        for i in range(0, len(texts), 500):
+            chunk = texts[i:i + 500]
+            q = ",".join("?" * len(chunk))
+            rows = self._conn().execute(
+                "SELECT source_text, translated FROM translations "
+                f"WHERE target = ? AND backend = ? AND source_text IN ({q})",
+                [target, backend, *chunk],
+            ).fetchall()
+            found.update(rows)
+        return found
+
+    def put_many(self, target, pairs, backend):
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO translations (target, source_text, translated, backend) VALUES (?, ?, ?, ?)",
+                [(target, s, t, backend) for s, t in pairs],
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+# ---------------------------------------
+# TRANSLATOR
+# ---------------------------------------
+class Translator:
+
+    def __init__(self, backend=None, cache_path=None, lru_size=None, timeout=None, retries=1):
+        self.backend = backend or IdentityBackend()
+        self.timeout = config.TRANSLATION_TIMEOUT if timeout is None else timeout
+        self.retries = retries
+        self._lru = _LRU(lru_size or config.TRANSLATION_LRU_SIZE)
+        self._disk = _DiskCache(cache_path) if cache_path else None
+        # A timed-out call cannot be interrupted (deep_translator has no request
+        # timeout), so each call gets its own thread and holds a slot until it
+        # really returns. Once every slot is held, calls fail fast instead of queuing.
+        self._slots = threading.BoundedSemaphore(config.TRANSLATION_MAX_INFLIGHT)
+
+    @staticmethod
+    def _skip(text, target):
+        if not text or not isinstance(text, str) or not text.strip():
+            return True
+        # Quick check: if text is pure ASCII and target is 'en', skip
+        return target == "en" and all(ord(c) < 128 for c in text)
+
+    def translate(self, text, target_lang="en"):
+        return self.translate_many([text], target_lang)[0]
+
+    @metrics.timed("cod_stage_seconds", stage="translate")
+    def translate_many(self, texts, target_lang="en"):
+        """Translates a list, hitting the backend at most once for all cache misses."""
+        target = _lang(target_lang)
+        out = list(texts)
+
+        pending = {}
+        lru_hits = 0
+        for i, t in enumerate(texts):
+            if self._skip(t, target):
+                continue
+            hit = self._lru.get((target, t))
+            if hit is not None:
+                out[i] = hit
+                lru_hits += 1
+            else:
+                pending.setdefault(t, []).append(i)
+        if lru_hits:
+            metrics.inc("cod_translation_cache_total", lru_hits, result="lru_hit")
+
+        if pending and self._disk is not None and self.backend.persist:
+            disk_hits = self._disk.get_many(target, pending, self.backend.name)
+            for src, tr in disk_hits.items():
+                self._lru.put((target, src), tr)
+                for i in pending.pop(src):
+                    out[i] = tr
+            if disk_hits:
+                metrics.inc("cod_translation_cache_total", len(disk_hits), result="disk_hit")
+
+        if pending:
+            misses = list(pending)
+            metrics.inc("cod_translation_cache_total", len(misses), result="miss")
+            with metrics.timer("cod_stage_seconds", stage="translate_backend"):
+                results = self._call_backend(misses, target)
+            if results is None:
+                metrics.inc("cod_translation_failures_total")
+            else:
+                fresh = []
+                for src, tr in zip(misses, results):
+                    if not tr:
+                        continue
+                    self._lru.put((target, src), tr)
+                    fresh.append((src, tr))
+                    for i in pending[src]:
+                        out[i] = tr
+                if fresh and self._disk is not None and self.backend.persist:
+                    self._disk.put_many(target, fresh, self.backend.name)
+
+        return out
+
+    def prefetch(self, texts, target_lang):
+        """Warms the caches (e.g. all UI_LABELS) for one language."""
+        self.translate_many(list(texts), target_lang)
+
+    def _start_call(self, texts, target):
+        """Backend call on its own daemon thread; None if hung calls hold every slot."""
+        if not self._slots.acquire(blocking=False):
+            return None
+        fut = Future()
+
+        def run():
+            try:
+                fut.set_result(self.backend.translate_batch(texts, target))
+            except BaseException as e:
+                fut.set_exception(e)
+            finally:
+                self._slots.release()
+
+        threading.Thread(target=run, name="translate", daemon=True).start()
+        return fut
+
+    def _call_backend(self, texts, target):
+        for attempt in range(self.retries + 1):
+            fut = self._start_call(texts, target)
+            if fut is None:
+                metrics.inc("cod_translation_saturated_total")
+                return None
+            try:
+                res = fut.result(timeout=self.timeout)
+                if res is not None and len(res) == len(texts):
+                    return res
+            except FutureTimeout:
+                pass  # the call keeps its slot until it returns
+            except Exception:
+                pass
+            if attempt < self.retries:
+                time.sleep(0.2)
+        return None
+
+
+_translator = None
+_translator_lock = threading.Lock()
+
+
+def get_translator():
+    """Process-wide Translator built from config (TRANSLATION_BACKEND etc.)."""
+    global _translator
+    if _translator is None:
+        with _translator_lock:
+            if _translator is None:
+                name = config.TRANSLATION_BACKEND
+                if name == "google" and not _HAS_TRANSLATOR:
+                    name = "identity"
+                _translator = Translator(BACKENDS[name](), cache_path=config.TRANSLATION_CACHE_PATH)
+    return _translator
+
+
+def set_translator(translator):
+    global _translator
+    _translator = translator
+
+
+def translate_text(text, target_lang="en"):
+    """Drop-in for the old per-call translate: cached, with timeout, never raises."""
+    return get_translator().translate(text, target_lang)
@@ -0,0 +1,156 @@
+# backend/triage.py
+# Red-flag fast path: emergencies are answered before any retrieval.
+#
+# Rules live in a JSON file (config.RED_FLAG_RULES_PATH):
+#   rules      - phrase lists, compiled into ONE regex with a named group per
+#                rule and word boundaries, so a check is a single scan
+#   thresholds - numeric patterns such as "SpO2 91" with a "below" cut-off
+# A phrase preceded by a negation cue in the same clause ("no chest pain")
+# does not fire. Nothing here touches the embedder or the KB.
+
+import json
+import os
+import re
+import threading
+from collections import namedtuple
+
+try:
+    import config
+except ImportError:
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import config
+
+from backend import tracing
+from backend.symptom_extractor import NEGATION_CUES
+
+RedFlag = namedtuple("RedFlag", ["id", "label", "advice", "match"])
+
+_CLAUSE_BREAK = re.compile(r"[;,.!?\n]|\bbut\b")
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def _phrase_pattern(phrase):
+    words = [re.escape(w) for w in phrase.lower().split()]
+    return r"\s+".join(words)
+
+
+class RedFlagMatcher:
+
+    def __init__(self, rules):
+        self.window = int(rules.get("negation_window", 3))
+        self._rules = {}
+        groups = []
+        for i, rule in enumerate(rules.get("rules", [])):
+            phrases = sorted(rule.get("phrases", []), key=len, reverse=True)
+            if not phrases:
+                continue
+            name = f"r{i}"
+            self._rules[name] = rule
+            groups.append(f"(?P<{name}>{'|'.join(_phrase_pattern(p) for p in phrases)})")
+
+        self._regex = re.compile(r"\b(?:" + "|".join(groups) + r")\b") if groups else None
+        self._thresholds = [(re.compile(t["pattern"]), t) for t in rules.get("thresholds", [])]
+
+    def _negated(self, text, start):
+        before = _CLAUSE_BREAK.split(text[:start])[-1]
+        return any(w in NEGATION_CUES for w in _WORD.findall(before)[-self.window:])
+
+    def check(self, text):
+        """Returns [RedFlag] for text (one per rule), empty when nothing urgent."""
+        if not text:
+            return []
+        t = text.lower()
+        found = {}
+
+        if self._regex is not None:
+            for m in self._regex.finditer(t):
+                if m.lastgroup in found or self._negated(t, m.start()):
+                    continue
+                rule = self._rules[m.lastgroup]
+                found[m.lastgroup] = RedFlag(rule["id"], rule["label"], rule.get("advice", ""), m.group(0))
+
+        for pattern, rule in self._thresholds:
+            for m in pattern.finditer(t):
+                try:
+                    value = float(m.group(1))
+                except (IndexError, ValueError):
+                    continue
+                if value < rule["below"]:
+                    label = rule["label"].format(value=m.group(1))
+                    found[rule["id"]] = RedFlag(rule["id"], label, rule.get("advice", ""), m.group(0))
+                    break
+
+        return list(found.values())
+
+
+def load_rules(path=None):
+    with open(path or config.RED_FLAG_RULES_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+_matcher = None
+_lock = threading.Lock()
+
+
+def get_matcher():
+    global _matcher
+    if _matcher is None:
+        with _lock:
+            if _matcher is None:
+                _matcher = RedFlagMatcher(load_rules())
+    return _matcher
+
+
+def reload_rules(path=None):
+    """Re-reads the rules file (e.g. after editing it) and swaps the matcher."""
+    global _matcher
+    _matcher = RedFlagMatcher(load_rules(path))
+    return _matcher
+
+
+def detect_red_flags(*texts):
+    """All red flags across texts (raw input, its translation, an answer...)."""
+    if not config.RED_FLAG_TRIAGE:
+        return []
+    matcher = get_matcher()
+    out, seen = [], set()
+    for text in texts:
+        for flag in matcher.check(text):
+            if flag.id not in seen:
+                seen.add(flag.id)
+                out.append(flag)
+    if out:
+        tracing.record("red_flags", ids=[f.id for f in out])
+    return out
+
+
+# ---------------------------------------
+# URGENT RESULT
+# ---------------------------------------
+def urgent_report(flags, name=None, age=None, gender=None, symptoms=()):
+    report = ["### 🚨 Urgent Care Advised"]
+    report.append(f"**Patient**: {name or 'N/A'}, **Age**: {age or 'N/A'}, **Gender**: {gender or 'N/A'}")
+    if symptoms:
+        report.append(f"Reported symptoms: **{', '.join(symptoms)}**\n")
+
+    report.append("#### ⚠ Red flags detected")
+    for f in flags:
+        report.append(f"- **{f.label}** (\"{f.match}\") — {f.advice}")
+
+    report.append("\nThe diagnostic interview was stopped because these signs need immediate "
+                  "medical attention. Contact your local emergency number or go to the nearest "
+                  "emergency department.")
+    return "\n".join(report)
+
+
+def urgent_result(flags, name=None, age=None, gender=None, symptoms=()):
+    """Same shape as predict_from_text()'s result, with no candidates."""
+    return {
+        "symptoms": list(symptoms),
+        "candidates": [],
+        "probabilities": {},
+        "report": urgent_report(flags, name, age, gender, symptoms),
+        "urgent": True,
+        "red_flags": [f._asdict() for f in flags],
+    }
@@ -12,6 +12,7 @@ BASE_MODEL_NAME = "Qwen/Qwen2.5-7B-Instruct"
 MODEL_ADAPTER_DIR = os.path.join(BACKEND_DIR, "diagnosis_gpt_v3_3_model")
 RETRIEVER_CACHE_DIR = os.path.join(BACKEND_DIR, "retriever_cache")
 DATABASE_PATH = os.path.join(BACKEND_DIR, "patients.db")
+ARCHIVE_DIR = os.path.join(BACKEND_DIR, "archive")
 
 # ---------------------------------------
 # DIAGNOSIS ENGINE SETTINGS
@@ -34,6 +35,17 @@ TEMPERATURE_SCALING = 0.6
 MIN_FOLLOWUP_QUESTIONS = 3
 MAX_FOLLOWUP_QUESTIONS = 8 # Allow more questions in "Free Mode" until confidence is met
 
+# Speculative follow-up: precompute the next turn for yes/no while the patient answers
+SPECULATIVE_FOLLOWUPS = True
+SPECULATION_WORKERS = 2
+
+# History view
+HISTORY_PAGE_SIZE = 20
+
+# Storage
+COMPRESSION_MIN_BYTES = 256   # reports/transcripts shorter than this stay plain TEXT
+SESSION_RETENTION_DAYS = 365  # older sessions are moved to ARCHIVE_DIR by archive_sessions()
+
 # ---------------------------------------
 # MULTILINGUAL SUPPORT
 # ---------------------------------------
@@ -48,11 +60,99 @@ SUPPORTED_LANGUAGES = {
     "fr": "French"
 }
 
+# Multilingual retrieval: embed supported non-English queries directly
+# instead of translating them to English first (see bench_multilingual.py)
+MULTILINGUAL_RETRIEVAL = False
+MULTILINGUAL_EMBEDDER_NAME = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+
+# Translation (backend/translation.py)
+TRANSLATION_BACKEND = "google"   # "google" | "identity" (offline stub)
+TRANSLATION_CACHE_PATH = os.path.join(BACKEND_DIR, "translation_cache.db")
+TRANSLATION_LRU_SIZE = 4096
+TRANSLATION_TIMEOUT = 5.0        # seconds per backend call
+TRANSLATION_MAX_INFLIGHT = 16    # backend calls running at once, hung ones included
+
+# Headless HTTP API (backend/api_server.py)
+API_HOST = "127.0.0.1"
+API_PORT = 8765
+API_WORKERS = 4              # engine threads (retrieval + scoring)
+API_MAX_PENDING = 16         # queued engine jobs beyond the workers before 429
+API_REQUEST_TIMEOUT = 30.0   # seconds an HTTP request waits for its engine job
+API_SESSION_TTL = 3600       # idle consultations are dropped after this many seconds
+API_MAX_SESSIONS = 10000
+API_ACCESS_LOG = False
+
+# Shared retrieval daemon (backend/retrieval_daemon.py). None = each process
+# loads its own index; e.g. "unix:/tmp/cod-retrieval.sock" or "127.0.0.1:8766"
+RETRIEVAL_DAEMON_ADDRESS = os.environ.get("COD_RETRIEVAL_DAEMON") or None
+RETRIEVAL_DAEMON_MAX_BATCH = 64
+RETRIEVAL_DAEMON_LINGER = 0.003  # seconds to wait for more queries before encoding a batch
+RETRIEVAL_DAEMON_TIMEOUT = 30.0
+RETRIEVAL_DAEMON_RETRY = 30.0    # seconds an unreachable daemon is skipped before it is tried again
+
+# Red-flag triage (backend/triage.py): urgent signs skip the diagnostic loop
+RED_FLAG_TRIAGE = True
+RED_FLAG_RULES_PATH = os.path.join(BACKEND_DIR, "red_flags.json")
+
+# Per-stage timers and counters (backend/metrics.py), exported by the API at
+# /metrics (Prometheus text) and /metrics.json. COD_METRICS=0 turns them off.
+METRICS_ENABLED = os.environ.get("COD_METRICS", "1") != "0"
+
+# Per-consultation traces (backend/tracing.py), stored compressed with the session
+TRACE_CONSULTATIONS = True
+TRACE_MAX_EVENTS = 500       # per consultation; later events are counted, not kept
+
 # ---------------------------------------
-# SYMPTOM TOKENS (For heuristic parsing)
+# SYMPTOM EXTRACTION (backend/symptom_extractor.py)
 # ---------------------------------------
-SYMPTOM_TOKENS = {
-    "pain", "fever", "cough", "headache", "nausea", "vomit", "vomiting", 
-    "diarrhea", "dizzy", "fatigue", "weakness", "rash", "bleeding", 
-    "breath", "cold", "sneeze", "runny", "stomach", "chest", "throat"
+# Lay phrasing -> canonical KB symptom. Added on top of the phrases mined
+# from disease_symptom_map; entries here win over KB spellings, so only map
+# toward the phrase the KB itself uses more often (e.g. "runny nose" is in
+# more KB entries than "rhinorrhea" and is left as it is).
+SYMPTOM_SYNONYMS = {
+    "temperature": "fever",
+    "high temperature": "fever",
+    "feverish": "fever",
+    "throwing up": "vomiting",
+    "throw up": "vomiting",
+    "vomit": "vomiting",
+    "puking": "vomiting",
+    "loose motions": "diarrhea",
+    "loose stools": "diarrhea",
+    "diarrhoea": "diarrhea",
+    "dizzy": "dizziness",
+    "lightheaded": "dizziness",
+    "tired": "fatigue",
+    "tiredness": "fatigue",
+    "exhausted": "fatigue",
+    "weak": "weakness",
+    "head ache": "headache",
+    "head hurts": "headache",
+    "short of breath": "shortness of breath",
+    "breathless": "shortness of breath",
+    "can't breathe": "shortness of breath",
+    "difficulty breathing": "shortness of breath",
+    "stomach ache": "abdominal pain",
+    "stomach pain": "abdominal pain",
+    "tummy ache": "abdominal pain",
+    "belly pain": "abdominal pain",
+    "blocked nose": "nasal congestion",
+    "stuffy nose": "nasal congestion",
+    "sneezing": "sneezing",
+    "sneeze": "sneezing",
+    "sore throat": "sore throat",
+    "throat pain": "sore throat",
+    "feeling sick": "nausea",
+    "queasy": "nausea",
+    "itchy": "itching",
+    "chest tightness": "chest tightness",
+    "coughing": "cough",
+    "coughing up blood": "hemoptysis",
+    "blood in urine": "hematuria",
+    "burning urination": "dysuria",
+    "peeing a lot": "frequent urination",
+    "yellow skin": "jaundice",
+    "fainted": "syncope",
+    "fainting": "syncope",
+    "passed out": "syncope",
 }
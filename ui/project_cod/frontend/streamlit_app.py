@@ -3,6 +3,7 @@
 # MedPath AI — Clinical Dashboard UI (Refactored)
 # ============================================================
 
+import html
 import os
 import time
 import re
@@ -17,24 +18,23 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
+# Plain imports: Streamlit reruns this script, not the modules, so the
+# engine/KB are imported (and loaded) once per process
 import config
-import importlib
-importlib.reload(config)
-
-from backend import database
-importlib.reload(database)
-
-from backend.model_loader import hybrid_retrieve, ensure_disease_map
-from backend import diagnosis_engine
-importlib.reload(diagnosis_engine)
-
+from backend import database, tracing
+from backend.model_loader import hybrid_retrieve, warm_retrieval
 from backend.diagnosis_engine import (
+    score_step,
+    speculate_followups,
+    classify_answer,
     score_candidates,
     candidate_symptom_pool,
     choose_best_followup,
     build_final_report,
     is_incompatible,
 )
+from backend.symptom_extractor import get_extractor
+from backend.triage import detect_red_flags, urgent_report
 
 # ------------------ Voice Recording & STT ------------------
 try:
@@ -44,43 +44,80 @@ except ImportError:
     _HAS_VOICE_RECORDER = False
 
 # ------------------ Input & Translation ------------------
-try:
-    from deep_translator import GoogleTranslator
-    _HAS_TRANSLATOR = True
-except ImportError:
-    _HAS_TRANSLATOR = False
-
-def translate_text(text, target_lang="en"):
+# Cached + batched; see backend/translation.py
+from backend.translation import translate_text, get_translator, UI_LABELS
+
+
+# Ensure KB loaded (once per process, shared by every session); with a
+# retrieval daemon configured only its disease map is fetched
+@st.cache_resource(show_spinner="Loading knowledge base…")
+def load_engine():
+    return warm_retrieval()
+
+load_engine()
+
+
+# ------------------ Per-session engine memo ------------------
+# Widget interactions (typing, toggles) rerun the whole script. Engine results
+# are keyed on the consultation inputs, so a rerun without a new answer does
+# no retrieval/scoring/follow-up work at all.
+def consultation_key(symptoms=None, negatives=None, asked=None):
+    ss = st.session_state
+    return (
+        tuple(ss["symptoms"] if symptoms is None else symptoms),
+        frozenset(ss["negatives"] if negatives is None else negatives),
+        frozenset(ss["asked"] if asked is None else asked),
+        ss["age"],
+        ss["gender"],
+        ss["initial_symptoms"],
+        ss.get("current_symptoms_text", ""),
+        ss["session_language"],
+    )
+
+def traced(fn, *args, **kwargs):
+    """fn(...) recorded into the current consultation's trace."""
+    return tracing.run_traced(st.session_state.get("trace"), fn, *args, **kwargs)
+
+def memo(name, key, compute):
+    store = st.session_state.setdefault("_engine_memo", {})
+    hit = store.get(name)
+    if hit is not None and hit[0] == key:
+        return hit[1]
+    # Engine work lands in this consultation's trace (saved with the session)
+    value = traced(compute)
+    store[name] = (key, value)
+    return value
+
+def memo_put(name, key, value):
+    st.session_state.setdefault("_engine_memo", {})[name] = (key, value)
+
+def take_speculation(key):
     """
-    Translates text to target_lang using deep_translator.
-    Retries once on failure.
+    If a speculative branch was computed for exactly these inputs, seed the
+    memo with it and drop the other branch. Returns True on a hit.
     """
-    if not text or not isinstance(text, str) or not text.strip():
-        return text
-        
-    if not _HAS_TRANSLATOR:
-        return text
-
-    # Quick check: if text is pure ASCII and target is 'en', skip
-    if target_lang == "en" and all(ord(c) < 128 for c in text):
-        return text
-
-    try:
-        # Simplify lang code
-        lang_code = target_lang.split("-")[0]
-        return GoogleTranslator(source='auto', target=lang_code).translate(text)
-    except Exception:
-        # Retry once
-        try:
-             time.sleep(0.5)
-             lang_code = target_lang.split("-")[0]
-             return GoogleTranslator(source='auto', target=lang_code).translate(text)
-        except Exception:
-             return text
-
-
-# Ensure KB loaded
-ensure_disease_map()
+    if st.session_state.get("_speculation_base") == key:
+        return False  # question still open: keep the branches running
+    st.session_state.pop("_speculation_base", None)
+    spec = st.session_state.pop("_speculation", None) or {}
+    trace = st.session_state.get("trace")
+    hit = False
+    for branch_key, fut in spec.items():
+        if branch_key == key and not fut.cancelled():
+            try:
+                candidates, probs, next_q = fut.result()
+            except Exception:
+                continue
+            memo_put("scores", key, (candidates, probs))
+            memo_put("next_q", key, next_q)
+            hit = True
+            if trace is not None:
+                trace.merge(getattr(fut, "trace", None), speculative=True)
+        else:
+            fut.cancel()
+    if trace is not None and spec:
+        trace.count("speculation.hit" if hit else "speculation.miss")
+    return hit
 
 # ------------------ Page Config ------------------
 st.set_page_config(page_title="MedPath AI — Clinical Dashboard", layout="wide")
@@ -171,12 +208,17 @@ DEFAULTS = {
     "last_voice_transcript": "",
     "session_language": "en", # User interface language
     "show_history": False,
+    "history_cursors": [],
+    "history_query": "",
+    "history_search_offset": 0,
     "stt_key": f"stt_{int(time.time())}",
     "stt_key_q": f"stt_q_{int(time.time())}",
     "last_transcript": "",
     "last_translation": "",
     "current_symptoms_text": "", # For English logic
     "negatives": set(), # Track symptoms user said NO to
+    "red_flags": [], # Urgent signs found by backend.triage
+    "trace": None, # backend.tracing.ConsultationTrace of the current consultation
     "consultation_started": False
 }
 
@@ -195,6 +237,8 @@ def reset_session():
     st.session_state["finished"] = False
     st.session_state["rounds"] = 0
     st.session_state["negatives"] = set()
+    st.session_state["red_flags"] = []
+    st.session_state["trace"] = None
     st.session_state["last_voice_transcript"] = ""
     st.session_state["stt_key"] = f"stt_{int(time.time())}"
     st.session_state["stt_key_q"] = f"stt_q_{int(time.time())}"
@@ -255,6 +299,10 @@ with st.sidebar:
     sel_code = [k for k,v in config.SUPPORTED_LANGUAGES.items() if v == sel][0]
     st.session_state["session_language"] = sel_code
 
+    # All static labels for this language in one backend call (no-op once cached)
+    if sel_code != "en":
+        get_translator().prefetch(UI_LABELS, sel_code)
+
     st.markdown("---")
     if st.button("New Consultation"):
         reset_session()
@@ -262,6 +310,8 @@ with st.sidebar:
 
     if st.button("View History"):
         st.session_state["show_history"] = not st.session_state["show_history"]
+        st.session_state["history_cursors"] = []
+        st.session_state["history_search_offset"] = 0
 
 # Header
 col_h1, col_h2 = st.columns([0.85, 0.15])
@@ -271,47 +321,140 @@ with col_h1:
 st.markdown("---")
 
 # ------------------ HISTORY VIEW ------------------
+def render_trace(trace):
+    """Stored engine trace: stage timings, counters, then the event log."""
+    st.caption(f"Started {trace.get('started', '?')} · {trace.get('elapsed_ms', 0):.0f} ms · "
+               f"{len(trace.get('events', []))} events" + (f" ({trace['dropped']} dropped)" if trace.get("dropped") else ""))
+    stages = trace.get("stages") or {}
+    if stages:
+        st.dataframe(
+            [{"stage": k, "calls": v["calls"], "total ms": v["ms"]} for k, v in stages.items()],
+            hide_index=True, use_container_width=True,
+        )
+    if trace.get("counters"):
+        st.markdown(" · ".join(f"`{k}` {v:g}" for k, v in trace["counters"].items()))
+
+    for e in trace.get("events", []):
+        spec = " _(speculative)_" if e.get("speculative") else ""
+        kind = e.get("kind")
+        if kind == "retrieve":
+            # Local retrievals store [disease, score]; daemon retrievals names only
+            top = ", ".join(f"{t[0]} {t[1]:.2f}" if isinstance(t, list) else str(t) for t in e.get("top", []))
+            line = f"retrieve ({e.get('ms', 0):.1f} ms) `{e.get('query', '')[:80]}` → {top}"
+        elif kind == "question":
+            line = f"question **{e.get('question')}** (gain {e.get('gain', 0):.3f}, pool {e.get('pool', 0)})"
+        elif kind == "answer":
+            line = f"answer {e.get('verdict') or 'unclear'} to _{e.get('question')}_"
+        elif kind in ("ranking", "report"):
+            line = f"{kind}: " + ", ".join(f"{d} {p:.0%}" for d, p in e.get("top", []))
+        else:
+            line = f"{kind}: " + ", ".join(f"{k}={v}" for k, v in e.items() if k not in ("t", "kind"))
+        st.markdown(f"`{e.get('t', 0):>8.1f} ms` {line}{spec}")
+
+
+def render_history_card(sid, ts, pname, syms, snippet=None):
+    # Create a card-like container. Everything shown here was typed by a
+    # patient, so it is escaped; the snippet keeps only its <mark> tags.
+    ts, pname, syms = html.escape(str(ts)), html.escape(pname or "Unknown"), html.escape(str(syms or ""))
+    with st.container():
+        match_html = (f"<div style='color: #94a3b8; margin-top: 4px; font-size: 0.9em;'>"
+                      f"{database.snippet_html(snippet)}</div>") if snippet else ""
+        st.markdown(f"""
+        <div style='background: #1e293b; padding: 12px; border-radius: 8px; margin-bottom: 8px; border: 1px solid rgba(255,255,255,0.1);'>
+            <div style='display: flex; justify-content: space-between; align-items: start;'>
+                <div>
+                    <div style='color: #94a3b8; font-size: 0.85em;'>{ts}</div>
+                    <div style='color: #e2e8f0; font-weight: bold; font-size: 1.1em;'>{pname}</div>
+                    <div style='color: #cbd5e1; margin-top: 4px;'>{syms}</div>
+                    {match_html}
+                </div>
+            </div>
+        </div>
+        """, unsafe_allow_html=True)
+
+        # Full Report (lazy): only queried once the toggle is opened
+        if st.toggle("View Full Consultation Details", key=f"rpt_{sid}"):
+            st.markdown(database.get_session_report(sid) or "_No report stored._")
+
+        # Engine trace (lazy, like the report)
+        if st.toggle("View Engine Trace", key=f"trace_{sid}"):
+            trace = database.get_session_trace(sid)
+            if trace:
+                render_trace(trace)
+            else:
+                st.markdown("_No trace stored for this session._")
+
+        # Action Buttons
+        c1, c2 = st.columns([0.85, 0.15])
+
+        with c2:
+            if st.button("Delete", key=f"del_{sid}"):
+                database.delete_session(sid)
+                st.toast("Consultation Deleted")
+                time.sleep(0.5)
+                st.rerun()
+        st.markdown("---")
+
+
 if st.session_state["show_history"]:
     st.subheader("Consultation History")
-    rows = database.get_sessions_summary()
-    
-    if rows:
-        # rows: (id, timestamp, name, symptoms, report)
-        for row in rows:
-            sid, ts, pname, syms, rpt = row
-            
-            # Create a card-like container
-            with st.container():
-                st.markdown(f"""
-                <div style='background: #1e293b; padding: 12px; border-radius: 8px; margin-bottom: 8px; border: 1px solid rgba(255,255,255,0.1);'>
-                    <div style='display: flex; justify-content: space-between; align-items: start;'>
-                        <div>
-                            <div style='color: #94a3b8; font-size: 0.85em;'>{ts}</div>
-                            <div style='color: #e2e8f0; font-weight: bold; font-size: 1.1em;'>{pname or 'Unknown'}</div>
-                            <div style='color: #cbd5e1; margin-top: 4px;'>{syms}</div>
-                        </div>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # Full Report Expander
-                with st.expander("View Full Consultation Details"):
-                    st.markdown(rpt)
-                
-                # Action Buttons
-                c1, c2 = st.columns([0.85, 0.15])
 
-                with c2:
-                    if st.button("Delete", key=f"del_{sid}"):
-                        database.delete_session(sid)
-                        st.toast("Consultation Deleted")
-                        time.sleep(0.5)
-                        st.rerun()
-                st.markdown("---")
+    def _reset_search_offset():
+        st.session_state["history_search_offset"] = 0
+
+    search_q = st.text_input("Search past consultations", key="history_query",
+                             placeholder="e.g. chest pain, patient name, diagnosis",
+                             on_change=_reset_search_offset)
+
+    if search_q.strip():
+        # Full-text search (FTS5), paged by offset
+        offset = st.session_state["history_search_offset"]
+        hits = database.search_sessions(search_q, limit=config.HISTORY_PAGE_SIZE + 1, offset=offset)
+        has_more = len(hits) > config.HISTORY_PAGE_SIZE
+
+        if hits:
+            for sid, ts, pname, syms, snippet in hits[:config.HISTORY_PAGE_SIZE]:
+                render_history_card(sid, ts, pname, syms, snippet)
+
+            p1, p2 = st.columns(2)
+            with p1:
+                if offset and st.button("← Previous results"):
+                    st.session_state["history_search_offset"] = max(0, offset - config.HISTORY_PAGE_SIZE)
+                    st.rerun()
+            with p2:
+                if has_more and st.button("More results →"):
+                    st.session_state["history_search_offset"] = offset + config.HISTORY_PAGE_SIZE
+                    st.rerun()
+        else:
+            st.info("No matching consultations.")
 
     else:
-        st.info("No history found.")
-        
+        # Keyset pagination: stack of cursors for the pages we've walked through
+        cursors = st.session_state["history_cursors"]
+        rows, next_cursor = database.get_sessions_page(
+            limit=config.HISTORY_PAGE_SIZE,
+            cursor=cursors[-1] if cursors else None,
+        )
+
+        if rows:
+            # rows: (id, timestamp, name, symptoms) — report bodies are fetched on demand
+            for sid, ts, pname, syms in rows:
+                render_history_card(sid, ts, pname, syms)
+
+            # Pager
+            p1, p2 = st.columns(2)
+            with p1:
+                if cursors and st.button("← Newer"):
+                    cursors.pop()
+                    st.rerun()
+            with p2:
+                if next_cursor and st.button("Older →"):
+                    cursors.append(next_cursor)
+                    st.rerun()
+
+        else:
+            st.info("No history found.")
+
     if st.button("Close History"):
         st.session_state["show_history"] = False
         st.rerun()
@@ -390,12 +533,22 @@ with left_col:
     start_btn = st.button("Start Consultation", type="primary", use_container_width=True)
     
     if start_btn:
-        # Translate to English for processing
-        en_sym = ""
-        if st.session_state["initial_symptoms"]:
-             en_sym = translate_text(st.session_state["initial_symptoms"], "en")
-             # Store English version for logic, keep UI original
-             st.session_state["current_symptoms_text"] = en_sym
+        # Fresh trace per consultation; triage, translation and extraction are its first entries
+        trace = tracing.new_trace()
+        st.session_state["trace"] = trace
+
+        with tracing.activate(trace):
+            # Red flags on the raw text first: an emergency does not wait on translation
+            red_flags = detect_red_flags(st.session_state["initial_symptoms"])
+
+            # Translate to English for processing
+            en_sym = ""
+            if st.session_state["initial_symptoms"]:
+                 en_sym = st.session_state["initial_symptoms"] if red_flags else translate_text(st.session_state["initial_symptoms"], "en")
+                 # Store English version for logic, keep UI original
+                 st.session_state["current_symptoms_text"] = en_sym
+            if not red_flags:
+                red_flags = detect_red_flags(en_sym)
         
         # Reset diag state
         st.session_state["symptoms"] = []
@@ -404,21 +557,22 @@ with left_col:
         st.session_state["rounds"] = 1  # Start loop
         st.session_state["finished"] = False
         st.session_state["consultation_started"] = True # Explicit flag
+        st.session_state["saved_to_db"] = False
         
-        # Initial Retrieve using English text
-        init = hybrid_retrieve(en_sym, k=6)
-        # Filter incompatible
-        filtered = [d for d in init if not is_incompatible(d, st.session_state["age"], st.session_state["gender"])] or init
-        
-        # Extract keywords
-        pool = candidate_symptom_pool(filtered)
+        # Extract symptoms the patient named (KB vocabulary + synonyms)
+        detected_symptoms, ruled_out = get_extractor().extract_with_negation(en_sym)
         
-        detected_symptoms = []
-        for token in config.SYMPTOM_TOKENS:
-            if token in en_sym.lower():
-                detected_symptoms.append(token)
+        st.session_state["symptoms"] = detected_symptoms
+        st.session_state["negatives"] = set(ruled_out)
+        if trace is not None:
+            # Raw + English text make the trace replayable (backend/replay.py)
+            trace.event("start", language=st.session_state["session_language"],
+                        text=st.session_state["initial_symptoms"], text_en=en_sym,
+                        symptoms=list(detected_symptoms), negatives=sorted(ruled_out))
         
-        st.session_state["symptoms"] = list(set(detected_symptoms))
+        # Urgent: skip the follow-up loop and go straight to the advice
+        st.session_state["red_flags"] = red_flags
+        st.session_state["finished"] = bool(red_flags)
         
         st.success("Consultation Started.")
         st.rerun()
@@ -443,45 +597,65 @@ with right_col:
     
     elif st.session_state["finished"]:
         # --- FINAL REPORT ---
-        st.success("Consultation Complete")
-        
-        # Use the English text we stored; fallback to initial if missing (though expectation is it's set)
-        query_text = st.session_state.get("current_symptoms_text", "") or st.session_state["initial_symptoms"]
-        
-        # Retrieve final candidates
-        # We append the explicit symptom tokens + the raw text for best context
-        full_query = ", ".join(st.session_state["symptoms"]) + " " + query_text
-        
-        candidates = hybrid_retrieve(full_query, k=8)
-        candidates = [c for c in candidates if not is_incompatible(c, st.session_state["age"], st.session_state["gender"])] or candidates
-        
-        candidates = [c for c in candidates if not is_incompatible(c, st.session_state["age"], st.session_state["gender"])] or candidates
-        
-        probs = score_candidates(
-            candidates, 
-            st.session_state["symptoms"], 
-            st.session_state["age"], 
-            st.session_state["gender"],
-            negatives=list(st.session_state.get("negatives", []))
-        )
+        red_flags = st.session_state.get("red_flags") or []
+        if red_flags:
+            st.error("🚨 Red flags detected — urgent medical attention advised.")
+        else:
+            st.success("Consultation Complete")
         
-        # Build Report using the backend engine (includes Next Steps)
-        report_md = build_final_report(
-            st.session_state["name"],
-            st.session_state["age"],
-            st.session_state["gender"],
-            st.session_state["symptoms"],
-            candidates,
-            probs
-        )
+        def _urgent_report():
+            report_md = urgent_report(
+                red_flags,
+                st.session_state["name"],
+                st.session_state["age"],
+                st.session_state["gender"],
+                st.session_state["symptoms"],
+            )
+            if st.session_state["session_language"] != "en":
+                report_display = translate_text(report_md, st.session_state["session_language"])
+            else:
+                report_display = report_md
+            return {}, report_md, report_display
+
+        def _final_report():
+            # Use the English text we stored; fallback to initial if missing (though expectation is it's set)
+            query_text = st.session_state.get("current_symptoms_text", "") or st.session_state["initial_symptoms"]
+
+            # Retrieve final candidates
+            # We append the explicit symptom tokens + the raw text for best context
+            full_query = ", ".join(st.session_state["symptoms"]) + " " + query_text
+
+            candidates = hybrid_retrieve(full_query, k=8)
+            candidates = [c for c in candidates if not is_incompatible(c, st.session_state["age"], st.session_state["gender"])] or candidates
+
+            probs = score_candidates(
+                candidates,
+                st.session_state["symptoms"],
+                st.session_state["age"],
+                st.session_state["gender"],
+                negatives=list(st.session_state.get("negatives", []))
+            )
+
+            # Build Report using the backend engine (includes Next Steps)
+            report_md = build_final_report(
+                st.session_state["name"],
+                st.session_state["age"],
+                st.session_state["gender"],
+                st.session_state["symptoms"],
+                candidates,
+                probs
+            )
+
+            # Translate Report if needed
+            if st.session_state["session_language"] != "en":
+                report_display = translate_text(report_md, st.session_state["session_language"])
+            else:
+                report_display = report_md
+            return probs, report_md, report_display
+
+        key = consultation_key() + (st.session_state["name"], tuple(f.id for f in red_flags))
+        probs, report_md, report_display = memo("final_report", key, _urgent_report if red_flags else _final_report)
 
-        
-        # Translate Report if needed
-        if st.session_state["session_language"] != "en":
-            report_display = translate_text(report_md, st.session_state["session_language"])
-        else:
-            report_display = report_md
-            
         st.markdown(report_display)
         
         # Save to DB
@@ -490,17 +664,20 @@ with right_col:
         # But wait, reruns happen. Let's add a saved flag.
         if not st.session_state.get("saved_to_db", False):
             try:
-                database.save_session(
+                # Write-behind: queued and committed by the background writer
+                database.save_session_async(
                     st.session_state["name"],
                     st.session_state["age"],
                     st.session_state["gender"],
                     st.session_state["symptoms"],
                     probs,
                     report_md,
-                    st.session_state.get("last_voice_transcript", "")
+                    st.session_state.get("last_voice_transcript", ""),
+                    questions_asked=len(st.session_state["asked"]),
+                    trace=st.session_state["trace"].to_dict() if st.session_state.get("trace") else None,
                 )
                 st.session_state["saved_to_db"] = True
-                st.toast("Session saved to database.")
+                st.toast("Session queued for saving.")
             except Exception as e:
                 st.error(f"Failed to save to DB: {e}")
 
@@ -509,16 +686,30 @@ with right_col:
     else:
         # --- ACTIVE CONSULTATION ---
         
+        key = consultation_key()
+        take_speculation(key)
+
         # Scoring
-        candidates = hybrid_retrieve(", ".join(st.session_state["symptoms"]) + " " + st.session_state["initial_symptoms"], k=8)
-        probs = score_candidates(
-            candidates, 
-            st.session_state["symptoms"], 
-            st.session_state["age"], 
-            st.session_state["gender"],
-            negatives=list(st.session_state.get("negatives", []))
+        # Non-English input is embedded directly when multilingual retrieval is on;
+        # the English text is only used if BM25 finds nothing in the raw query
+        engine_kw = dict(
+            k=8,
+            lang=st.session_state["session_language"],
+            fallback_text=st.session_state.get("current_symptoms_text", ""),
         )
-        
+
+        def _score():
+            return score_step(
+                st.session_state["symptoms"],
+                st.session_state["initial_symptoms"],
+                st.session_state["age"],
+                st.session_state["gender"],
+                negatives=st.session_state.get("negatives", []),
+                **engine_kw,
+            )
+
+        candidates, probs = memo("scores", key, _score)
+
         if not probs:
              st.warning("No clear diagnosis found yet.")
         else:
@@ -538,17 +729,41 @@ with right_col:
                 st.rerun()
 
             # Next Question
-            next_q = choose_best_followup(candidates, st.session_state["symptoms"], st.session_state["asked"], min_questions=config.MIN_FOLLOWUP_QUESTIONS)
+            next_q = memo("next_q", key, lambda: choose_best_followup(
+                candidates, st.session_state["symptoms"], st.session_state["asked"],
+                min_questions=config.MIN_FOLLOWUP_QUESTIONS))
             
             if next_q:
                 # Translate Question
                 q_display = next_q
                 if st.session_state["session_language"] != "en":
-                    q_display = translate_text(f"Do you have {next_q}?", st.session_state["session_language"])
+                    q_display = traced(translate_text, f"Do you have {next_q}?", st.session_state["session_language"])
                 else:
                     q_display = f"Do you have {next_q}?"
                     
                 st.info(q_display)
+
+                # Precompute the next turn for "yes" and "no" while the patient answers
+                if (config.SPECULATIVE_FOLLOWUPS
+                        and "_speculation" not in st.session_state
+                        and st.session_state["rounds"] + 1 < config.MAX_FOLLOWUP_QUESTIONS):
+                    with tracing.activate(st.session_state.get("trace")):
+                        branches = speculate_followups(
+                            next_q,
+                            st.session_state["symptoms"],
+                            st.session_state["initial_symptoms"],
+                            st.session_state["asked"],
+                            st.session_state["age"],
+                            st.session_state["gender"],
+                            negatives=st.session_state.get("negatives", []),
+                            min_questions=config.MIN_FOLLOWUP_QUESTIONS,
+                            **engine_kw,
+                        )
+                    st.session_state["_speculation"] = {
+                        consultation_key(syms, negs, asked_b): fut
+                        for syms, negs, asked_b, fut in branches.values()
+                    }
+                    st.session_state["_speculation_base"] = key
                 
                 # Voice Input Option (Replaced with Custom Recorder)
                 if _HAS_VOICE_RECORDER:
@@ -607,13 +822,13 @@ with right_col:
                     
                     if user_ans:
                         # 1. Translate to English
-                        ans_en = translate_text(user_ans, "en").lower()
+                        ans_en = traced(translate_text, user_ans, "en").lower()
 
                     
                     # 2. Extract Yes/No for the specific question
                     # Simple heuristics
-                    is_yes = any(w in ans_en for w in ["yes", "yeah", "have", "sure", "correct", "yep", "positive"])
-                    is_no = any(w in ans_en for w in ["no", "nah", "don't", "not", "negative"])
+                    verdict = classify_answer(ans_en)
+                    is_yes, is_no = verdict == "yes", verdict == "no"
                     
                     # Conflict resolution (e.g. "No I don't have it"): "no" wins if present usually, unless "no doubt I have it"
                     # Let's prioritize explicit No, but if they say "I have x", it's a Yes for x.
@@ -622,6 +837,9 @@ with right_col:
                     # If they simply describe *other* symptoms, we might assume No for this one unless they say Yes?
                     # Let's assume implied No if they don't say Yes, OR just track "asked" and don't add it.
                     
+                    # Red flags in the answer itself, or a "yes" to a red-flag question
+                    red_flags = traced(detect_red_flags, user_ans, ans_en, next_q if is_yes and not is_no else "")
+
                     if is_yes and not is_no:
                         st.session_state["symptoms"].append(next_q)
                         st.toast(f"Note: Reported {next_q}")
@@ -633,18 +851,27 @@ with right_col:
                     # 3. Extract *other* symptoms from text
                     # (e.g. "No, but I have fever")
                     found_others = []
-                    for token in config.SYMPTOM_TOKENS:
-                         # Check strict token presence to avoid partial matches like 'pain' in 'paint' (though tokens are simple)
-                         # Simple check:
-                         if token in ans_en and token != next_q.lower() and token not in st.session_state["symptoms"]:
-                             st.session_state["symptoms"].append(token)
-                             found_others.append(token)
+                    also, denied = get_extractor().extract_with_negation(ans_en)
+                    current = {x.lower() for x in st.session_state["symptoms"]}
+                    for sym in also:
+                        if sym != next_q.lower() and sym not in current:
+                            st.session_state["symptoms"].append(sym)
+                            found_others.append(sym)
+                    for sym in denied:
+                        if sym != next_q.lower() and sym not in current:
+                            st.session_state["negatives"].add(sym)
                     
                     if found_others:
                         st.toast(f"Also noted: {', '.join(found_others)}")
+                    if st.session_state.get("trace") is not None:
+                        st.session_state["trace"].event("answer", question=next_q, verdict=verdict,
+                                                        also=list(also), denied=list(denied))
 
                     st.session_state["asked"].add(next_q.lower())
                     st.session_state["rounds"] += 1
+                    if red_flags:
+                        st.session_state["red_flags"] = red_flags
+                        st.session_state["finished"] = True
                     st.rerun()
                 elif submit_ans and not user_ans:
                     st.warning("Please enter an answer.")
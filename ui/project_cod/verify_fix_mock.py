@@ -28,6 +28,7 @@ def mock_hybrid_retrieve(symptoms, k=6):
 # Attach mocks
 mock_loader.ensure_disease_map = mock_ensure_disease_map
 mock_loader.hybrid_retrieve = mock_hybrid_retrieve
+mock_loader.get_loader = lambda: types.SimpleNamespace(add_listener=lambda fn: None)
 
 # Now we can safely import diagnosis_engine
 # Now we can safely import diagnosis_engine